@@ -54,6 +54,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Header Server-Timing cho API dữ liệu biểu đồ và ?profile=1 cho nhân viên (cần đứng sau AuthenticationMiddleware)
+    'sales.middleware.ServerTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'Sales_management_system.urls'
@@ -125,6 +127,47 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  # Ensure STATIC_ROOT is set to a filesystem path
 
+# Tệp CSV tải lên được lưu tại đây trong lúc chờ xử lý nền
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Số thread nạp dữ liệu nền (SQLite chỉ có một tiến trình ghi tại một thời điểm)
+SALES_INGEST_WORKERS = 1
+
+# Job nạp dữ liệu của tiến trình trên máy khác và tệp tải lên không còn job nào dùng được coi là
+# bị bỏ rơi (đánh dấu lỗi / xoá tệp) sau số giây này
+SALES_INGEST_ORPHAN_AFTER = 24 * 60 * 60
+
+# Số tiến trình parse CSV song song cho mỗi job (0 = parse tuần tự)
+SALES_INGEST_PARSE_WORKERS = 0
+
+# Đo thêm thời gian giải mã và parse của từng job nạp dữ liệu (ghi vào log sales.jobs)
+SALES_INGEST_STAGE_TIMING = False
+
+# Cache kết quả biểu đồ: dung lượng cache trong tiến trình và alias cache Django dùng chung (None = tắt)
+SALES_CHART_CACHE_MAX_BYTES = 64 * 1024 * 1024
+SALES_CHART_SHARED_CACHE = None
+
+# Backend tính dữ liệu biểu đồ: "orm" (truy vấn database) hoặc "numpy" (bảng cột trong bộ nhớ, sales/analytics.py)
+SALES_CHART_BACKEND = "orm"
+
+# Số thread chạy song song các truy vấn độc lập của một biểu đồ trong view async (/api/async/chart-data/)
+SALES_CHART_QUERY_WORKERS = 4
+
+# Thư mục snapshot dạng cột (.npy) được ghi sau mỗi lần nạp dữ liệu, các worker mở bằng mmap
+# (None = tắt; nên đặt, ví dụ BASE_DIR / 'snapshot', khi dùng backend "numpy")
+SALES_SNAPSHOT_DIR = None
+
+# Làm nóng cache biểu đồ sau mỗi job nạp dữ liệu: số thread tính song song và các bộ tham số
+# query string được tính sẵn cho mọi biểu đồ ({} = dashboard mặc định)
+SALES_WARMUP_AFTER_INGEST = True
+SALES_WARMUP_WORKERS = 2
+SALES_WARMUP_PARAM_SETS = [{}]
+
+# Các đường dẫn (tiền tố) được gắn header Server-Timing (sales/middleware.py)
+SALES_SERVER_TIMING_PATHS = ("/api/chart-data/", "/api/async/chart-data/")
+# Khoảng lấy mẫu call stack của ?profile=flame (giây)
+SALES_PROFILE_SAMPLE_INTERVAL = 0.002
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
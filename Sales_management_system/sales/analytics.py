@@ -0,0 +1,728 @@
+import copy
+import threading
+from datetime import date, datetime, timezone as dt_timezone
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import basket, snapshot, statistics
+from .cache import current_version
+from .filters import ChartFilter
+from .models import Segment, Customer, Category, Product, Order, OrderDetail
+
+# Số dòng đọc từ database cho mỗi khối khi nạp bảng chi tiết
+LOAD_CHUNK_SIZE = 100_000
+
+# Chỉ số 0 của nhóm hàng / phân khúc dành cho giá trị NULL
+NULL_INDEX = 0
+
+EPOCH = date(1970, 1, 1)
+
+
+class SalesFrame:
+    """
+    Bảng sự kiện bán hàng dạng cột trong bộ nhớ (numpy).
+
+    Các bảng danh mục được mã hoá thành chỉ số liên tục, sắp xếp theo mã
+    (giống thứ tự GROUP BY trong SQLite), nhóm hàng/phân khúc NULL có chỉ số 0.
+    Thời gian được quy đổi sẵn sang giờ địa phương (TIME_ZONE).
+    """
+
+    # Nhãn của các danh mục (list Python để trả thẳng ra JSON)
+    LABELS = ('segment_codes', 'segment_descriptions', 'category_codes', 'category_names',
+              'product_codes', 'product_names')
+    # Cột gốc: id phân khúc trong database (-1 cho NULL), danh mục theo thứ tự mã,
+    # khách hàng và đơn hàng theo thứ tự id, chi tiết đơn hàng
+    COLUMNS = ('segment_ids', 'product_category', 'customer_segment', 'order_customer', 'order_local_seconds',
+               'detail_order', 'detail_product', 'detail_quantity', 'detail_total')
+    # Cột suy ra từ cột gốc
+    DERIVED_COLUMNS = ('order_day', 'order_hour', 'order_year_month', 'order_month', 'order_dom', 'order_weekday',
+                       'detail_customer', 'detail_segment', 'detail_category', 'detail_month')
+    # Cột theo từng dòng chi tiết đơn hàng (bị cắt bớt khi lọc)
+    DETAIL_COLUMNS = ('detail_order', 'detail_product', 'detail_quantity', 'detail_total',
+                      'detail_customer', 'detail_segment', 'detail_category', 'detail_month')
+
+    def __init__(self, version, labels, columns):
+        # version = (generation, updated_at) của DatasetVersion tại thời điểm đọc dữ liệu
+        self.version = tuple(version)
+        self.generation = self.version[0]
+        for name in self.LABELS:
+            setattr(self, name, list(labels[name]))
+        for name in self.COLUMNS:
+            setattr(self, name, np.asarray(columns[name], dtype=np.int64))
+
+        # Cột suy ra có thể được truyền sẵn (ví dụ từ snapshot) để khỏi tính lại
+        if all(name in columns for name in self.DERIVED_COLUMNS):
+            for name in self.DERIVED_COLUMNS:
+                setattr(self, name, np.asarray(columns[name], dtype=np.int64))
+        else:
+            self._derive()
+
+        # Frame chưa lọc: mọi đơn hàng và khách hàng đều nằm trong phạm vi
+        self.filters = ChartFilter()
+        self.order_mask = None
+        self.customer_mask = None
+        self._unfiltered = self
+
+    def _derive(self):
+        # Các phần ngày giờ địa phương của đơn hàng
+        days = self.order_local_seconds // 86400
+        self.order_day = days
+        self.order_hour = (self.order_local_seconds % 86400) // 3600
+        months = days.astype("datetime64[D]").astype("datetime64[M]")
+        month_number = months.astype(np.int64)
+        self.order_year_month = month_number  # Số tháng kể từ 1970-01
+        self.order_month = month_number % 12 + 1
+        self.order_dom = (days - months.astype("datetime64[D]").astype(np.int64)) + 1
+        # 1 = Chủ Nhật ... 7 = Thứ Bảy như ExtractWeekDay (1970-01-01 là Thứ Năm)
+        self.order_weekday = (days + 4) % 7 + 1
+
+        # Khoá ngoại của chi tiết đơn hàng đi qua các bảng liên quan
+        self.detail_customer = self.order_customer[self.detail_order]
+        self.detail_segment = self.customer_segment[self.detail_customer]
+        self.detail_category = self.product_category[self.detail_product]
+        self.detail_month = self.order_month[self.detail_order]
+
+    def labels(self):
+        return {name: getattr(self, name) for name in self.LABELS}
+
+    def columns(self):
+        """Tất cả các cột (gốc và suy ra) theo tên."""
+        return {name: getattr(self, name) for name in self.COLUMNS + self.DERIVED_COLUMNS}
+
+    def filtered(self, filters):
+        """
+        Frame chỉ gồm các dòng chi tiết khớp bộ lọc (ChartFilter), cùng ngữ nghĩa với
+        các điều kiện ChartFilter.q() của backend ORM. Đơn hàng và khách hàng giữ nguyên
+        chỉ số; order_mask / customer_mask đánh dấu các đơn hàng, khách hàng trong phạm vi lọc.
+        """
+        base = self._unfiltered
+        if not filters:
+            return base
+
+        # Đơn hàng trong khoảng ngày và thuộc phân khúc được chọn
+        order_mask = np.ones(base.n_orders, dtype=bool)
+        if filters.date_from:
+            order_mask &= base.order_day >= (filters.date_from - EPOCH).days
+        if filters.date_to:
+            order_mask &= base.order_day <= (filters.date_to - EPOCH).days
+        customer_mask = np.ones(base.n_customers, dtype=bool)
+        if filters.segment is not None:
+            customer_mask &= np.isin(base.customer_segment, _label_indices(base.segment_codes, filters.segment))
+            order_mask &= customer_mask[base.order_customer]
+
+        detail_mask = order_mask[base.detail_order]
+        if filters.category is not None:
+            detail_mask &= np.isin(base.detail_category, _label_indices(base.category_codes, filters.category))
+        if filters.product is not None:
+            detail_mask &= np.isin(base.detail_product, _label_indices(base.product_codes, filters.product))
+
+        frame = copy.copy(base)
+        frame.filters = filters
+        for name in self.DETAIL_COLUMNS:
+            setattr(frame, name, getattr(base, name)[detail_mask])
+
+        # Lọc theo nhóm hàng / mặt hàng: chỉ giữ đơn hàng có dòng chi tiết khớp
+        if filters.category is not None or filters.product is not None:
+            order_mask &= _count_by(frame.detail_order, base.n_orders) > 0
+        # Lọc theo ngày / nhóm hàng / mặt hàng: chỉ giữ khách hàng có đơn hàng khớp
+        if filters.restricts_activity:
+            customer_mask &= _count_by(base.order_customer[order_mask], base.n_customers) > 0
+        frame.order_mask = order_mask
+        frame.customer_mask = customer_mask
+        return frame
+
+    def without(self, *dimensions):
+        """Frame với bộ lọc bỏ bớt các chiều đã cho (dùng cho mẫu số của các tỷ lệ)."""
+        return self.filtered(self.filters.without(*dimensions))
+
+    @property
+    def n_segments(self):
+        return len(self.segment_codes)
+
+    @property
+    def n_categories(self):
+        return len(self.category_codes)
+
+    @property
+    def n_products(self):
+        return len(self.product_codes)
+
+    @property
+    def n_customers(self):
+        return len(self.customer_segment)
+
+    @property
+    def n_orders(self):
+        return len(self.order_customer)
+
+    @classmethod
+    def from_snapshot(cls, version=None, directory=None):
+        """Mở snapshot dạng cột (mmap, chỉ đọc); None nếu không có snapshot của phiên bản dữ liệu này."""
+        data = snapshot.read(version, directory)
+        if data is None:
+            return None
+        version, labels, columns = data
+        return cls(version, labels, columns)
+
+    @classmethod
+    def from_database(cls):
+        """Đọc toàn bộ dữ liệu bán hàng từ database (trong một transaction để có ảnh chụp nhất quán)."""
+        with transaction.atomic():
+            version = current_version()
+
+            segments = list(Segment.objects.order_by('segment_code').values_list('id', 'segment_code', 'description'))
+            segment_index = {pk: i + 1 for i, (pk, _, _) in enumerate(segments)}
+            categories = list(Category.objects.order_by('category_code').values_list('id', 'category_code', 'category_name'))
+            category_index = {pk: i + 1 for i, (pk, _, _) in enumerate(categories)}
+            products = list(Product.objects.order_by('product_code').values_list('id', 'product_code', 'product_name', 'category_id'))
+
+            customers = list(Customer.objects.order_by('id').values_list('id', 'segment_id'))
+            customer_ids = np.array([pk for pk, _ in customers], dtype=np.int64)
+
+            order_ids, order_customer_ids, order_seconds = [], [], []
+            for pk, customer_id, created_at in Order.objects.order_by('id').values_list('id', 'customer_id', 'created_at').iterator(chunk_size=LOAD_CHUNK_SIZE):
+                order_ids.append(pk)
+                order_customer_ids.append(customer_id)
+                order_seconds.append(_epoch_seconds(created_at))
+            order_ids = np.array(order_ids, dtype=np.int64)
+
+            details = OrderDetail.objects.values_list('order_id', 'product_id', 'quantity', 'total').iterator(chunk_size=LOAD_CHUNK_SIZE)
+            chunks = []
+            while True:
+                chunk = list(islice(details, LOAD_CHUNK_SIZE))
+                if not chunk:
+                    break
+                chunks.append(np.array(chunk, dtype=np.int64))
+        detail_columns = np.concatenate(chunks) if chunks else np.empty((0, 4), dtype=np.int64)
+
+        # Đổi id trong database sang chỉ số liên tục
+        product_ids = np.array([row[0] for row in products], dtype=np.int64)
+        product_order = np.argsort(product_ids)
+        detail_product = product_order[np.searchsorted(product_ids, detail_columns[:, 1], sorter=product_order)]
+
+        return cls(
+            version,
+            labels={
+                'segment_codes': [None] + [code for _, code, _ in segments],
+                'segment_descriptions': [None] + [description for _, _, description in segments],
+                'category_codes': [None] + [code for _, code, _ in categories],
+                'category_names': [None] + [name for _, _, name in categories],
+                'product_codes': [row[1] for row in products],
+                'product_names': [row[2] for row in products],
+            },
+            columns={
+                'segment_ids': [-1] + [pk for pk, _, _ in segments],
+                'product_category': [category_index.get(row[3], NULL_INDEX) for row in products],
+                'customer_segment': [segment_index.get(segment_id, NULL_INDEX) for _, segment_id in customers],
+                'order_customer': np.searchsorted(customer_ids, np.array(order_customer_ids, dtype=np.int64)),
+                'order_local_seconds': _to_local_seconds(np.array(order_seconds, dtype=np.int64)),
+                'detail_order': np.searchsorted(order_ids, detail_columns[:, 0]),
+                'detail_product': detail_product,
+                'detail_quantity': detail_columns[:, 2],
+                'detail_total': detail_columns[:, 3],
+            },
+        )
+
+
+def _epoch_seconds(value):
+    if timezone.is_naive(value):
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return int(value.timestamp())
+
+
+def _to_local_seconds(epochs):
+    # Cộng độ lệch múi giờ; độ lệch chỉ được tính một lần cho mỗi giờ UTC khác nhau.
+    # Dùng múi giờ mặc định như Order.local_date (frame dùng chung cho mọi request, không theo
+    # múi giờ đang kích hoạt của request nạp frame)
+    if not settings.USE_TZ or len(epochs) == 0:
+        return epochs
+    tz = timezone.get_default_timezone()
+    hours, inverse = np.unique(epochs // 3600, return_inverse=True)
+    offsets = np.array(
+        [int(datetime.fromtimestamp(int(hour) * 3600, tz).utcoffset().total_seconds()) for hour in hours],
+        dtype=np.int64,
+    )
+    return epochs + offsets[inverse.reshape(-1)]
+
+
+# --- Frame dùng chung trong tiến trình, nạp lại khi thế hệ dữ liệu thay đổi ---
+
+_frame = None
+_frame_lock = threading.Lock()
+
+
+def _label_indices(labels, codes):
+    codes = set(codes)
+    return np.array([i for i, code in enumerate(labels) if code is not None and code in codes], dtype=np.int64)
+
+
+def _scoped(values, mask):
+    # Giá trị của các đơn hàng / khách hàng trong phạm vi lọc (mask None = tất cả)
+    return values if mask is None else values[mask]
+
+
+def get_frame(version=None):
+    """
+    Trả về SalesFrame của phiên bản dữ liệu hiện tại, version = (generation, updated_at).
+    Khi frame đã cũ, ưu tiên mở snapshot cùng phiên bản (gần như tức thì),
+    nếu không có thì nạp lại từ database.
+    """
+    global _frame
+    if version is None:
+        version = current_version()
+    version = tuple(version)
+    with _frame_lock:
+        if _frame is None or _frame.version != version:
+            _frame = SalesFrame.from_snapshot(version) or SalesFrame.from_database()
+        return _frame
+
+
+def save_snapshot(directory=None):
+    """Đọc dữ liệu hiện tại từ database và ghi snapshot dạng cột; trả về SalesFrame đã ghi."""
+    frame = SalesFrame.from_database()
+    snapshot.write(frame.version, frame.labels(), frame.columns(), directory)
+    return frame
+
+
+# --- Các phép group-by vector hoá ---
+
+def _sum_by(index, weights, n):
+    # Tổng số nguyên theo nhóm (bincount cộng bằng float64, chính xác tới 2**53)
+    return np.rint(np.bincount(index, weights=weights, minlength=n)).astype(np.int64)
+
+
+def _count_by(index, n):
+    return np.bincount(index, minlength=n)
+
+
+def _count_distinct(group, member, n):
+    """Số giá trị member khác nhau trong từng nhóm (như Count(..., distinct=True))."""
+    if len(member) == 0:
+        return np.zeros(n, dtype=np.int64)
+    base = int(member.max()) + 1
+    keys = np.unique(group * base + member)
+    return np.bincount(keys // base, minlength=n)
+
+
+def _desc(values, candidates):
+    # Sắp xếp giảm dần theo values, giữ thứ tự chỉ số (thứ tự mã) khi bằng nhau
+    return candidates[np.argsort(-values[candidates], kind='stable')]
+
+
+def _months_present(frame):
+    counts = _count_by(frame.detail_month, 13)
+    return np.flatnonzero(counts)
+
+
+def _monthly_revenue(frame):
+    return _sum_by(frame.detail_month, frame.detail_total, 13)
+
+
+# --- Các biểu đồ ---
+
+def q1(frame):
+    total = _sum_by(frame.detail_product, frame.detail_total, frame.n_products)
+    present = np.flatnonzero(_count_by(frame.detail_product, frame.n_products))
+    return [
+        {
+            'code': frame.product_codes[p],
+            'name': frame.product_names[p],
+            'groupCode': frame.category_codes[frame.product_category[p]],
+            'groupName': frame.category_names[frame.product_category[p]],
+            'total': int(total[p]),
+        }
+        for p in _desc(total, present)
+    ]
+
+
+def q2(frame):
+    total = _sum_by(frame.detail_category, frame.detail_total, frame.n_categories)
+    present = np.flatnonzero(_count_by(frame.detail_category, frame.n_categories))
+    return [
+        {'groupCode': frame.category_codes[c], 'groupName': frame.category_names[c], 'total': int(total[c])}
+        for c in _desc(total, present)
+    ]
+
+
+def q3(frame):
+    total = _monthly_revenue(frame)
+    return [{'month': int(m), 'total': int(total[m])} for m in _months_present(frame)]
+
+
+def q4(frame):
+    map_week = {1: "Chủ Nhật", 2: "Thứ Hai", 3: "Thứ Ba", 4: "Thứ Tư", 5: "Thứ Năm", 6: "Thứ Sáu", 7: "Thứ Bảy"}
+    ordered_days = ["Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy", "Chủ Nhật"]
+
+    # Tổng doanh số theo ngày, rồi trung bình các ngày theo thứ trong tuần
+    days, inverse = np.unique(frame.order_day[frame.detail_order], return_inverse=True)
+    daily_total = _sum_by(inverse.reshape(-1), frame.detail_total, len(days))
+    weekdays = (days + 4) % 7 + 1
+    weekday_total = _sum_by(weekdays, daily_total, 8)
+    weekday_count = _count_by(weekdays, 8)
+
+    result = [
+        {'day': map_week[wd], 'avgRevenue': round(int(weekday_total[wd]) / int(weekday_count[wd]), 0)}
+        for wd in np.flatnonzero(weekday_count)
+    ]
+    return sorted(result, key=lambda x: ordered_days.index(x['day']))
+
+
+def q5(frame):
+    detail_dom = frame.order_dom[frame.detail_order]
+    total = _sum_by(detail_dom, frame.detail_total, 32)
+    present = np.flatnonzero(_count_by(detail_dom, 32))
+    # Số tháng (năm-tháng) khác nhau có đơn hàng cho mỗi ngày trong tháng (trong khoảng ngày lọc);
+    # lọc theo phân khúc / nhóm hàng / mặt hàng: chỉ tính các tháng có chi tiết khớp
+    if frame.filters.restricts_dimensions:
+        order_dom, year_month = detail_dom, frame.order_year_month[frame.detail_order]
+    else:
+        period = frame.without('segment', 'category', 'product').order_mask
+        order_dom, year_month = _scoped(frame.order_dom, period), _scoped(frame.order_year_month, period)
+    month_count = _count_distinct(order_dom, year_month - year_month.min(), 32) \
+        if len(year_month) else np.zeros(32, dtype=np.int64)
+    return [
+        {
+            'day': int(d),
+            'avgRevenue': round(int(total[d]) / int(month_count[d]), 0) if month_count[d] > 0 else 0
+        }
+        for d in present
+    ]
+
+
+def q6(frame):
+    detail_hour = frame.order_hour[frame.detail_order]
+    total = _sum_by(detail_hour, frame.detail_total, 24)
+    present = np.flatnonzero(_count_by(detail_hour, 24))
+    # Số ngày có đơn hàng cho mỗi khung giờ, như q5
+    if frame.filters.restricts_dimensions:
+        order_hour, order_day = detail_hour, frame.order_day[frame.detail_order]
+    else:
+        period = frame.without('segment', 'category', 'product').order_mask
+        order_hour, order_day = _scoped(frame.order_hour, period), _scoped(frame.order_day, period)
+    day_count = _count_distinct(order_hour, order_day - order_day.min(), 24) \
+        if len(order_day) else np.zeros(24, dtype=np.int64)
+    return [
+        {
+            'hour': int(h),
+            'avgRevenue': round(int(total[h]) / int(day_count[h]), 0) if day_count[h] > 0 else 0
+        }
+        for h in present
+    ]
+
+
+def q7(frame):
+    # Mẫu số chỉ lọc theo ngày và phân khúc
+    scope = frame.without('category', 'product').order_mask
+    grand_total_orders = frame.n_orders if scope is None else int(scope.sum())
+    unique_orders = _count_distinct(frame.detail_category, frame.detail_order, frame.n_categories)
+    present = np.flatnonzero(_count_by(frame.detail_category, frame.n_categories))
+    return [
+        {
+            'groupCode': frame.category_codes[c],
+            'groupName': frame.category_names[c],
+            'probability': int(unique_orders[c]) / grand_total_orders if grand_total_orders > 0 else 0
+        }
+        for c in _desc(unique_orders, present)
+    ]
+
+
+def q8(frame):
+    total_orders = _count_by(_scoped(frame.order_month, frame.without('category', 'product').order_mask), 13)
+    n = 13 * frame.n_categories
+    group = frame.detail_month * frame.n_categories + frame.detail_category
+    unique_orders = _count_distinct(group, frame.detail_order, n)
+    present = np.flatnonzero(_count_by(group, n))
+    months, categories = present // frame.n_categories, present % frame.n_categories
+    order = np.lexsort((categories, -unique_orders[present], months))
+
+    result = []
+    for i in order:
+        month, c = int(months[i]), categories[i]
+        month_orders = int(total_orders[month]) or 1  # Tránh chia cho 0
+        result.append({
+            'month': month,
+            'groupCode': frame.category_codes[c],
+            'groupName': frame.category_names[c],
+            'probability': int(unique_orders[present[i]]) / month_orders
+        })
+    return result
+
+
+def q9(frame):
+    category_names = {code: name for code, name in zip(frame.category_codes[1:], frame.category_names[1:])}
+    # Mẫu số theo nhóm hàng không lọc theo mặt hàng
+    base = frame.without('product')
+    category_orders = _count_distinct(base.detail_category, base.detail_order, frame.n_categories)
+    product_orders = _count_distinct(frame.detail_product, frame.detail_order, frame.n_products)
+    present = np.flatnonzero(_count_by(frame.detail_product, frame.n_products))
+    present = present[np.lexsort((present, frame.product_category[present]))]
+
+    result_dict = {}
+    for p in present:
+        c = frame.product_category[p]
+        category_code = frame.category_codes[c]
+        category_name = category_names.get(category_code, "Unknown Category")
+        probability = int(product_orders[p]) / (int(category_orders[c]) or 1)
+        if category_code not in result_dict:
+            result_dict[category_code] = {"group_code": category_code, "group_name": category_name, "products": []}
+        result_dict[category_code]["products"].append({
+            "group_code": category_code,
+            "group_name": category_name,
+            "product_code": frame.product_codes[p],
+            "product_name": frame.product_names[p],
+            "probability": probability
+        })
+    return list(result_dict.values())
+
+
+def q10(frame):
+    base = frame.without('product')
+    group_orders = _count_distinct(base.detail_month * frame.n_categories + base.detail_category,
+                                   base.detail_order, 13 * frame.n_categories)
+    n = 13 * frame.n_products
+    group = frame.detail_month * frame.n_products + frame.detail_product
+    product_orders = _count_distinct(group, frame.detail_order, n)
+    present = np.flatnonzero(_count_by(group, n))
+    months, products = present // frame.n_products, present % frame.n_products
+    order = np.lexsort((months, products, frame.product_category[products]))
+
+    result = {}
+    for i in order:
+        month, p = int(months[i]), products[i]
+        c = frame.product_category[p]
+        category_code = frame.category_codes[c]
+        product_code = frame.product_codes[p]
+        probability = int(product_orders[present[i]]) / (int(group_orders[month * frame.n_categories + c]) or 1)
+
+        if category_code not in result:
+            result[category_code] = {'group_code': category_code, 'group_name': frame.category_names[c], 'products': {}}
+        products_dict = result[category_code]['products']
+        if product_code not in products_dict:
+            products_dict[product_code] = {'product_code': product_code, 'product_name': frame.product_names[p], 'monthly_data': []}
+        products_dict[product_code]['monthly_data'].append({'month': month, 'probability': probability})
+
+    final_result = []
+    for category_data in result.values():
+        category_data['products'] = list(category_data['products'].values())
+        final_result.append(category_data)
+
+    # Sắp xếp kết quả theo thứ tự BOT, SET, THO, TMX, TTC, các nhóm khác ở cuối
+    preferred_order = ['BOT', 'SET', 'THO', 'TMX', 'TTC']
+    final_result.sort(key=lambda item: preferred_order.index(item['group_code'])
+                      if item['group_code'] in preferred_order else len(preferred_order))
+    return final_result
+
+
+def q11(frame):
+    orders_per_customer = _count_by(_scoped(frame.order_customer, frame.order_mask), frame.n_customers)
+    total_orders, count_customers = np.unique(_scoped(orders_per_customer, frame.customer_mask), return_counts=True)
+    return [
+        {'total_orders': int(t), 'count_customers': int(c)}
+        for t, c in zip(total_orders, count_customers)
+    ]
+
+
+def q12(frame, params):
+    spent = _sum_by(frame.detail_customer, frame.detail_total, frame.n_customers)
+    buyers = np.flatnonzero(_count_by(frame.detail_customer, frame.n_customers))
+    return statistics.histogram(spent[buyers], **statistics.histogram_options(params))
+
+
+def q13(frame):
+    customer_count = _count_by(_scoped(frame.customer_segment, frame.customer_mask), frame.n_segments)
+    present = np.flatnonzero(customer_count)
+    return [
+        {
+            'segment_code': frame.segment_codes[s] or 'KXĐ',
+            'segment_name': frame.segment_descriptions[s] or 'Không xác định',
+            'customer_count': int(customer_count[s])
+        }
+        for s in _desc(customer_count, present)
+    ]
+
+
+def _segment_revenue_rows(frame, mask=None):
+    segments = frame.detail_segment if mask is None else frame.detail_segment[mask]
+    totals = frame.detail_total if mask is None else frame.detail_total[mask]
+    revenue = _sum_by(segments, totals, frame.n_segments)
+    present = np.flatnonzero(_count_by(segments, frame.n_segments))
+    return [(s, int(revenue[s])) for s in _desc(revenue, present)]
+
+
+def q14(frame):
+    return [
+        {
+            'segment_code': frame.segment_codes[s] or 'KXĐ',
+            'segment_name': frame.segment_descriptions[s] or 'Không xác định',
+            'total_revenue': revenue
+        }
+        for s, revenue in _segment_revenue_rows(frame)
+    ]
+
+
+def q15(frame):
+    months = _months_present(frame)
+    if not len(months):
+        return []
+    monthly = _monthly_revenue(frame)
+    peak_month = int(months[np.argmax(monthly[months])])
+    return [
+        {
+            'segment_code': frame.segment_codes[s] or 'KXĐ',
+            'segment_name': frame.segment_descriptions[s] or 'Không xác định',
+            'total_revenue': revenue,
+            'peak_month': peak_month
+        }
+        for s, revenue in _segment_revenue_rows(frame, frame.detail_month == peak_month)
+    ]
+
+
+def q16(frame):
+    revenue = _sum_by(frame.detail_segment, frame.detail_total, frame.n_segments)
+    has_details = _count_by(frame.detail_segment, frame.n_segments) > 0
+    order_count = _count_by(_scoped(frame.customer_segment[frame.order_customer], frame.order_mask), frame.n_segments)
+
+    rows = []
+    for s in np.flatnonzero(order_count):
+        total_revenue = int(revenue[s]) if has_details[s] else None
+        # Chia nguyên giống phép chia hai cột số nguyên trong SQL
+        aov = total_revenue // int(order_count[s]) if total_revenue is not None else None
+        rows.append((s, total_revenue, aov))
+    rows.sort(key=lambda row: (row[2] is None, -(row[2] or 0)))
+
+    return [
+        {
+            'segment_code': frame.segment_codes[s] or 'KXĐ',
+            'segment_name': frame.segment_descriptions[s] or 'Không xác định',
+            'aov': aov if aov is not None else 0,
+            'order_count': int(order_count[s]),
+            'total_revenue': total_revenue
+        }
+        for s, total_revenue, aov in rows
+    ]
+
+
+def q17(frame):
+    monthly = _monthly_revenue(frame)
+    result = []
+    previous_revenue = None
+    for month in _months_present(frame):
+        current_revenue = int(monthly[month])
+        growth_rate = 0
+        if previous_revenue and previous_revenue > 0:
+            growth_rate = ((current_revenue - previous_revenue) / previous_revenue) * 100
+        previous_revenue = current_revenue
+        result.append({'month': int(month), 'total_revenue': current_revenue, 'growth_rate': round(growth_rate, 1)})
+    return result
+
+
+def q18(frame):
+    n = frame.n_segments * frame.n_categories
+    group = frame.detail_segment * frame.n_categories + frame.detail_category
+    revenue = _sum_by(group, frame.detail_total, n)
+
+    # Bảng pivot doanh số (phân khúc x nhóm hàng)
+    pivot_data = {}
+    all_categories = set()
+    for g in np.flatnonzero(_count_by(group, n)):
+        s, c = divmod(int(g), frame.n_categories)
+        segment_code = frame.segment_codes[s] or 'KXĐ'
+        category_code = frame.category_codes[c] or 'KXĐ'
+        segment_data = pivot_data.setdefault(segment_code, {'total': 0})
+        segment_data[category_code] = int(revenue[g])
+        segment_data['total'] += int(revenue[g])
+        all_categories.add(category_code)
+
+    categories = sorted(all_categories)
+    segment_names = {code: description or code
+                     for code, description in zip(frame.segment_codes[1:], frame.segment_descriptions[1:])}
+    category_names = {code: name or code for code, name in zip(frame.category_codes[1:], frame.category_names[1:])}
+
+    matrix = []
+    for segment_code, segment_data in pivot_data.items():
+        segment_total = segment_data['total']
+        row = {
+            'segment_code': segment_code,
+            'segment_name': segment_names.get(segment_code, segment_code),
+            'total': segment_total,
+            'categories': {}
+        }
+        for category_code in categories:
+            category_revenue = segment_data.get(category_code, 0)
+            percentage = (category_revenue / segment_total) * 100 if segment_total > 0 else 0
+            row['categories'][category_code] = {'revenue': category_revenue, 'percentage': round(percentage, 2)}
+        matrix.append(row)
+    matrix.sort(key=lambda x: x['segment_code'])
+
+    return {
+        'segments': [row['segment_code'] for row in matrix],
+        'categories': categories,
+        'segment_names': segment_names,
+        'category_names': category_names,
+        'matrix': matrix
+    }
+
+
+def q19(frame, params):
+    spending = _sum_by(frame.detail_customer, frame.detail_total, frame.n_customers)
+    buyers = np.flatnonzero(_count_by(frame.detail_customer, frame.n_customers))
+    segments = frame.customer_segment[buyers]
+    spending = spending[buyers]
+
+    max_points = statistics.parse_max_points(params.get('max_points'))
+    sample = statistics.parse_sample_mode(params.get('sample'))
+    result = [
+        {'segment_code': frame.segment_codes[s] or 'KXĐ',
+         **statistics.box_plot(spending[segments == s], max_points, sample)}
+        for s in np.flatnonzero(_count_by(segments, frame.n_segments))
+    ]
+    result.sort(key=lambda x: x['segment_code'])
+    return result
+
+
+def q20(frame, params):
+    options = basket.parse_options(params)
+    # Giỏ hàng gồm mọi mặt hàng của đơn hàng trong khoảng ngày / phân khúc;
+    # bộ lọc nhóm hàng / mặt hàng chỉ chọn các cặp có ít nhất một phía khớp
+    base = frame.without('category', 'product')
+    orders, products = base.detail_order, base.detail_product
+    if options['month']:
+        in_month = base.detail_month == options['month']
+        orders, products = orders[in_month], products[in_month]
+
+    product_mask = None
+    if frame.filters.category is not None or frame.filters.product is not None:
+        product_mask = np.ones(frame.n_products, dtype=bool)
+        if frame.filters.category is not None:
+            product_mask &= np.isin(frame.product_category, _label_indices(frame.category_codes, frame.filters.category))
+        if frame.filters.product is not None:
+            product_mask &= np.isin(np.arange(frame.n_products), _label_indices(frame.product_codes, frame.filters.product))
+
+    if options['level'] == 'category':
+        codes, names = frame.category_codes, frame.category_names
+    else:
+        codes, names = frame.product_codes, frame.product_names
+    return basket.basket_chart(orders, products, frame.product_category, codes, names, product_mask, options)
+
+
+QUESTIONS = {
+    'Q1': q1, 'Q2': q2, 'Q3': q3, 'Q4': q4, 'Q5': q5, 'Q6': q6, 'Q7': q7, 'Q8': q8, 'Q9': q9, 'Q10': q10,
+    'Q11': q11, 'Q12': q12, 'Q13': q13, 'Q14': q14, 'Q15': q15, 'Q16': q16, 'Q17': q17, 'Q18': q18, 'Q19': q19,
+    'Q20': q20,
+}
+
+
+# Các biểu đồ nhận thêm tham số query string (tuỳ chọn riêng của biểu đồ)
+WITH_PARAMS = {'Q12', 'Q19', 'Q20'}
+
+
+def compute_chart(question, frame, params=None):
+    """Tính dữ liệu của một biểu đồ từ SalesFrame (đã lọc bằng frame.filtered nếu cần), cùng định dạng với charts.compute_chart"""
+    compute = QUESTIONS.get(question)
+    if compute is None:
+        return []
+    return compute(frame, params or {}) if question in WITH_PARAMS else compute(frame)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class SalesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sales'
+
+    def ready(self):
+        # Đăng ký các signal: đếm câu SQL trên mọi kết nối, tạo lại index bị bỏ lại khi khởi động.
+        # Xoá dữ liệu bán hàng được trigger SQLite xử lý (migration 0017)
+        from . import signals  # noqa: F401
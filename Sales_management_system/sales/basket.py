@@ -0,0 +1,115 @@
+import numpy as np
+from scipy import sparse
+
+from .statistics import parse_positive_int
+
+# Phân tích giỏ hàng theo cặp mặt hàng / cặp nhóm hàng
+LEVELS = ("product", "category")
+# Tiêu chí xếp hạng các cặp: confidence là max của hai chiều A -> B và B -> A
+SORT_KEYS = ("support", "confidence", "lift")
+DEFAULT_TOP = 20
+MAX_TOP = 500
+
+
+def parse_options(params):
+    """Tham số query string: ?level=category&top=10&sort=lift&min_count=5&month=12"""
+    month = parse_positive_int(params.get('month'))
+    return {
+        'level': params.get('level') if params.get('level') in LEVELS else LEVELS[0],
+        'top': min(parse_positive_int(params.get('top'), DEFAULT_TOP), MAX_TOP),
+        'sort': params.get('sort') if params.get('sort') in SORT_KEYS else SORT_KEYS[0],
+        'min_count': parse_positive_int(params.get('min_count'), 1),
+        'month': month if month and month <= 12 else None,
+    }
+
+
+def incidence_matrix(orders, items, n_items):
+    """
+    Ma trận thưa đơn hàng x mặt hàng (CSR, giá trị 0/1) từ các cặp (đơn hàng, mặt hàng)
+    theo từng dòng chi tiết. Chỉ số đơn hàng không cần liên tục: dòng rỗng không tốn bộ nhớ
+    ngoài indptr. Nhiều dòng cùng (đơn hàng, mặt hàng) chỉ tính một lần.
+    """
+    orders = np.asarray(orders, dtype=np.int64)
+    items = np.asarray(items, dtype=np.int64)
+    n_rows = int(orders.max()) + 1 if len(orders) else 0
+    matrix = sparse.csr_matrix((np.ones(len(orders), dtype=np.int64), (orders, items)), shape=(n_rows, n_items))
+    matrix.data[:] = 1
+    return matrix
+
+
+def pair_statistics(orders, items, n_items, item_mask=None, top=DEFAULT_TOP, sort="support", min_count=1):
+    """
+    Các cặp (a, b), a < b, cùng xuất hiện trong ít nhất min_count đơn hàng, tính bằng
+    ma trận đồng xuất hiện C = X^T X của ma trận đơn hàng x mặt hàng X:
+    C[a, b] là số đơn có cả a và b, C[a, a] là số đơn có a.
+
+    support = C[a, b] / N, confidence_ab = C[a, b] / C[a, a], lift = C[a, b] * N / (C[a, a] * C[b, b])
+    với N là số đơn hàng. item_mask (nếu có) chỉ giữ các cặp có ít nhất một phía được chọn.
+    Trả về (N, danh sách top cặp) theo sort giảm dần, bằng nhau thì theo số đơn rồi chỉ số a, b.
+    """
+    matrix = incidence_matrix(orders, items, n_items)
+    n_orders = int(np.count_nonzero(np.diff(matrix.indptr)))
+    item_orders = np.asarray(matrix.sum(axis=0)).ravel()
+
+    pairs = sparse.triu(matrix.T @ matrix, k=1).tocoo()
+    a, b, count = pairs.row.astype(np.int64), pairs.col.astype(np.int64), pairs.data.astype(np.int64)
+    keep = count >= min_count
+    if item_mask is not None:
+        keep &= item_mask[a] | item_mask[b]
+    a, b, count = a[keep], b[keep], count[keep]
+
+    # Mỗi cặp có ít nhất một đơn hàng nên các mẫu số đều dương
+    support = count / n_orders
+    confidence_ab = count / item_orders[a]
+    confidence_ba = count / item_orders[b]
+    lift = count * n_orders / (item_orders[a] * item_orders[b])
+    key = {
+        'support': support,
+        'confidence': np.maximum(confidence_ab, confidence_ba),
+        'lift': lift,
+    }[sort]
+    order = np.lexsort((b, a, -count, -key))[:top]
+
+    return n_orders, [
+        {
+            'a': int(a[i]),
+            'b': int(b[i]),
+            'order_count': int(count[i]),
+            'support': float(support[i]),
+            'confidence_ab': float(confidence_ab[i]),
+            'confidence_ba': float(confidence_ba[i]),
+            'lift': float(lift[i]),
+        }
+        for i in order
+    ]
+
+
+def basket_chart(orders, products, product_category, codes, names, product_mask=None, options=None):
+    """
+    Dữ liệu biểu đồ giỏ hàng. orders / products: chỉ số đơn hàng và mặt hàng của từng dòng
+    chi tiết; product_category: chỉ số nhóm hàng của từng mặt hàng; codes / names: nhãn
+    (mặt hàng hoặc nhóm hàng theo options['level']). product_mask: mặt hàng khớp bộ lọc
+    nhóm hàng / mặt hàng (None = không lọc).
+    """
+    level = options['level']
+    items, n_items, item_mask = products, len(product_category), product_mask
+    if level == 'category':
+        n_items = len(codes)
+        items = product_category[products]
+        if product_mask is not None:
+            item_mask = np.bincount(product_category[product_mask], minlength=n_items) > 0
+
+    n_orders, pairs = pair_statistics(orders, items, n_items, item_mask,
+                                      options['top'], options['sort'], options['min_count'])
+    return {
+        'level': level,
+        'total_orders': n_orders,
+        'pairs': [
+            {
+                'code_a': codes[pair['a']] or 'KXĐ', 'name_a': names[pair['a']] or 'Không xác định',
+                'code_b': codes[pair['b']] or 'KXĐ', 'name_b': names[pair['b']] or 'Không xác định',
+                **{key: value for key, value in pair.items() if key not in ('a', 'b')},
+            }
+            for pair in pairs
+        ],
+    }
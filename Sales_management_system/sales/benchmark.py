@@ -0,0 +1,324 @@
+import io
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from unittest import mock
+from urllib.parse import urlencode
+
+import django
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import cache as chart_cache
+from . import charts, jobs, warmup
+from .ingest import ingest_file
+from .metrics import QueryTimer, StageTimer, current_rss_mb, peak_rss_mb
+from .models import Customer, IngestJob, Order, OrderDetail, Product
+from .sqlite_tuning import bulk_load_mode
+
+# Các percentile độ trễ được báo cáo
+LATENCY_PERCENTILES = (50, 95)
+# Các giai đoạn nạp dữ liệu được báo cáo (phần còn lại tính vào "other")
+INGEST_STAGES = ("decode", "parse", "resolve", "insert")
+# Khoảng thời gian giữa hai lần đọc RSS (giây)
+RSS_SAMPLE_INTERVAL = 0.05
+# Thời gian chờ tối đa một job nạp qua đường upload (giây)
+UPLOAD_TIMEOUT = 6 * 60 * 60
+# Mức chậm đi (tỉ lệ so với kết quả gốc) được đánh dấu là hồi quy khi so sánh
+REGRESSION_THRESHOLD = 1.10
+
+
+def summarize(samples):
+    """{p50, p95, mean, min, max} của một dãy số đo (ms), làm tròn 3 chữ số."""
+    values = np.asarray(samples, dtype=np.float64)
+    stats = {f"p{p}": float(v) for p, v in zip(LATENCY_PERCENTILES, np.percentile(values, LATENCY_PERCENTILES))}
+    stats.update(mean=float(values.mean()), min=float(values.min()), max=float(values.max()))
+    return {name: round(value, 3) for name, value in stats.items()}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    """Thông tin môi trường chạy benchmark, ghi kèm kết quả để so sánh giữa các commit."""
+    info = {
+        "commit": _git_commit(),
+        "created_at": timezone.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "database": connection.vendor,
+    }
+    if connection.vendor == "sqlite":
+        import sqlite3
+        info["sqlite"] = sqlite3.sqlite_version
+    return info
+
+
+@contextmanager
+def benchmark_database(directory):
+    """
+    Tạo database trống riêng cho benchmark (đã migrate) và xoá khi xong. Với SQLite,
+    database là tệp trong directory thay vì trong RAM để giống môi trường thật.
+    """
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    saved_name = test_settings.get("NAME")
+    if connection.vendor == "sqlite":
+        test_settings["NAME"] = os.path.join(directory, "benchmark.sqlite3")
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings["NAME"] = saved_name
+
+
+def load_csv(path):
+    """Nạp tệp CSV như lệnh import_sales (chế độ nạp hàng loạt); trả về (BulkIngestor, số giây)."""
+    started = time.perf_counter()
+    with bulk_load_mode():
+        ingestor = ingest_file(path)
+    return ingestor, time.perf_counter() - started
+
+
+def dataset_size():
+    """Số bản ghi của các bảng chính."""
+    return {
+        "customers": Customer.objects.count(),
+        "products": Product.objects.count(),
+        "orders": Order.objects.count(),
+        "order_details": OrderDetail.objects.count(),
+    }
+
+
+@contextmanager
+def local_chart_cache():
+    """
+    Chỉ dùng cache biểu đồ trong tiến trình trong lúc đo: cache dùng chung có thể chứa
+    kết quả của database khác có cùng số thế hệ. Cache được xoá trước và sau khi đo.
+    """
+    saved_alias = chart_cache.SHARED_CACHE_ALIAS
+    chart_cache.SHARED_CACHE_ALIAS = None
+    chart_cache.local_cache.clear()
+    try:
+        yield
+    finally:
+        chart_cache.local_cache.clear()
+        chart_cache.SHARED_CACHE_ALIAS = saved_alias
+
+
+def question_order(question):
+    # Q2 đứng trước Q10
+    digits = question.lstrip("Q")
+    return int(digits) if digits.isdigit() else float("inf"), question
+
+
+def chart_latency(questions=None, repeat=20, params=None, warm=False):
+    """
+    Gọi API chart-data của từng biểu đồ repeat lần qua Django test Client và đo độ trễ (ms),
+    số câu SQL và kích thước dữ liệu trả về. Mặc định (warm=False) cache biểu đồ được xoá
+    trước mỗi lần gọi để đo thời gian tính; warm=True đo trường hợp lấy từ cache.
+    Lần gọi đầu tiên (nạp frame numpy, làm nóng cache SQLite) được ghi riêng (first_ms)
+    và không tính vào percentile.
+    """
+    questions = questions or sorted(charts.CHARTS, key=question_order)
+    query_string = urlencode(params or {})
+    client = Client()
+    results = {}
+    with local_chart_cache():
+        for question in questions:
+            url = reverse("chart_data", args=[question])
+            if query_string:
+                url = f"{url}?{query_string}"
+
+            samples, queries = [], 0
+            for i in range(repeat + 1):
+                if not warm:
+                    chart_cache.local_cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    elapsed = (time.perf_counter() - started) * 1000
+                if response.status_code != 200:
+                    raise RuntimeError(f"{url}: HTTP {response.status_code} {response.content[:200]!r}")
+                if i == 0:
+                    first_ms = elapsed
+                    continue
+                samples.append(elapsed)
+                queries = max(queries, len(captured))
+
+            results[question] = {
+                "latency_ms": summarize(samples),
+                "first_ms": round(first_ms, 3),
+                "queries": queries,
+                "payload_bytes": len(response.content),
+            }
+    return results
+
+
+def write_results(path, results):
+    """Ghi kết quả benchmark ra tệp JSON (thụt lề, thứ tự khoá cố định để dễ diff giữa các lần đo)."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def read_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(baseline, current, metric):
+    """
+    So sánh hai lượt đo cùng cấu trúc {tên: {...}}; metric(entry) trả về giá trị cần so
+    (càng nhỏ càng tốt). Trả về danh sách (tên, giá trị gốc, giá trị mới, tỉ lệ mới / gốc,
+    có phải hồi quy không); tên chỉ có ở một bên bị bỏ qua.
+    """
+    rows = []
+    for name, entry in current.items():
+        if name not in baseline:
+            continue
+        old, new = metric(baseline[name]), metric(entry)
+        ratio = new / old if old else None
+        rows.append((name, old, new, ratio, ratio is not None and ratio > REGRESSION_THRESHOLD))
+    return rows
+
+
+class MemoryMonitor:
+    """
+    Đo bộ nhớ trong một khoảng: đỉnh bộ nhớ Python cấp phát (tracemalloc, mọi thread)
+    và RSS lớn nhất, lấy mẫu định kỳ bằng một thread nền. tracemalloc làm chậm code Python
+    đáng kể nên có thể tắt (trace=False) khi chỉ cần số đo thời gian.
+    """
+
+    def __init__(self, trace=True, interval=RSS_SAMPLE_INTERVAL):
+        self.trace = trace
+        self.interval = interval
+        self.result = {}
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss_mb()
+            if rss is not None:
+                self._rss_peak = max(self._rss_peak, rss)
+
+    def __enter__(self):
+        self._rss_peak = current_rss_mb() or 0.0
+        self.result = {"rss_start_mb": round(self._rss_peak, 1)}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="sales-benchmark-rss", daemon=True)
+        self._thread.start()
+        if self.trace:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.trace:
+            self.result["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+            tracemalloc.stop()
+        self._stop.set()
+        self._thread.join()
+        self._rss_peak = max(self._rss_peak, current_rss_mb() or 0.0)
+        self.result["rss_peak_mb"] = round(self._rss_peak, 1)
+        # Đỉnh RSS từ đầu tiến trình (gồm cả tiến trình con parse song song)
+        peak = peak_rss_mb()
+        if peak is not None:
+            self.result["process_peak_rss_mb"] = round(peak[0], 1)
+            self.result["children_peak_rss_mb"] = round(peak[1], 1)
+
+
+def ingest_result(ingestor, seconds, stages, *query_timers):
+    """Kết quả một lượt nạp: số dòng, dòng/giây, số câu SQL (tổng các QueryTimer) và thời gian từng giai đoạn (giây)."""
+    measured = {name: stages.get(name, 0.0) for name in INGEST_STAGES}
+    measured["other"] = max(seconds - sum(measured.values()), 0.0)
+    return {
+        "total_rows": ingestor.total_rows,
+        "success_rows": ingestor.success_count,
+        "skipped_rows": ingestor.skipped_rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(ingestor.total_rows / seconds, 1) if seconds > 0 else None,
+        "sql_statements": sum(timer.count for timer in query_timers),
+        "sql_seconds": round(sum(timer.seconds for timer in query_timers), 3),
+        "stages": {name: round(value, 3) for name, value in measured.items()},
+    }
+
+
+def run_import(path, workers=0, trace=True):
+    """Nạp tệp bằng đường ngoại tuyến (như lệnh import_sales: ingest_file trong chế độ nạp hàng loạt)."""
+    timer, queries = StageTimer(), QueryTimer()
+    with MemoryMonitor(trace) as memory:
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries), bulk_load_mode():
+            ingestor = ingest_file(path, workers=workers, timer=timer)
+        seconds = time.perf_counter() - started
+    return dict(ingest_result(ingestor, seconds, timer.seconds, queries), memory=memory.result)
+
+
+def run_upload(path, media_root, trace=True, timeout=UPLOAD_TIMEOUT):
+    """
+    Nạp tệp qua trang Upload bằng Django test Client: POST tệp lên upload_csv rồi chờ job nền
+    (jobs.run_job) chạy xong, gồm cả các bước sau khi nạp. Tệp tải lên được lưu trong media_root.
+    Không tự làm nóng cache biểu đồ sau khi nạp để chỉ đo phần nạp dữ liệu.
+    """
+    # Câu SQL của request và của job nền đếm riêng (hai thread có thể chạy cùng lúc)
+    request_queries, job_queries = QueryTimer(), QueryTimer()
+    finished = threading.Event()
+    captured = {}
+    run_job, ingest_job_file = jobs.run_job, jobs._ingest_file
+
+    def run_and_signal(job_id):
+        # Chạy trong thread nền của jobs: đếm câu SQL của kết nối thuộc thread này
+        try:
+            with connection.execute_wrapper(job_queries):
+                run_job(job_id)
+        finally:
+            finished.set()
+
+    def ingest_and_capture(job):
+        captured["ingestor"] = ingest_job_file(job)
+        return captured["ingestor"]
+
+    with ExitStack() as stack:
+        stack.enter_context(override_settings(MEDIA_ROOT=media_root))
+        stack.enter_context(mock.patch.object(jobs, "run_job", run_and_signal))
+        stack.enter_context(mock.patch.object(jobs, "_ingest_file", ingest_and_capture))
+        stack.enter_context(mock.patch.object(jobs, "STAGE_TIMING", True))
+        stack.enter_context(mock.patch.object(warmup, "WARMUP_AFTER_INGEST", False))
+        # Job in chi tiết các dòng lỗi ra console
+        stack.enter_context(redirect_stdout(io.StringIO()))
+        memory = stack.enter_context(MemoryMonitor(trace))
+
+        client = Client()
+        started = time.perf_counter()
+        with connection.execute_wrapper(request_queries), open(path, "rb") as f:
+            response = client.post(reverse("upload_csv"), {"csv_file": f})
+        request_seconds = time.perf_counter() - started
+        if response.status_code != 302:
+            raise RuntimeError(f"upload_csv: HTTP {response.status_code}")
+        if not finished.wait(timeout):
+            raise RuntimeError(f"Job nạp chưa xong sau {timeout}s")
+        seconds = time.perf_counter() - started
+
+    job = IngestJob.objects.latest("pk")
+    if job.state != IngestJob.STATE_DONE or "ingestor" not in captured:
+        raise RuntimeError(f"Job nạp #{job.pk} lỗi: {job.message}")
+    ingestor = captured["ingestor"]
+    return dict(ingest_result(ingestor, seconds, ingestor.timer.seconds, request_queries, job_queries),
+                request_seconds=round(request_seconds, 3), memory=memory.result)
@@ -0,0 +1,112 @@
+import json
+import threading
+from collections import OrderedDict
+
+import orjson
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DatasetVersion
+
+# Dung lượng tối đa của cache trong tiến trình (byte JSON đã mã hoá)
+LOCAL_MAX_BYTES = getattr(settings, "SALES_CHART_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+# Alias cache Django dùng chung giữa các worker (None = không dùng)
+SHARED_CACHE_ALIAS = getattr(settings, "SALES_CHART_SHARED_CACHE", None)
+SHARED_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def current_version():
+    """Trả về (generation, updated_at) của dữ liệu bán hàng hiện tại."""
+    version = DatasetVersion.objects.filter(pk=1).values_list("generation", "updated_at").first()
+    return version or (0, None)
+
+
+def bump_generation():
+    """Tăng số thế hệ dữ liệu; gọi trong transaction ghi dữ liệu để cache cũ không còn được dùng."""
+    now = timezone.now()
+    updated = DatasetVersion.objects.filter(pk=1).update(generation=F("generation") + 1, updated_at=now)
+    if not updated:
+        DatasetVersion.objects.create(pk=1, generation=1, updated_at=now)
+
+
+class LRUCache:
+    """Cache LRU an toàn đa luồng, giới hạn theo tổng kích thước giá trị (bytes)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._data[key] = value
+            self.current_bytes += len(value)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+
+local_cache = LRUCache(LOCAL_MAX_BYTES)
+
+
+def _json_default(obj):
+    # Ngày giờ, Decimal, ... mã hoá giống DjangoJSONEncoder (JsonResponse)
+    return DjangoJSONEncoder().default(obj)
+
+
+def encode_json(result):
+    # orjson nhanh hơn nhiều lần json.dumps; ngày giờ vẫn đi qua DjangoJSONEncoder để giữ định dạng cũ
+    return orjson.dumps(result, default=_json_default,
+                        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def cache_key(question, params, generation):
+    return f"sales:chart:{generation}:{question}:{json.dumps(sorted(params.items()))}"
+
+
+def _shared_cache():
+    return caches[SHARED_CACHE_ALIAS] if SHARED_CACHE_ALIAS else None
+
+
+def lookup(key):
+    """Tìm JSON (bytes) đã lưu theo khoá, trong cache tiến trình rồi đến cache dùng chung."""
+    payload = local_cache.get(key)
+    if payload is not None:
+        return payload
+
+    shared = _shared_cache()
+    if shared is not None:
+        payload = shared.get(key)
+        if payload is not None:
+            local_cache.set(key, payload)
+    return payload
+
+
+def store(key, payload):
+    """Lưu JSON (bytes) vào cả hai tầng cache."""
+    local_cache.set(key, payload)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.set(key, payload, SHARED_CACHE_TIMEOUT)
+
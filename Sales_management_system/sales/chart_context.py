@@ -0,0 +1,197 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum, Count
+from django.db.models.functions import ExtractMonth
+
+from .filters import ChartFilter
+from .models import Customer, SalesRollup
+
+# Thread pool chạy song song các truy vấn độc lập của một biểu đồ (view async);
+# mỗi thread dùng kết nối database riêng, mở khi chạy truy vấn và đóng ngay sau đó.
+# Với SQLite lợi ích có giới hạn: mỗi kết nối chỉ đọc tuần tự và các truy vấn GROUP BY tốn CPU
+# trong cùng tiến trình, nên trên một lõi CPU (hoặc khi đang có transaction ghi giữ khoá) các
+# lượt đọc thực tế vẫn chạy lần lượt; chỉ có WAL và nhiều lõi CPU mới chạy chồng lên nhau được
+QUERY_WORKERS = getattr(settings, "SALES_CHART_QUERY_WORKERS", 4)
+_query_executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="sales-chart-query")
+
+
+def _evaluate(query):
+    # QuerySet được đọc hết thành list; hàm (ví dụ lambda: qs.count()) được gọi
+    return query() if callable(query) else list(query)
+
+
+def _evaluate_in_thread(query):
+    try:
+        return _evaluate(query)
+    finally:
+        # Thread của pool dùng chung cho mọi request và không nhận signal request_finished của
+        # Django (nơi close_old_connections được gọi): đóng kết nối của thread sau mỗi truy vấn,
+        # kể cả khi CONN_MAX_AGE cho phép giữ, để kết nối không bị bỏ mở giữa các request
+        connection.close()
+
+
+async def _gather(queries):
+    return await asyncio.gather(*(
+        sync_to_async(_evaluate_in_thread, thread_sensitive=False, executor=_query_executor)(query)
+        for query in queries
+    ))
+
+
+def _segment_order(key):
+    # Sắp xếp (mã, mô tả) phân khúc như GROUP BY trong SQLite: NULL đứng trước
+    return tuple((value is not None, value or '') for value in key)
+
+
+class ChartContext:
+    """
+    Kết quả trung gian dùng chung giữa các biểu đồ được tính trong cùng một lượt
+    (ví dụ một request batch). Mỗi kết quả trung gian chỉ được truy vấn một lần.
+    filters là bộ lọc (ChartFilter) áp dụng cho mọi biểu đồ trong lượt,
+    params là các tham số query string (tuỳ chọn riêng của từng biểu đồ),
+    concurrent cho phép fetch() chạy song song các truy vấn độc lập (view async).
+    """
+
+    # Các biểu đồ có thể dùng từng kết quả trung gian
+    CONSUMERS = {
+        'month_segment_revenue': {'Q3', 'Q14', 'Q15', 'Q17'},
+        'customer_stats': {'Q11', 'Q12', 'Q13', 'Q16', 'Q19'},
+    }
+
+    def __init__(self, questions=(), filters=None, params=None, concurrent=False):
+        self.questions = set(questions)
+        self.filters = filters or ChartFilter()
+        self.params = params or {}
+        self.concurrent = concurrent
+        self._memo = {}
+
+    def fetch(self, *queries):
+        """
+        Đọc các truy vấn độc lập (QuerySet hoặc hàm không tham số), trả về kết quả theo cùng thứ tự.
+        Khi concurrent, chúng chạy song song trên thread pool, mỗi truy vấn một kết nối riêng,
+        nên thời gian chờ gần bằng truy vấn chậm nhất; nếu không thì chạy lần lượt.
+        """
+        if not self.concurrent or len(queries) < 2:
+            return [_evaluate(query) for query in queries]
+        return async_to_sync(_gather)(queries)
+
+    def use_shared(self, name):
+        """Chỉ dùng kết quả trung gian khi có từ hai biểu đồ trở lên cần đến nó trong lượt này."""
+        return len(self.CONSUMERS[name] & self.questions) >= 2
+
+    def _memoized(self, name, compute):
+        if name not in self._memo:
+            self._memo[name] = compute()
+        return self._memo[name]
+
+    # --- Doanh số theo (tháng, phân khúc), đọc từ bảng tổng hợp ---
+
+    def month_segment_revenue(self):
+        return self._memoized('month_segment_revenue', lambda: list(
+            SalesRollup.objects.filter(self.filters.q('rollup')).annotate(
+                month=ExtractMonth('date')
+            ).values(
+                'month', 'segment__segment_code', 'segment__description'
+            ).annotate(
+                total_revenue=Sum('revenue')
+            ).order_by('month')
+        ))
+
+    def monthly_revenue(self):
+        """[{'month', 'total_revenue'}] sắp xếp theo tháng."""
+        totals = {}
+        for item in self.month_segment_revenue():
+            totals[item['month']] = totals.get(item['month'], 0) + item['total_revenue']
+        return [{'month': month, 'total_revenue': total} for month, total in sorted(totals.items())]
+
+    def segment_revenue(self, month=None):
+        """[{'segment__segment_code', 'segment__description', 'total_revenue'}] giảm dần theo doanh số."""
+        totals = {}
+        for item in self.month_segment_revenue():
+            if month is not None and item['month'] != month:
+                continue
+            key = (item['segment__segment_code'], item['segment__description'])
+            totals[key] = totals.get(key, 0) + item['total_revenue']
+        result = [
+            {'segment__segment_code': code, 'segment__description': description, 'total_revenue': total}
+            for (code, description), total in sorted(totals.items(), key=lambda x: _segment_order(x[0]))
+        ]
+        result.sort(key=lambda x: -x['total_revenue'])
+        return result
+
+    def peak_month(self):
+        """Tháng có doanh số cao nhất (None nếu chưa có dữ liệu)."""
+        monthly = self.monthly_revenue()
+        return max(monthly, key=lambda x: x['total_revenue'])['month'] if monthly else None
+
+    # --- Thống kê theo khách hàng: tổng chi tiêu và số đơn hàng ---
+
+    def customer_stats(self):
+        return self._memoized('customer_stats', lambda: list(
+            Customer.objects.filter(self.filters.q('customer')).values(
+                'id', 'segment__segment_code', 'segment__description'
+            ).annotate(
+                total_spent=Sum('order__orderdetail__total'),
+                order_count=Count('order', distinct=True)
+            ).order_by('segment_id', 'id')  # Cùng thứ tự với truy vấn gốc (duyệt theo chỉ mục segment_id)
+        ))
+
+    def customer_order_counts(self):
+        """Như Customer.annotate(total_orders=Count('order')).values('total_orders')."""
+        return [{'total_orders': item['order_count']} for item in self.customer_stats()]
+
+    def customer_spending(self):
+        """Như Customer.annotate(total_spent=...).values('total_spent')."""
+        return [{'total_spent': item['total_spent']} for item in self.customer_stats()]
+
+    def segment_customer_counts(self):
+        """Số khách hàng theo phân khúc, giảm dần."""
+        counts = {}
+        for item in self.customer_stats():
+            key = (item['segment__segment_code'], item['segment__description'])
+            counts[key] = counts.get(key, 0) + 1
+        result = [
+            {'segment__segment_code': code, 'segment__description': description, 'customer_count': count}
+            for (code, description), count in sorted(counts.items(), key=lambda x: _segment_order(x[0]))
+        ]
+        result.sort(key=lambda x: -x['customer_count'])
+        return result
+
+    def segment_order_value(self):
+        """Doanh số, số đơn hàng và AOV theo phân khúc (chỉ phân khúc có đơn hàng), giảm dần theo AOV."""
+        groups = {}
+        for item in self.customer_stats():
+            if not item['order_count']:
+                continue
+            key = (item['segment__segment_code'], item['segment__description'])
+            group = groups.setdefault(key, {'total_revenue': None, 'order_count': 0})
+            if item['total_spent'] is not None:
+                group['total_revenue'] = (group['total_revenue'] or 0) + item['total_spent']
+            group['order_count'] += item['order_count']
+
+        result = []
+        for (code, description), group in sorted(groups.items(), key=lambda x: _segment_order(x[0])):
+            revenue = group['total_revenue']
+            result.append({
+                'customer__segment__segment_code': code,
+                'customer__segment__description': description,
+                'total_revenue': revenue,
+                'order_count': group['order_count'],
+                # Chia nguyên giống phép chia hai cột số nguyên trong SQL
+                'aov': revenue // group['order_count'] if revenue is not None else None,
+            })
+        result.sort(key=lambda x: (x['aov'] is None, -(x['aov'] or 0)))
+        return result
+
+    def segment_customer_spending(self):
+        """Tổng chi tiêu của từng khách hàng đã mua hàng, kèm mã phân khúc."""
+        return [
+            {
+                'order__customer__segment__segment_code': item['segment__segment_code'],
+                'total_spending': item['total_spent'],
+            }
+            for item in self.customer_stats() if item['total_spent'] is not None
+        ]
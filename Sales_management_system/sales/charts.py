@@ -0,0 +1,853 @@
+from collections import namedtuple
+
+import numpy as np
+from django.db.models import Sum, Count, F
+from django.db.models.functions import ExtractDay, ExtractMonth
+
+from . import basket, statistics
+from .chart_context import ChartContext
+from .filters import FILTER_PARAMS
+from .models import Customer, Order, OrderDetail, Segment, Category, Product, SalesRollup, SalesCalendar
+
+# Mô tả một biểu đồ: tên (Q1, Q2, ...), hàm tính compute(ctx), có được cache hay không
+# và các tham số query string ảnh hưởng tới kết quả (dùng để tạo khoá cache).
+# Mặc định mọi biểu đồ nhận các tham số lọc (ctx.filters).
+ChartSpec = namedtuple("ChartSpec", ["name", "compute", "cacheable", "params"])
+
+# Bảng đăng ký các biểu đồ: tên -> ChartSpec
+CHARTS = {}
+
+
+def chart(name, cacheable=True, params=FILTER_PARAMS):
+    """Decorator đăng ký hàm tính dữ liệu của một biểu đồ"""
+    def register(compute):
+        CHARTS[name] = ChartSpec(name, compute, cacheable, tuple(params))
+        return compute
+    return register
+
+
+def get_chart(name):
+    """Trả về ChartSpec theo tên, None nếu không có biểu đồ này"""
+    return CHARTS.get(name)
+
+
+def compute_chart(question, ctx=None):
+    """
+    Tính dữ liệu của một biểu đồ (Q1, Q2, ...); ctx chứa bộ lọc và các kết quả
+    trung gian dùng chung trong một lượt
+    """
+    spec = CHARTS.get(question)
+    if spec is None:
+        return []
+    if ctx is None:
+        ctx = ChartContext([question])
+    return spec.compute(ctx)
+
+
+@chart("Q1")
+def q1(ctx):
+    # Dữ liệu Q1: Tổng doanh số theo Mã mặt hàng (đọc từ bảng tổng hợp)
+    data = SalesRollup.objects.filter(ctx.filters.q('rollup')).values(
+        'product__product_code', 'product__product_name',
+        'product__category__category_code', 'product__category__category_name'
+    ).annotate(total=Sum('revenue')).order_by('-total')
+
+    # Định dạng JSON
+    result = [
+        {
+            'code': item['product__product_code'],
+            'name': item['product__product_name'],
+            'groupCode': item['product__category__category_code'],
+            'groupName': item['product__category__category_name'],
+            'total': item['total']
+        }
+        for item in data
+    ]
+    return result
+
+
+@chart("Q2")
+def q2(ctx):
+    # Dữ liệu Q2: Doanh số theo Nhóm hàng (đọc từ bảng tổng hợp)
+    data = SalesRollup.objects.filter(ctx.filters.q('rollup')).values(
+        'category__category_code', 'category__category_name'
+    ).annotate(total=Sum('revenue')).order_by('-total')
+
+    result = [
+        {
+            'groupCode': item['category__category_code'],
+            'groupName': item['category__category_name'],
+            'total': item['total']
+        }
+        for item in data
+    ] 
+    return result
+
+
+@chart("Q3")
+def q3(ctx):
+    # Dữ liệu Q3: Doanh số theo tháng (đọc từ bảng tổng hợp)
+    if ctx.use_shared('month_segment_revenue'):
+        data = [{'month': item['month'], 'total': item['total_revenue']} for item in ctx.monthly_revenue()]
+    else:
+        data = (SalesRollup.objects.filter(ctx.filters.q('rollup'))
+                            .annotate(month=ExtractMonth('date'))
+                            .values('month')
+                            .annotate(total=Sum('revenue'))
+                            .order_by('month')
+        )
+    result = [{'month': item['month'], 'total': item['total']} for item in data] 
+    return result
+
+
+@chart("Q4")
+def q4(ctx):
+    # Mapping cho ngày trong tuần
+    map_week = {
+        1: "Chủ Nhật",
+        2: "Thứ Hai", 
+        3: "Thứ Ba",
+        4: "Thứ Tư",
+        5: "Thứ Năm",
+        6: "Thứ Sáu",
+        7: "Thứ Bảy"
+    }
+    
+    # Lấy doanh số theo từng ngày và tính trung bình theo ngày trong tuần
+    
+    # Trước tiên, tính tổng doanh số theo ngày (ngày và thứ địa phương đã lưu sẵn trên Order)
+    daily_sales = OrderDetail.objects.filter(ctx.filters.q('detail')).values(
+        date=F('order__local_date')
+    ).annotate(
+        total=Sum('total'),
+        weekday=F('order__weekday')
+    )
+    
+    # Tổng hợp theo ngày trong tuần và tính trung bình
+    weekday_avg = {} # Doanh số trung bình cho mỗi ngày trong tuần
+    weekday_total = {} # Tổng doanh số cho mỗi ngày trong tuần
+    weekday_count = {} # Số ngày có doanh số cho mỗi ngày trong tuần
+    
+    for day in daily_sales:
+        wd = day['weekday']
+        if wd not in weekday_total:
+            weekday_total[wd] = 0
+            weekday_count[wd] = 0
+        
+        weekday_total[wd] += day['total']
+        weekday_count[wd] += 1
+    
+    for wd in weekday_total:
+        weekday_avg[wd] = weekday_total[wd] / weekday_count[wd]
+    
+    # Chuyển thành kết quả JSON
+    result = [
+        {
+            'day': map_week[wd],
+            'avgRevenue': round(weekday_avg[wd], 0)
+        }
+        for wd in weekday_avg if wd in map_week
+    ]
+    
+    # Sắp xếp theo thứ tự
+    ordered_days = ["Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy", "Chủ Nhật"]
+    result = sorted(result, key=lambda x: ordered_days.index(x['day']))
+    return result
+
+
+@chart("Q5")
+def q5(ctx):
+    # Tính tổng doanh thu theo ngày trong tháng
+    sales_data = OrderDetail.objects.filter(ctx.filters.q('detail')).annotate(
+        day=F('order__day')
+    ).values('day').annotate(
+        totalRevenue=Sum('total')
+    )
+
+    # Đếm số lượng THÁNG mà mỗi ngày có giao dịch: mỗi ngày cụ thể ứng với đúng một (năm, tháng)
+    # nên chỉ cần đếm số ngày khác nhau. Lịch bán hàng chỉ lọc được theo ngày; khi lọc theo
+    # phân khúc / nhóm hàng / mặt hàng, chỉ đếm các ngày có giao dịch khớp (từ bảng tổng hợp)
+    if ctx.filters.restricts_dimensions:
+        months_per_day = SalesRollup.objects.filter(ctx.filters.q('rollup')).values(day=ExtractDay('date'))
+    else:
+        months_per_day = SalesCalendar.objects.filter(ctx.filters.q('calendar')).values('day')
+    months_per_day = months_per_day.annotate(monthCount=Count('date', distinct=True))
+
+    # Hai truy vấn độc lập (song song trong view async)
+    sales_data, months_per_day = ctx.fetch(sales_data, months_per_day)
+
+    # Chuyển thành dictionary để dễ tra cứu
+    months_per_day_map = {item['day']: item['monthCount'] for item in months_per_day}
+
+    # Tính doanh thu trung bình
+    result = [
+        {
+            'day': item['day'],
+            'avgRevenue': round(item['totalRevenue'] / months_per_day_map[item['day']], 0)
+            if months_per_day_map.get(item['day'], 0) > 0 else 0
+        }
+        for item in sales_data
+    ]
+
+    # Sắp xếp theo ngày trong tháng (1 - 31)
+    result = sorted(result, key=lambda x: x['day'])
+    return result
+
+
+@chart("Q6")
+def q6(ctx):
+    # Tính tổng doanh thu theo khung giờ
+    data = OrderDetail.objects.filter(ctx.filters.q('detail')).annotate(
+        hour=F('order__hour')
+    ).values('hour').annotate(
+        total=Sum('total')
+    ).order_by('hour')
+    
+    # Đếm số ngày có giao dịch cho TỪNG khung giờ (mỗi dòng lịch bán hàng là một cặp ngày, giờ);
+    # khi lọc theo phân khúc / nhóm hàng / mặt hàng, chỉ đếm các ngày có giao dịch khớp
+    if ctx.filters.restricts_dimensions:
+        unique_days_per_hour_data = SalesRollup.objects.filter(ctx.filters.q('rollup')).values('hour').annotate(
+            day_count=Count('date', distinct=True)
+        )
+    else:
+        unique_days_per_hour_data = SalesCalendar.objects.filter(ctx.filters.q('calendar')).values('hour').annotate(
+            day_count=Count('id')
+        )
+
+    # Hai truy vấn độc lập (song song trong view async)
+    data, unique_days_per_hour_data = ctx.fetch(data, unique_days_per_hour_data)
+    
+    # Chuyển thành dictionary để dễ tra cứu
+    unique_days_map = {item['hour']: item['day_count'] for item in unique_days_per_hour_data}
+    
+    # Tính doanh số trung bình theo giờ
+    result = [
+        {
+            'hour': item['hour'],
+            'avgRevenue': round(item['total'] / unique_days_map[item['hour']], 0) 
+            if unique_days_map.get(item['hour'], 0) > 0 else 0
+        }
+        for item in data
+    ]
+    return result
+
+
+@chart("Q7")
+def q7(ctx):
+    # Lấy tổng số đơn hàng duy nhất (mẫu số chỉ lọc theo ngày và phân khúc)
+    scoped_orders = Order.objects.filter(ctx.filters.without('category', 'product').q('order'))
+
+    # Lấy dữ liệu số lượng đơn hàng theo nhóm hàng
+    data = OrderDetail.objects.filter(ctx.filters.q('detail')).values(
+        'product__category__category_code', 'product__category__category_name'
+    ).annotate(unique_orders=Count('order', distinct=True)) \
+     .order_by('-unique_orders')
+
+    # Hai truy vấn độc lập (song song trong view async)
+    grand_total_orders, data = ctx.fetch(scoped_orders.count, data)
+
+    # Tính xác suất bán hàng cho mỗi nhóm hàng
+    result = [
+        {
+            'groupCode': item['product__category__category_code'],
+            'groupName': item['product__category__category_name'],
+            'probability': item['unique_orders'] / grand_total_orders if grand_total_orders > 0 else 0
+        }
+        for item in data
+    ]
+    return result
+
+
+@chart("Q8")
+def q8(ctx):
+    # Lấy tổng số đơn hàng duy nhất theo từng tháng (mẫu số chỉ lọc theo ngày và phân khúc)
+    total_orders_per_month = Order.objects.filter(ctx.filters.without('category', 'product').q('order')).values('month').annotate(unique_orders=Count('id'))
+
+    # Lấy số lượng đơn hàng theo nhóm hàng và tháng
+    data = OrderDetail.objects.filter(ctx.filters.q('detail')).annotate(month=F('order__month')) \
+        .values('month', 'product__category__category_code', 'product__category__category_name') \
+        .annotate(unique_orders=Count('order', distinct=True)) \
+        .order_by('month', '-unique_orders')
+
+    # Hai truy vấn độc lập (song song trong view async)
+    total_orders_per_month, data = ctx.fetch(total_orders_per_month, data)
+
+    # Chuyển thành dictionary {month: total_orders}
+    total_orders_dict = {item['month']: item['unique_orders'] for item in total_orders_per_month}
+
+    # Tính xác suất bán hàng cho mỗi nhóm hàng theo tháng
+    result = []
+    for item in data:
+        month = item['month']
+        total_orders = total_orders_dict.get(month, 1)  # Tránh chia cho 0
+        probability = item['unique_orders'] / total_orders if total_orders > 0 else 0
+
+        result.append({
+            'month': month,
+            'groupCode': item['product__category__category_code'],
+            'groupName': item['product__category__category_name'],
+            'probability': probability
+        })
+    return result
+
+
+@chart("Q9")
+def q9(ctx):
+    # Tạo dictionary để lưu trữ kết quả
+    result_dict = {}
+    
+    # Bước 1: Đếm tổng số đơn hàng duy nhất cho mỗi danh mục
+    category_orders = {}
+    category_names = {}  # Thêm dictionary để lưu tên nhóm hàng
+    
+    # Lấy tên danh mục
+    categories = Category.objects.all()
+    
+    # Mẫu số theo nhóm hàng không lọc theo mặt hàng
+    category_orders_data = OrderDetail.objects.filter(ctx.filters.without('product').q('detail')).values(
+        'product__category__category_code'
+    ).annotate(
+        total_orders=Count('order__order_code', distinct=True)
+    )
+    
+    # Bước 2: Lấy dữ liệu chi tiết sản phẩm và số lượng đơn hàng cho từng sản phẩm
+    product_data = OrderDetail.objects.filter(ctx.filters.q('detail')).values(
+        'product__category__category_code',
+        'product__product_code',
+        'product__product_name'
+    ).annotate(
+        order_count=Count('order__order_code', distinct=True)
+    ).order_by('product__category__category_code')
+    
+    # Ba truy vấn độc lập (song song trong view async)
+    categories, category_orders_data, product_data = ctx.fetch(categories, category_orders_data, product_data)
+    
+    for category in categories:
+        category_names[category.category_code] = category.category_name
+    
+    for item in category_orders_data:
+        category_code = item['product__category__category_code']
+        category_orders[category_code] = item['total_orders']
+    
+    # Bước 3: Tính xác suất và xây dựng kết quả
+    seen_products = set()
+    for item in product_data:
+        category_code = item['product__category__category_code']
+        product_code = item['product__product_code']
+        product_name = item['product__product_name']
+        product_order_count = item['order_count']
+        
+        # Lấy tên nhóm hàng
+        category_name = category_names.get(category_code, "Unknown Category")
+        
+        # Số đơn hàng trong danh mục
+        total_category_orders = category_orders.get(category_code, 1)  # Mặc định 1 để tránh chia cho 0
+        
+        # Tính xác suất
+        probability = product_order_count / total_category_orders
+        
+        # Thêm vào dictionary kết quả
+        if category_code not in result_dict:
+            result_dict[category_code] = {
+                "group_code": category_code,
+                "group_name": category_name,  # Thêm tên nhóm hàng
+                "products": []
+            }
+        
+        # Kiểm tra xem sản phẩm đã tồn tại chưa để tránh trùng lặp (tra tập hợp thay vì duyệt danh sách)
+        if (category_code, product_code) not in seen_products:
+            seen_products.add((category_code, product_code))
+            result_dict[category_code]["products"].append({
+                "group_code": category_code,
+                "group_name": category_name,  # Thêm tên nhóm hàng
+                "product_code": product_code,
+                "product_name": product_name,
+                "probability": probability
+            })
+    
+    # Chuyển dictionary thành list cho kết quả cuối cùng
+    result = list(result_dict.values())
+    return result
+
+
+@chart("Q10")
+def q10(ctx):
+    # Tối ưu query bằng select_related để giảm số lượng truy vấn database
+    # Lấy tổng số lượng đơn hàng duy nhất theo tháng và nhóm hàng bằng một query duy nhất
+    # (mẫu số theo nhóm hàng không lọc theo mặt hàng)
+    monthly_group_orders = OrderDetail.objects.select_related(
+        'order', 'product', 'product__category'
+    ).filter(ctx.filters.without('product').q('detail')).annotate(
+        month=F('order__month'),
+        category_code=F('product__category__category_code')
+    ).values('month', 'category_code').annotate(
+        order_count=Count('order', distinct=True)
+    ).order_by('month', 'category_code')
+    
+    # Lấy số lượng đơn hàng theo sản phẩm trong mỗi tháng trong cùng một query
+    product_orders = OrderDetail.objects.select_related(
+        'order', 'product', 'product__category'
+    ).filter(ctx.filters.q('detail')).annotate(
+        month=F('order__month')
+    ).values(
+        'month',
+        'product__product_code',
+        'product__product_name',
+        'product__category__category_code',
+        'product__category__category_name'
+    ).annotate(
+        order_count=Count('order', distinct=True)
+    ).order_by('product__category__category_code', 'product__product_code', 'month')
+    
+    # Hai truy vấn độc lập (song song trong view async)
+    monthly_group_orders, product_orders = ctx.fetch(monthly_group_orders, product_orders)
+    
+    # Chuyển đổi dữ liệu tổng số đơn hàng thành dictionary
+    monthly_group_order_dict = {}
+    for item in monthly_group_orders:
+        month = item['month']
+        category_code = item['category_code']
+        if month not in monthly_group_order_dict:
+            monthly_group_order_dict[month] = {}
+        monthly_group_order_dict[month][category_code] = item['order_count']
+    
+    # Tối ưu bằng cách tạo dictionary trước để tránh tìm kiếm lặp đi lặp lại
+    result = {}
+    
+    # Xử lý dữ liệu sản phẩm - tối ưu hóa việc tạo cấu trúc dữ liệu
+    for item in product_orders:
+        month = item['month']
+        category_code = item['product__category__category_code']
+        category_name = item['product__category__category_name']
+        product_code = item['product__product_code']
+        product_name = item['product__product_name']
+        product_orders = item['order_count']
+        
+        # Tính xác suất
+        total_group_month_orders = monthly_group_order_dict.get(month, {}).get(category_code, 1)
+        probability = product_orders / total_group_month_orders
+        
+        # Tạo cấu trúc nhóm hàng nếu chưa tồn tại
+        if category_code not in result:
+            result[category_code] = {
+                'group_code': category_code,
+                'group_name': category_name,
+                'products': {}
+            }
+        
+        # Tạo cấu trúc sản phẩm nếu chưa tồn tại
+        if product_code not in result[category_code]['products']:
+            result[category_code]['products'][product_code] = {
+                'product_code': product_code,
+                'product_name': product_name,
+                'monthly_data': []
+            }
+        
+        # Thêm dữ liệu tháng
+        result[category_code]['products'][product_code]['monthly_data'].append({
+            'month': month,
+            'probability': probability
+        })
+    
+    # Chuyển đổi từ dictionary sang list
+    final_result = []
+    for category_code, category_data in result.items():
+        category_data['products'] = list(category_data['products'].values())
+        final_result.append(category_data)
+    
+    # Sắp xếp kết quả theo thứ tự chính xác BOT, SET, THO, TMX, TTC
+    preferred_order = ['BOT', 'SET', 'THO', 'TMX', 'TTC']
+    
+    def sort_key(item):
+        if item['group_code'] in preferred_order:
+            return preferred_order.index(item['group_code'])
+        else:
+            return len(preferred_order)  # Các nhóm khác sẽ ở cuối
+    
+    final_result.sort(key=sort_key)
+    
+    result = final_result
+    return result
+
+
+@chart("Q11")
+def q11(ctx):
+    # Tạo truy vấn đếm số lượng đơn hàng của mỗi khách hàng
+    if ctx.use_shared('customer_stats'):
+        customers_with_order_count = ctx.customer_order_counts()
+    else:
+        # Khi lọc theo ngày/nhóm hàng/mặt hàng chỉ đếm đơn hàng khớp và khách hàng có đơn hàng khớp
+        customers_with_order_count = Customer.objects.filter(ctx.filters.q('customer')).annotate(
+            total_orders=Count('order', distinct=True)
+        ).values('total_orders')
+    
+    # Tạo dictionary để đếm số khách hàng cho mỗi tần suất mua hàng
+    frequency_distribution = {}
+    for customer in customers_with_order_count:
+        order_count = customer['total_orders']
+        if order_count in frequency_distribution:
+            frequency_distribution[order_count] += 1
+        else:
+            frequency_distribution[order_count] = 1
+    
+    # Chuyển dictionary thành list kết quả
+    result = [
+        {'total_orders': order_count, 'count_customers': count}
+        for order_count, count in frequency_distribution.items()
+    ]
+    
+    # Sắp xếp kết quả theo số lần mua tăng dần
+    result = sorted(result, key=lambda x: x['total_orders'])
+    return result
+
+
+@chart("Q12", params=FILTER_PARAMS + ("bin_width", "bins", "log"))
+def q12(ctx):
+    # Tính tổng chi tiêu của mỗi khách hàng
+    if ctx.use_shared('customer_stats'):
+        customer_spending = ctx.customer_spending()
+    else:
+        customer_spending = Customer.objects.filter(ctx.filters.q('customer')) \
+                                            .annotate(total_spent=Sum('order__orderdetail__total')) \
+                                            .values('total_spent')
+
+    # Chuyển đổi thành danh sách số tiền đã chi tiêu
+    spending_values = [item['total_spent'] for item in customer_spending if item['total_spent'] is not None]
+
+    # Chia bin ở server: kết quả chỉ gồm [{x0, x1, count}] cho từng bin
+    return statistics.histogram(spending_values, **statistics.histogram_options(ctx.params))
+
+
+@chart("Q13")
+def q13(ctx):
+    # Q13: Số lượng khách hàng theo phân khúc
+    if ctx.use_shared('customer_stats'):
+        segment_customers = ctx.segment_customer_counts()
+    else:
+        segment_customers = Customer.objects.filter(ctx.filters.q('customer')).values(
+            'segment__segment_code', 'segment__description'
+        ).annotate(
+            customer_count=Count('id', distinct=True)
+        ).order_by('-customer_count')
+    
+    # Chuyển đổi thành định dạng JSON cho biểu đồ
+    result = [
+        {
+            'segment_code': item['segment__segment_code'] or 'KXĐ',  # Xử lý trường hợp segment là NULL
+            'segment_name': item['segment__description'] or 'Không xác định',
+            'customer_count': item['customer_count']
+        }
+        for item in segment_customers
+    ]
+    return result
+
+
+@chart("Q14")
+def q14(ctx):
+    # Q14: Doanh số theo phân khúc khách hàng (đọc từ bảng tổng hợp)
+    if ctx.use_shared('month_segment_revenue'):
+        segment_revenue = ctx.segment_revenue()
+    else:
+        segment_revenue = SalesRollup.objects.filter(ctx.filters.q('rollup')).values(
+            'segment__segment_code',
+            'segment__description'
+        ).annotate(
+            total_revenue=Sum('revenue')
+        ).order_by('-total_revenue')
+    
+    # Chuyển đổi thành định dạng JSON cho biểu đồ
+    result = [
+        {
+            'segment_code': item['segment__segment_code'] or 'KXĐ',
+            'segment_name': item['segment__description'] or 'Không xác định',
+            'total_revenue': item['total_revenue'] or 0
+        }
+        for item in segment_revenue
+    ]
+    return result
+
+
+@chart("Q15")
+def q15(ctx):
+    # Doanh số theo (tháng, phân khúc) được đọc một lần từ bảng tổng hợp
+    # Bước 1: Xác định tháng cao điểm (tháng có doanh số cao nhất)
+    peak_month = ctx.peak_month()
+    
+    # Bước 2: Lấy doanh số theo phân khúc khách hàng trong tháng cao điểm
+    segment_revenue_peak_month = ctx.segment_revenue(month=peak_month) if peak_month is not None else []
+    
+    # Chuyển đổi thành định dạng JSON cho biểu đồ
+    result = [
+        {
+            'segment_code': item['segment__segment_code'] or 'KXĐ',
+            'segment_name': item['segment__description'] or 'Không xác định',
+            'total_revenue': item['total_revenue'] or 0,
+            'peak_month': peak_month
+        }
+        for item in segment_revenue_peak_month
+    ]
+    return result
+
+
+@chart("Q16")
+def q16(ctx):
+    # Tính giá trị trung bình đơn hàng (AOV) theo phân khúc khách hàng
+    if ctx.use_shared('customer_stats'):
+        segment_aov = ctx.segment_order_value()
+    else:
+        segment_aov = Order.objects.select_related('customer__segment').filter(ctx.filters.q('order')).values(
+            'customer__segment__segment_code',
+            'customer__segment__description'
+        ).annotate(
+            # Tổng doanh số
+            total_revenue=Sum('orderdetail__total'),
+            # Số lượng đơn hàng
+            order_count=Count('id', distinct=True)
+        ).filter(
+            order_count__gt=0  # Đảm bảo không chia cho 0
+        ).annotate(
+            # Tính AOV = Tổng doanh số / Số lượng đơn hàng
+            aov=F('total_revenue') / F('order_count')
+        ).order_by('-aov')
+    
+    # Chuyển đổi thành định dạng JSON cho biểu đồ
+    result = [
+        {
+            'segment_code': item['customer__segment__segment_code'] or 'KXĐ',
+            'segment_name': item['customer__segment__description'] or 'Không xác định',
+            'aov': int(item['aov']) if item['aov'] is not None else 0,
+            'order_count': item['order_count'],
+            'total_revenue': item['total_revenue']
+        }
+        for item in segment_aov
+    ]
+    return result
+
+
+@chart("Q17")
+def q17(ctx):
+    # Q17: Doanh số và tăng trưởng theo tháng (line and stacked column chart)
+    
+    # Lấy doanh số theo tháng (đọc từ bảng tổng hợp)
+    if ctx.use_shared('month_segment_revenue'):
+        monthly_revenue = ctx.monthly_revenue()
+    else:
+        monthly_revenue = SalesRollup.objects.filter(ctx.filters.q('rollup')).annotate(
+            month=ExtractMonth('date')
+        ).values('month').annotate(
+            total_revenue=Sum('revenue')
+        ).order_by('month')
+    
+    # Chuyển đổi thành list để dễ xử lý
+    revenue_data = list(monthly_revenue)
+    
+    # Tính tăng trưởng giữa các tháng
+    result = []
+    previous_revenue = None
+    
+    for i, item in enumerate(revenue_data):
+        current_month = item['month']
+        current_revenue = item['total_revenue']
+        
+        # Tính tăng trưởng so với tháng trước
+        growth_rate = 0
+        if previous_revenue and previous_revenue > 0:
+            growth_rate = ((current_revenue - previous_revenue) / previous_revenue) * 100
+        
+        # Lưu doanh số tháng hiện tại cho lần lặp tiếp theo
+        previous_revenue = current_revenue
+        
+        # Thêm vào kết quả
+        result.append({
+            'month': current_month,
+            'total_revenue': current_revenue,
+            'growth_rate': round(growth_rate, 1)  # Làm tròn đến 1 chữ số thập phân
+        })
+    return result
+
+
+@chart("Q18")
+def q18(ctx):
+    # Q18: Phân bố doanh số theo phân khúc khách hàng và nhóm hàng
+    
+    # Lấy doanh số theo từng cặp phân khúc và nhóm hàng
+    segment_category_revenue = OrderDetail.objects.select_related(
+        'order__customer__segment', 
+        'product__category'
+    ).filter(ctx.filters.q('detail')).values(
+        'order__customer__segment__segment_code',
+        'product__category__category_code',
+        'product__category__category_name'
+    ).annotate(
+        total_revenue=Sum('total')
+    )
+    
+    # Doanh số và tên các phân khúc / nhóm hàng: ba truy vấn độc lập (song song trong view async)
+    segment_category_revenue, segments, category_list = ctx.fetch(
+        segment_category_revenue, Segment.objects.all(), Category.objects.all()
+    )
+    
+    # Tạo cấu trúc dữ liệu giống pivot table
+    pivot_data = {}
+    all_categories = set()
+    
+    # Tổng hợp dữ liệu thô
+    for item in segment_category_revenue:
+        segment_code = item['order__customer__segment__segment_code'] or 'KXĐ'
+        category_code = item['product__category__category_code'] or 'KXĐ'
+        category_name = item['product__category__category_name'] or 'Không xác định'
+        revenue = item['total_revenue'] or 0
+        
+        if segment_code not in pivot_data:
+            pivot_data[segment_code] = {'total': 0}
+        
+        # Lưu doanh số cho nhóm hàng
+        pivot_data[segment_code][category_code] = revenue
+        
+        # Cộng vào tổng doanh số của phân khúc
+        pivot_data[segment_code]['total'] += revenue
+        
+        # Thêm nhóm hàng vào danh sách
+        all_categories.add(category_code)
+    
+    # Danh sách nhóm hàng (được sắp xếp)
+    categories = sorted(list(all_categories))
+    
+    # Tính toán tỷ lệ phần trăm
+    for segment_code, segment_data in pivot_data.items():
+        segment_total = segment_data['total']
+        if segment_total > 0:
+            for category_code in all_categories:
+                revenue = segment_data.get(category_code, 0)
+                # Tính phần trăm dựa trên tổng doanh số của phân khúc đó (không phải tổng toàn bộ)
+                percentage = (revenue / segment_total) * 100
+                segment_data[f'{category_code}_pct'] = percentage
+    
+    # Lấy tên các phân khúc khách hàng
+    segment_names = {}
+    for segment in segments:
+        segment_names[segment.segment_code] = segment.description or segment.segment_code
+    
+    # Lấy tên các nhóm hàng
+    category_names = {}
+    for category in category_list:
+        category_names[category.category_code] = category.category_name or category.category_code
+    
+    # Chuyển đổi thành định dạng cho biểu đồ
+    matrix = []
+    for segment_code, segment_data in pivot_data.items():
+        row = {
+            'segment_code': segment_code,
+            'segment_name': segment_names.get(segment_code, segment_code),
+            'total': segment_data['total'],
+            'categories': {}
+        }
+        
+        for category_code in categories:
+            revenue = segment_data.get(category_code, 0)
+            percentage = segment_data.get(f'{category_code}_pct', 0)
+            
+            row['categories'][category_code] = {
+                'revenue': revenue,
+                'percentage': round(percentage, 2)
+            }
+        
+        matrix.append(row)
+    
+    # Sắp xếp matrix theo mã phân khúc
+    matrix.sort(key=lambda x: x['segment_code'])
+    
+    # Kết quả trả về
+    result = {
+        'segments': [row['segment_code'] for row in matrix],
+        'categories': categories,
+        'segment_names': segment_names,
+        'category_names': category_names,
+        'matrix': matrix
+    }
+    return result
+
+
+@chart("Q19", params=FILTER_PARAMS + ("max_points", "sample"))
+def q19(ctx):
+    # Q19: Phân phối chi tiêu theo phân khúc khách hàng (Box Plot)
+    
+    # Tạo query để tính tổng chi tiêu của mỗi khách hàng theo phân khúc
+    if ctx.use_shared('customer_stats'):
+        customer_spending = ctx.segment_customer_spending()
+    else:
+        customer_spending = OrderDetail.objects.select_related(
+            'order__customer', 'order__customer__segment'
+        ).filter(ctx.filters.q('detail')).values(
+            'order__customer__customer_code',
+            'order__customer__segment__segment_code'
+        ).annotate(
+            total_spending=Sum('total')
+        ).order_by('order__customer__segment__segment_code')
+    
+    # Tạo dictionary để lưu trữ dữ liệu theo từng phân khúc
+    segment_spending = {}
+    
+    # Chuyển QuerySet thành dữ liệu cho biểu đồ
+    for item in customer_spending:
+        segment_code = item['order__customer__segment__segment_code'] or 'KXĐ'
+        spending = item['total_spending'] or 0
+        
+        if segment_code not in segment_spending:
+            segment_spending[segment_code] = []
+        
+        segment_spending[segment_code].append(spending)
+    
+    # Tứ phân vị, râu và điểm mẫu (tối đa max_points điểm mỗi phân khúc) tính bằng numpy
+    max_points = statistics.parse_max_points(ctx.params.get('max_points'))
+    sample = statistics.parse_sample_mode(ctx.params.get('sample'))
+    result = [
+        {'segment_code': segment_code, **statistics.box_plot(spendings, max_points, sample)}
+        for segment_code, spendings in segment_spending.items()
+    ]
+    
+    # Sắp xếp kết quả theo mã phân khúc
+    result.sort(key=lambda x: x['segment_code'])
+    return result
+
+
+@chart("Q20", params=FILTER_PARAMS + ("level", "top", "sort", "min_count", "month"))
+def q20(ctx):
+    # Q20: Các cặp mặt hàng / nhóm hàng thường được mua cùng nhau (support, confidence, lift)
+    options = basket.parse_options(ctx.params)
+
+    # Chỉ số mặt hàng / nhóm hàng theo thứ tự mã (nhóm hàng NULL có chỉ số 0) như SalesFrame
+    categories = Category.objects.order_by('category_code').values_list('id', 'category_code', 'category_name')
+    products = Product.objects.order_by('product_code').values_list('id', 'product_code', 'product_name', 'category_id')
+
+    # Giỏ hàng gồm mọi mặt hàng của các đơn hàng trong khoảng ngày / phân khúc (và tháng nếu có);
+    # bộ lọc nhóm hàng / mặt hàng chỉ chọn các cặp có ít nhất một phía khớp
+    details = OrderDetail.objects.filter(ctx.filters.without('category', 'product').q('detail'))
+    if options['month']:
+        details = details.filter(order__month=options['month'])
+    filtered = ctx.filters.category is not None or ctx.filters.product is not None
+    selected = Product.objects.filter(ctx.filters.q('product')).values_list('id', flat=True) if filtered else []
+
+    # Các truy vấn độc lập (song song trong view async)
+    categories, products, rows, selected = ctx.fetch(
+        categories, products,
+        lambda: np.fromiter(details.values_list('order_id', 'product_id').iterator(chunk_size=10000),
+                            dtype=np.dtype((np.int64, 2))),
+        selected,
+    )
+
+    category_index = {pk: i + 1 for i, (pk, _, _) in enumerate(categories)}
+    product_ids = np.array([row[0] for row in products], dtype=np.int64)
+    product_category = np.array([category_index.get(row[3], 0) for row in products], dtype=np.int64)
+    product_lookup = np.zeros(int(product_ids.max()) + 1 if len(product_ids) else 0, dtype=np.int64)
+    product_lookup[product_ids] = np.arange(len(product_ids))
+    product_mask = np.isin(product_ids, selected) if filtered else None
+
+    if options['level'] == 'category':
+        codes = [None] + [code for _, code, _ in categories]
+        names = [None] + [name for _, _, name in categories]
+    else:
+        codes = [row[1] for row in products]
+        names = [row[2] for row in products]
+    return basket.basket_chart(rows[:, 0], product_lookup[rows[:, 1]], product_category, codes, names,
+                               product_mask, options)
@@ -0,0 +1,121 @@
+from collections import namedtuple
+from datetime import date
+
+from django.db.models import Q
+
+# Tham số query string của bộ lọc: ?from=2024-01-01&to=2024-03-31&segment=C11&category=BOT,THO&product=BOT01
+FILTER_PARAMS = ("from", "to", "segment", "category", "product")
+
+# Các chiều lọc theo mã danh mục (nhiều mã cách nhau bởi dấu phẩy)
+DIMENSIONS = ("segment", "category", "product")
+
+# Đường dẫn tới trường cần lọc, tính từ từng bảng nguồn của biểu đồ.
+# Lọc trên mã (cột unique) để SQLite bắt đầu từ chỉ mục của bảng danh mục rồi
+# đi theo chỉ mục khoá ngoại, thay vì quét toàn bộ bảng lớn.
+PATHS = {
+    'rollup': {
+        'date': 'date',
+        'segment': 'segment__segment_code',
+        'category': 'category__category_code',
+        'product': 'product__product_code',
+    },
+    'detail': {
+        'date': 'order__local_date',
+        'segment': 'order__customer__segment__segment_code',
+        'category': 'product__category__category_code',
+        'product': 'product__product_code',
+    },
+    'order': {
+        'date': 'local_date',
+        'segment': 'customer__segment__segment_code',
+        'category': 'orderdetail__product__category__category_code',
+        'product': 'orderdetail__product__product_code',
+    },
+    'customer': {
+        'date': 'order__local_date',
+        'segment': 'segment__segment_code',
+        'category': 'order__orderdetail__product__category__category_code',
+        'product': 'order__orderdetail__product__product_code',
+    },
+    # Danh mục mặt hàng: chỉ các chiều thuộc tính của mặt hàng
+    'product': {
+        'category': 'category__category_code',
+        'product': 'product_code',
+    },
+    # Lịch bán hàng chỉ có ngày: các chiều khác không áp dụng cho mẫu số "số ngày bán hàng"
+    'calendar': {
+        'date': 'date',
+    },
+}
+
+
+def _parse_date(name, value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Tham số {name} phải có dạng YYYY-MM-DD.")
+
+
+def _parse_codes(value):
+    codes = [code.strip() for code in value.split(",") if code.strip()]
+    return tuple(dict.fromkeys(codes)) or None
+
+
+class ChartFilter(namedtuple("ChartFilter", ["date_from", "date_to", "segment", "category", "product"],
+                             defaults=(None, None, None, None, None))):
+    """
+    Bộ lọc dùng chung cho mọi biểu đồ: khoảng ngày (giờ địa phương, tính cả hai đầu)
+    và các mã phân khúc / nhóm hàng / mặt hàng. Giá trị None nghĩa là không lọc.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_params(cls, params):
+        """Đọc bộ lọc từ query string; ValueError nếu tham số không hợp lệ."""
+        date_from = _parse_date("from", params["from"]) if params.get("from") else None
+        date_to = _parse_date("to", params["to"]) if params.get("to") else None
+        if date_from and date_to and date_from > date_to:
+            raise ValueError("Tham số from phải trước hoặc bằng to.")
+        return cls(date_from, date_to, *(_parse_codes(params.get(name, "")) for name in DIMENSIONS))
+
+    def __bool__(self):
+        return any(value is not None for value in self)
+
+    @property
+    def restricts_activity(self):
+        """Có lọc theo ngày, nhóm hàng hoặc mặt hàng: chỉ xét khách hàng/đơn hàng phát sinh trong phạm vi lọc."""
+        return any(value is not None for value in (self.date_from, self.date_to, self.category, self.product))
+
+    @property
+    def restricts_dimensions(self):
+        """Có lọc theo phân khúc, nhóm hàng hoặc mặt hàng."""
+        return any(getattr(self, dimension) is not None for dimension in DIMENSIONS)
+
+    def without(self, *dimensions):
+        """Bản sao bỏ các chiều lọc đã cho ('date', 'segment', 'category', 'product')."""
+        fields = {}
+        for dimension in dimensions:
+            if dimension == 'date':
+                fields.update(date_from=None, date_to=None)
+            else:
+                fields[dimension] = None
+        return self._replace(**fields)
+
+    def q(self, source):
+        """
+        Điều kiện Q cho bảng nguồn 'rollup', 'detail', 'order', 'customer', 'product' hoặc 'calendar'.
+        Mọi điều kiện nằm trong một Q để Django dùng chung một phép join cho quan hệ
+        nhiều-một-nhiều; gọi filter() trước annotate() để phép tổng hợp chỉ tính các dòng khớp.
+        """
+        paths = PATHS[source]
+        conditions = {}
+        if 'date' in paths:
+            if self.date_from:
+                conditions[f"{paths['date']}__gte"] = self.date_from
+            if self.date_to:
+                conditions[f"{paths['date']}__lte"] = self.date_to
+        for dimension in DIMENSIONS:
+            codes = getattr(self, dimension)
+            if codes is not None and dimension in paths:
+                conditions[f"{paths[dimension]}__in"] = codes
+        return Q(**conditions)
@@ -0,0 +1,101 @@
+import msgpack
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .cache import encode_json
+
+# Định dạng dữ liệu biểu đồ trả về:
+# - "json": mảng các object như trước đây
+# - "columnar": JSON dạng cột, mỗi danh sách object thành {"length", "columns", "dictionaries"}
+# - "msgpack": cùng bố cục dạng cột, mã hoá nhị phân MessagePack
+FORMATS = ("json", "columnar", "msgpack")
+CONTENT_TYPES = {
+    "json": "application/json",
+    "columnar": "application/vnd.sales.columnar+json",
+    "msgpack": "application/msgpack",
+}
+# Kiểu nội dung trong header Accept -> định dạng (khi không có ?format=)
+ACCEPT_TYPES = {
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.sales.columnar+json": "columnar",
+}
+
+
+def negotiate(params, accept=""):
+    """Định dạng của request: tham số ?format= nếu hợp lệ, nếu không thì theo header Accept, mặc định json."""
+    if params.get("format") in FORMATS:
+        return params["format"]
+    for media_type in accept.split(","):
+        fmt = ACCEPT_TYPES.get(media_type.split(";")[0].strip().lower())
+        if fmt:
+            return fmt
+    return "json"
+
+
+def _is_nested(value):
+    return isinstance(value, (dict, list))
+
+
+def to_columnar(value):
+    """
+    Chuyển kết quả biểu đồ sang bố cục dạng cột. Danh sách các object thành
+    {"length": n, "columns": {trường: [giá trị, ...]}, "dictionaries": {trường: [chuỗi, ...]}}:
+    cột chỉ gồm chuỗi (hoặc null) được mã hoá từ điển, mỗi ô là chỉ số trong dictionaries.
+    Object và danh sách lồng nhau được chuyển đệ quy.
+    """
+    if isinstance(value, dict):
+        return {key: to_columnar(item) if _is_nested(item) else item for key, item in value.items()}
+    if not isinstance(value, list) or not any(map(_is_nested, value)):
+        return value
+    if not all(isinstance(row, dict) for row in value):
+        return [to_columnar(item) if _is_nested(item) else item for item in value]
+
+    # Các trường theo thứ tự xuất hiện đầu tiên; object thiếu trường có giá trị null
+    fields = list(dict.fromkeys(key for row in value for key in row))
+    columns, dictionaries = {}, {}
+    for field in fields:
+        cells = [row.get(field) for row in value]
+        kinds = set(map(type, cells))
+        if kinds <= {str, type(None)}:
+            index = {}
+            columns[field] = [None if cell is None else index.setdefault(cell, len(index)) for cell in cells]
+            dictionaries[field] = list(index)
+        elif kinds & {dict, list}:
+            columns[field] = [to_columnar(cell) if _is_nested(cell) else cell for cell in cells]
+        else:
+            columns[field] = cells
+    return {"length": len(value), "columns": columns, "dictionaries": dictionaries}
+
+
+def _msgpack_default(obj):
+    # Ngày giờ, Decimal, ... mã hoá thành chuỗi giống JSON
+    return DjangoJSONEncoder().default(obj)
+
+
+def encode(result, fmt="json"):
+    """Mã hoá kết quả biểu đồ theo định dạng (bytes)."""
+    if fmt == "columnar":
+        return encode_json(to_columnar(result))
+    if fmt == "msgpack":
+        return msgpack.packb(to_columnar(result), default=_msgpack_default, datetime=False)
+    return encode_json(result)
+
+
+def _msgpack_map_header(size):
+    if size < 16:
+        return bytes([0x80 | size])
+    if size < 2 ** 16:
+        return b"\xde" + size.to_bytes(2, "big")
+    return b"\xdf" + size.to_bytes(4, "big")
+
+
+def combine(payloads, fmt="json"):
+    """
+    Ghép {câu hỏi: dữ liệu đã mã hoá} thành một object {câu hỏi: dữ liệu}
+    mà không cần giải mã lại từng phần.
+    """
+    if fmt == "msgpack":
+        return _msgpack_map_header(len(payloads)) + b"".join(
+            msgpack.packb(question) + payload for question, payload in payloads.items()
+        )
+    return b"{" + b",".join(encode_json(question) + b":" + payload for question, payload in payloads.items()) + b"}"
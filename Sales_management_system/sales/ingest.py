@@ -0,0 +1,612 @@
+import codecs
+import csv
+import hashlib
+import os
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import rollups
+from .cache import bump_generation
+from .metrics import StageTimer
+from .models import Customer, Product, Order, OrderDetail, Segment, Category, IngestedFile, RowFingerprint, \
+    SalesRollup, SalesCalendar
+
+# Số dòng CSV được gom lại trước khi ghi xuống database
+BATCH_SIZE = 5000
+# Số bản ghi tối đa trong một câu INSERT nhiều dòng
+INSERT_BATCH_SIZE = 500
+# Các cột ghi vào bảng chi tiết đơn hàng
+DETAIL_COLUMNS = ["order_id", "product_id", "quantity", "price", "total"]
+# Các cột ghi vào bảng danh mục và đơn hàng (cột đầu là mã duy nhất)
+SEGMENT_COLUMNS = ["segment_code", "description"]
+CATEGORY_COLUMNS = ["category_code", "category_name"]
+CUSTOMER_COLUMNS = ["customer_code", "name", "segment_id"]
+PRODUCT_COLUMNS = ["product_code", "product_name", "category_id", "unit_price"]
+ORDER_COLUMNS = ["order_code", "customer_id", "created_at", "local_date", "year", "month", "day", "weekday", "hour"]
+# Số thông báo lỗi chi tiết tối đa được giữ lại trong bộ nhớ
+MAX_ERROR_DETAILS = 1000
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Bản ghi đã được chuẩn hoá từ một dòng CSV
+ParsedRow = namedtuple("ParsedRow", [
+    "created_at",
+    "segment_code", "segment_description",
+    "customer_code", "customer_name",
+    "category_code", "category_name",
+    "product_code", "product_name",
+    "order_code",
+    "quantity", "price",
+    "fingerprint",
+])
+
+
+# Chuyển đổi an toàn cho số nguyên
+def safe_int(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def row_fingerprint(order_code, product_code, quantity, price):
+    """Hash 64 bit (có dấu, vừa BigIntegerField) nhận diện một dòng chi tiết đơn hàng."""
+    key = f"{order_code}\x1f{product_code}\x1f{quantity}\x1f{price}".encode()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little", signed=True)
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 nội dung tệp, đọc theo từng chunk."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_datetime(value):
+    """
+    datetime.strptime(value, DATE_FORMAT) nhanh hơn nhiều lần: chuỗi đúng khuôn
+    "YYYY-MM-DD HH:MM:SS" được đọc bằng datetime.fromisoformat (viết bằng C), các chuỗi
+    khác vẫn qua strptime để chấp nhận / báo lỗi y như trước. Lỗi thì raise ValueError.
+    """
+    if len(value) == 19 and value[4] == value[7] == "-" and value[10] == " " and value[13] == value[16] == ":" \
+            and value[:4].isdigit():
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.strptime(value, DATE_FORMAT)
+
+
+def parse_row(row):
+    """Chuẩn hoá một dòng CSV thành ParsedRow, hoặc trả về chuỗi mô tả lỗi."""
+    try:
+        # Xử lý ngày tạo đơn
+        date_str = row.get("Thời gian tạo đơn", "").strip()
+        try:
+            created_at = parse_datetime(date_str)
+        except ValueError:
+            return f"Lỗi định dạng ngày ({date_str})."
+
+        order_code = row.get("Mã đơn hàng", "").strip()
+        product_code = row.get("Mã mặt hàng", "").strip()
+        quantity = safe_int(row.get("SL"))
+        price = safe_int(row.get("Đơn giá"))
+
+        return ParsedRow(
+            created_at=created_at,
+            segment_code=row.get("Mã PKKH", "").strip(),
+            segment_description=row.get("Mô tả Phân Khúc Khách hàng", "").strip(),
+            customer_code=row.get("Mã khách hàng", "").strip(),
+            customer_name=row.get("Tên khách hàng", "").strip(),
+            category_code=row.get("Mã nhóm hàng", "").strip(),
+            category_name=row.get("Tên nhóm hàng", "").strip(),
+            product_code=product_code,
+            product_name=row.get("Tên mặt hàng", "").strip(),
+            order_code=order_code,
+            quantity=quantity,
+            price=price,
+            fingerprint=row_fingerprint(order_code, product_code, quantity, price),
+        )
+    except Exception as e:
+        return f"Lỗi không xác định - {e}"
+
+
+def stream_encoding(encoding):
+    """Bảng mã dùng để giải mã đầu tệp: với UTF-8, bỏ BOM mà Excel thêm vào tệp CSV xuất ra."""
+    return "utf-8-sig" if codecs.lookup(encoding).name == "utf-8" else encoding
+
+
+def iter_lines(chunks, encoding="utf-8"):
+    """Giải mã dần các chunk bytes và trả về từng dòng văn bản (giữ ký tự xuống dòng)."""
+    decoder = codecs.getincrementaldecoder(stream_encoding(encoding))()
+    tail = ""
+    for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).splitlines(keepends=True)
+        # Dòng cuối có thể chưa trọn (hoặc "\r\n" bị cắt đôi) -> chờ chunk tiếp theo
+        tail = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+        yield from lines
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield from tail.splitlines(keepends=True)
+
+
+def iter_csv_rows(uploaded_file, encoding="utf-8", timer=None):
+    """
+    Đọc tệp CSV tải lên theo từng chunk, trả về từng dòng dạng dict mà không nạp cả tệp vào RAM.
+    timer (StageTimer): thời gian đọc và giải mã được tính vào giai đoạn "decode".
+    """
+    lines = iter_lines(uploaded_file.chunks(), encoding)
+    if timer is not None:
+        lines = timer.timed(lines, "decode")
+    return csv.DictReader(lines)
+
+
+class BulkIngestor:
+    """
+    Nạp dữ liệu theo lô: tra khoá các bảng danh mục qua dictionary trong bộ nhớ,
+    tạo bản ghi mới bằng các câu INSERT nhiều dòng dựng sẵn và để ràng buộc UNIQUE
+    (order, product) của database phát hiện chi tiết trùng thay vì truy vấn từng dòng;
+    bảng tổng hợp được cộng từ các bucket gom trong bộ nhớ. Kết quả đếm và
+    thông báo lỗi giống hệt cách xử lý từng dòng bằng get_or_create trước đây.
+    Phải được gọi bên trong transaction.atomic().
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, timer=None):
+        self.batch_size = batch_size
+        # Thời gian theo giai đoạn: "resolve" (tra / tạo danh mục) và "insert" (ghi chi tiết)
+        self.timer = timer or StageTimer()
+        self.total_rows = 0
+        self.skipped_rows = 0
+        self.error_details = []
+        self.hidden_errors = 0  # Số lỗi vượt quá MAX_ERROR_DETAILS
+        self._pending = []
+        self._order_slots = {}  # id đơn hàng tạo ở lô hiện tại -> (ngày, giờ, id khách hàng)
+        self._keys_loaded = False
+
+    @property
+    def success_count(self):
+        return self.total_rows - self.skipped_rows
+
+    def _load_keys(self):
+        # Nạp sẵn bảng ánh xạ mã -> id cho các bảng danh mục
+        self.segment_ids = dict(Segment.objects.values_list("segment_code", "id"))
+        self.category_ids = dict(Category.objects.values_list("category_code", "id"))
+        # Kèm phân khúc của khách hàng và nhóm của mặt hàng: khoá bucket của bảng tổng hợp
+        self.customer_ids, self.customer_segments = {}, {}
+        for code, pk, segment_id in Customer.objects.values_list("customer_code", "id", "segment_id").iterator():
+            self.customer_ids[code] = pk
+            self.customer_segments[pk] = segment_id
+        self.product_ids, self.product_categories = {}, {}
+        for code, pk, category_id in Product.objects.values_list("product_code", "id", "category_id"):
+            self.product_ids[code] = pk
+            self.product_categories[pk] = category_id
+
+        self.order_ids = {}
+        self.order_customers = {}  # Mã đơn hàng -> mã khách hàng
+        orders = Order.objects.values_list("order_code", "id", "customer__customer_code")
+        for order_code, order_id, customer_code in orders.iterator():
+            self.order_ids[order_code] = order_id
+            self.order_customers[order_code] = customer_code
+
+        discard_stale_ledger()
+
+        # Chỉ mục dấu vân tay dạng mảng int64 đã sắp xếp (8 byte mỗi dòng)
+        fingerprints = RowFingerprint.objects.values_list("fingerprint", flat=True)
+        self.known_fingerprints = np.sort(np.fromiter(fingerprints.iterator(chunk_size=10000), dtype=np.int64))
+        self._keys_loaded = True
+
+    def _seen_before(self, batch):
+        """Mảng bool: dòng nào trong lô đã được nạp thành công ở lần trước."""
+        known = self.known_fingerprints
+        if not known.size:
+            return np.zeros(len(batch), dtype=bool)
+        fingerprints = np.fromiter(
+            (0 if isinstance(rec, str) else rec.fingerprint for _, rec in batch),
+            dtype=np.int64, count=len(batch)
+        )
+        positions = np.minimum(np.searchsorted(known, fingerprints), known.size - 1)
+        seen = known[positions] == fingerprints
+        return self._still_stored(batch, seen) if seen.any() else seen
+
+    def _still_stored(self, batch, seen):
+        """
+        Dấu vân tay chỉ là gợi ý: chi tiết đã nạp có thể bị xoá sau đó (xoá dây chuyền, sửa tay,
+        migration). Chỉ giữ các dòng mà cặp (order, product) vẫn còn trong database.
+        """
+        pairs = {}
+        for i in np.flatnonzero(seen):
+            rec = batch[i][1]
+            order_id, product_id = self.order_ids.get(rec.order_code), self.product_ids.get(rec.product_code)
+            if order_id is None or product_id is None:
+                seen[i] = False
+            else:
+                pairs[i] = (order_id, product_id)
+
+        stored = self._existing_pairs({order_id for order_id, _ in pairs.values()})
+        for i, pair in pairs.items():
+            seen[i] = pair in stored
+        return seen
+
+    def _existing_pairs(self, order_ids):
+        # Các cặp (order_id, product_id) đã có của các đơn hàng, tra theo nhóm (dùng chỉ mục UNIQUE)
+        order_ids = list(order_ids)
+        existing = set()
+        for start in range(0, len(order_ids), INSERT_BATCH_SIZE):
+            chunk = order_ids[start:start + INSERT_BATCH_SIZE]
+            existing.update(OrderDetail.objects.filter(order_id__in=chunk).values_list("order_id", "product_id"))
+        return existing
+
+    def add(self, record):
+        """Thêm một dòng (ParsedRow hoặc chuỗi lỗi) vào lô hiện tại."""
+        self.total_rows += 1
+        self._pending.append((self.total_rows, record))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def finish(self):
+        self.flush()
+        return self
+
+    def _skip(self, row_no, message):
+        self.skipped_rows += 1
+        if len(self.error_details) < MAX_ERROR_DETAILS:
+            self.error_details.append(f"Dòng {row_no}: {message}")
+        else:
+            self.hidden_errors += 1
+
+    def flush(self):
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        with self.timer.stage("resolve"):
+            details = self._resolve(batch)
+        with self.timer.stage("insert"):
+            self._write_details(details)
+
+    def _resolve(self, batch):
+        """
+        Kiểm tra các dòng của lô, tra khoá và tạo các bản ghi danh mục mới (phân khúc,
+        khách hàng, nhóm hàng, mặt hàng, đơn hàng). Trả về các chi tiết đơn hàng cần ghi.
+        """
+        if not self._keys_loaded:
+            self._load_keys()
+
+        seen_before = self._seen_before(batch)
+        new_segments = {}
+        new_customers = {}
+        new_categories = {}
+        new_products = {}
+        new_orders = {}
+        details = []
+
+        # Bước 1: Kiểm tra từng dòng theo đúng thứ tự cũ và gom các bản ghi danh mục mới
+        for i, (row_no, rec) in enumerate(batch):
+            if isinstance(rec, str):
+                self._skip(row_no, rec)
+                continue
+
+            # Dòng đã nạp ở lần tải lên trước: bỏ qua trước khi đụng tới database
+            if seen_before[i]:
+                self._skip(row_no, f"Chi tiết đơn hàng bị trùng (Order: {rec.order_code}, Product: {rec.product_code}).")
+                continue
+
+            # Segment (Phân khúc)
+            if rec.segment_code not in self.segment_ids and rec.segment_code not in new_segments:
+                new_segments[rec.segment_code] = rec.segment_description
+
+            # Customer (Khách hàng)
+            if not rec.customer_code:
+                self._skip(row_no, "Thiếu mã khách hàng.")
+                continue
+            if rec.customer_code not in self.customer_ids and rec.customer_code not in new_customers:
+                new_customers[rec.customer_code] = (rec.customer_name, rec.segment_code)
+
+            # Category (Nhóm hàng)
+            if rec.category_code not in self.category_ids and rec.category_code not in new_categories:
+                new_categories[rec.category_code] = rec.category_name
+
+            # Product (Sản phẩm)
+            if not rec.product_code:
+                self._skip(row_no, "Thiếu mã sản phẩm.")
+                continue
+            if rec.product_code not in self.product_ids and rec.product_code not in new_products:
+                if rec.price is None:
+                    self._skip(row_no, f"Lỗi không xác định - NOT NULL constraint failed: {Product._meta.db_table}.unit_price")
+                    continue
+                new_products[rec.product_code] = (rec.product_name, rec.category_code, rec.price)
+
+            # Order (Đơn hàng): mã đơn đã thuộc về khách hàng khác thì không tạo được
+            order_customer = self.order_customers.get(rec.order_code)
+            if order_customer is None:
+                self.order_customers[rec.order_code] = rec.customer_code
+                new_orders[rec.order_code] = (rec.customer_code, rec.created_at)
+            elif order_customer != rec.customer_code:
+                self._skip(row_no, f"Lỗi không xác định - UNIQUE constraint failed: {Order._meta.db_table}.order_code")
+                continue
+
+            if rec.quantity is None or rec.price is None:
+                self._skip(row_no, "Số lượng hoặc đơn giá không hợp lệ.")
+                continue
+
+            details.append((row_no, rec.order_code, rec.product_code, rec.quantity, rec.price, rec.fingerprint))
+
+        # Bước 2: Ghi các bản ghi danh mục mới theo thứ tự phụ thuộc khoá ngoại
+        self.segment_ids.update(self._insert_rows(Segment, SEGMENT_COLUMNS, list(new_segments.items())))
+        self.category_ids.update(self._insert_rows(Category, CATEGORY_COLUMNS, list(new_categories.items())))
+
+        customer_ids = self._insert_rows(Customer, CUSTOMER_COLUMNS, [
+            (code, name, self.segment_ids[segment_code]) for code, (name, segment_code) in new_customers.items()
+        ])
+        for code, (_, segment_code) in new_customers.items():
+            self.customer_segments[customer_ids[code]] = self.segment_ids[segment_code]
+        self.customer_ids.update(customer_ids)
+
+        product_ids = self._insert_rows(Product, PRODUCT_COLUMNS, [
+            (code, name, self.category_ids[category_code], price)
+            for code, (name, category_code, price) in new_products.items()
+        ])
+        for code, (_, category_code, _) in new_products.items():
+            self.product_categories[product_ids[code]] = self.category_ids[category_code]
+        self.product_ids.update(product_ids)
+
+        self._create_orders(new_orders)
+        return details
+
+    def _create_orders(self, new_orders):
+        # Ghi các đơn hàng mới kèm các phần ngày giờ địa phương, cộng chúng vào lịch bán hàng và
+        # nhớ (ngày, giờ, khách hàng) của chúng để tính bucket của chi tiết trong lô mà không đọc lại
+        tz = timezone.get_default_timezone()
+        ops = connection.ops
+        rows, slots = [], []
+        for code, (customer_code, created_at) in new_orders.items():
+            created_at = timezone.make_aware(created_at, tz)
+            local_date, year, month, day, weekday, hour = Order.date_parts(created_at)
+            rows.append((code, self.customer_ids[customer_code], ops.adapt_datetimefield_value(created_at),
+                         ops.adapt_datefield_value(local_date), year, month, day, weekday, hour))
+            slots.append((local_date, hour, weekday))
+
+        order_ids = self._insert_rows(Order, ORDER_COLUMNS, rows)
+        self.order_ids.update(order_ids)
+        self._order_slots = {
+            order_ids[row[0]]: (local_date, hour, row[1])
+            for row, (local_date, hour, _) in zip(rows, slots)
+        }
+        rollups.add_orders(slots)
+
+    def _write_details(self, details):
+        # Bước 3: Ghi chi tiết đơn hàng, cặp (order, product) bị trùng do ràng buộc UNIQUE loại bỏ
+        rows = [
+            (self.order_ids[order_code], self.product_ids[product_code], quantity, price, quantity * price)
+            for _, order_code, product_code, quantity, price, _ in details
+        ]
+        detail_ids = self._insert_details(rows)
+
+        inserted = []
+        new_fingerprints = []
+        for (row_no, order_code, product_code, _, _, fingerprint), row, pk in zip(details, rows, detail_ids):
+            if pk is None:
+                self._skip(row_no, f"Chi tiết đơn hàng bị trùng (Order: {order_code}, Product: {product_code}).")
+                continue
+            inserted.append(row)
+            new_fingerprints.append((fingerprint,))
+
+        rollups.add_buckets(self._rollup_buckets(inserted))
+        if new_fingerprints:
+            qn = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {qn(RowFingerprint._meta.db_table)} ({qn('fingerprint')}) VALUES (%s) "
+                    f"ON CONFLICT DO NOTHING",
+                    new_fingerprints,
+                )
+
+    def _rollup_buckets(self, rows):
+        """
+        Gom các chi tiết vừa ghi (order_id, product_id, quantity, price, total) thành bucket của bảng
+        tổng hợp ngay trong bộ nhớ. Mỗi cặp (order, product) là duy nhất nên mỗi chi tiết của một
+        bucket thuộc một đơn hàng khác nhau: số đơn hàng của bucket bằng số chi tiết.
+        """
+        slots = self._order_slots
+        missing = list({row[0] for row in rows if row[0] not in slots})
+        if missing:
+            # Chi tiết thêm vào đơn hàng đã tạo ở lô / lần nạp trước
+            slots = dict(slots)
+            for start in range(0, len(missing), INSERT_BATCH_SIZE):
+                chunk = missing[start:start + INSERT_BATCH_SIZE]
+                for pk, local_date, hour, customer_id in Order.objects.filter(id__in=chunk).values_list(
+                        "id", "local_date", "hour", "customer_id"):
+                    slots[pk] = (local_date, hour, customer_id)
+
+        buckets = {}
+        for order_id, product_id, quantity, _, total in rows:
+            local_date, hour, customer_id = slots[order_id]
+            key = (local_date, hour, product_id, self.product_categories[product_id], self.customer_segments[customer_id])
+            measures = buckets.get(key)
+            if measures is None:
+                buckets[key] = [total, quantity, 1]
+            else:
+                measures[0] += total
+                measures[1] += quantity
+                measures[2] += 1
+        return buckets
+
+    def _insert_details(self, rows):
+        """
+        Ghi các dòng (order_id, product_id, quantity, price, total) theo thứ tự.
+        Trả về danh sách id cùng thứ tự, None ở dòng bị bỏ qua vì cặp (order, product)
+        đã có trong database hoặc đã xuất hiện ở dòng trước.
+        """
+        if not connection.features.can_return_rows_from_bulk_insert:
+            return self._insert_details_checked(rows)
+
+        # INSERT ... ON CONFLICT DO NOTHING RETURNING (SQLite >= 3.35, PostgreSQL):
+        # chỉ mục UNIQUE kiểm tra trùng ngay khi ghi, không cần đọc trước
+        qn = connection.ops.quote_name
+        sql = (
+            f"INSERT INTO {qn(OrderDetail._meta.db_table)} ({', '.join(qn(c) for c in DETAIL_COLUMNS)}) VALUES %s "
+            f"ON CONFLICT ({qn('order_id')}, {qn('product_id')}) DO NOTHING "
+            f"RETURNING {qn('id')}, {qn('order_id')}, {qn('product_id')}"
+        )
+        placeholders = f"({', '.join(['%s'] * len(DETAIL_COLUMNS))})"
+
+        ids = []
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), INSERT_BATCH_SIZE):
+                chunk = rows[start:start + INSERT_BATCH_SIZE]
+                cursor.execute(sql % ", ".join([placeholders] * len(chunk)), [value for row in chunk for value in row])
+                inserted = {(order_id, product_id): pk for pk, order_id, product_id in cursor.fetchall()}
+                # Cặp lặp lại trong cùng câu lệnh: dòng đầu tiên được ghi
+                ids.extend(inserted.pop((row[0], row[1]), None) for row in chunk)
+        return ids
+
+    def _insert_details_checked(self, rows):
+        # Database không hỗ trợ RETURNING: tra các cặp đã có theo từng nhóm đơn hàng, rồi ghi bằng bulk_create
+        order_ids = list({row[0] for row in rows})
+        existing = self._existing_pairs(order_ids)
+
+        new_details = []
+        for row in rows:
+            if (row[0], row[1]) in existing:
+                new_details.append(None)
+                continue
+            existing.add((row[0], row[1]))
+            new_details.append(OrderDetail(**dict(zip(DETAIL_COLUMNS, row))))
+
+        created = [detail for detail in new_details if detail is not None]
+        OrderDetail.objects.bulk_create(created, batch_size=INSERT_BATCH_SIZE)
+        if any(detail.pk is None for detail in created):
+            # bulk_create không trả về id -> tìm lại theo cặp (order, product)
+            ids = {}
+            for start in range(0, len(order_ids), INSERT_BATCH_SIZE):
+                chunk = order_ids[start:start + INSERT_BATCH_SIZE]
+                for pk, order_id, product_id in OrderDetail.objects.filter(order_id__in=chunk).values_list("id", "order_id", "product_id"):
+                    ids[(order_id, product_id)] = pk
+            for detail in created:
+                detail.pk = ids[(detail.order_id, detail.product_id)]
+        return [detail.pk if detail is not None else None for detail in new_details]
+
+    def _insert_rows(self, model, columns, rows):
+        """
+        Ghi các bản ghi mới (tuple theo columns, cột đầu là mã duy nhất) bằng câu INSERT dựng sẵn
+        thay cho bulk_create: không tạo đối tượng model, không biên dịch SQL qua ORM cho từng lô.
+        Các giá trị phải đã ở dạng database nhận (ngày giờ qua connection.ops). Trả về {mã: id}.
+        """
+        if not rows:
+            return {}
+
+        qn = connection.ops.quote_name
+        table = qn(model._meta.db_table)
+        column_list = ", ".join(qn(c) for c in columns)
+        placeholders = f"({', '.join(['%s'] * len(columns))})"
+        ids = {}
+        with connection.cursor() as cursor:
+            if connection.features.can_return_rows_from_bulk_insert:
+                sql = f"INSERT INTO {table} ({column_list}) VALUES %s RETURNING {qn(columns[0])}, {qn('id')}"
+                for start in range(0, len(rows), INSERT_BATCH_SIZE):
+                    chunk = rows[start:start + INSERT_BATCH_SIZE]
+                    cursor.execute(sql % ", ".join([placeholders] * len(chunk)), [value for row in chunk for value in row])
+                    ids.update(cursor.fetchall())
+                return ids
+            cursor.executemany(f"INSERT INTO {table} ({column_list}) VALUES {placeholders}", rows)
+
+        # Database không hỗ trợ RETURNING -> truy vấn lại id theo mã
+        codes = [row[0] for row in rows]
+        for start in range(0, len(codes), INSERT_BATCH_SIZE):
+            chunk = codes[start:start + INSERT_BATCH_SIZE]
+            ids.update(model.objects.filter(**{f"{columns[0]}__in": chunk}).values_list(columns[0], "id"))
+        return ids
+
+
+def discard_stale_ledger():
+    """
+    Dữ liệu bán hàng đã bị xoá hết (kể cả bằng SQL trực tiếp) thì sổ cái tệp và dấu vân tay
+    cũ không còn đúng: xoá chúng để tệp cũ được nạp lại đầy đủ. Bảng tổng hợp còn sót
+    cũng được tính lại (thành rỗng).
+    """
+    if OrderDetail.objects.exists():
+        return
+    with transaction.atomic():
+        RowFingerprint.objects.all().delete()
+        IngestedFile.objects.all().delete()
+        if SalesRollup.objects.exists() or SalesCalendar.objects.exists():
+            rollups.rebuild()
+
+
+def iter_file_records(path, workers=0, encoding="utf-8", timer=None):
+    """
+    Trả về các bản ghi đã parse của tệp CSV: song song nếu workers > 0, ngược lại đọc tuần tự theo từng chunk.
+    timer (StageTimer, tuỳ chọn) đo các giai đoạn "decode" và "parse"; khi parse song song,
+    thời gian chờ các tiến trình con (gồm cả giải mã) được tính vào "parse".
+    """
+    if workers > 0:
+        from .parallel import iter_parsed_records
+        records = iter_parsed_records(path, workers, encoding=encoding)
+        yield from timer.timed(records, "parse") if timer is not None else records
+        return
+
+    with open(path, "rb") as f:
+        records = map(parse_row, iter_csv_rows(File(f), encoding, timer))
+        yield from timer.timed(records, "parse") if timer is not None else records
+
+
+def ingest_records(records, batch_size=BATCH_SIZE, on_batch=None, timer=None):
+    """
+    Nạp các bản ghi đã parse (ParsedRow hoặc chuỗi lỗi), mỗi lô trong một
+    transaction riêng. on_batch(ingestor) được gọi bên trong transaction của lô,
+    ví dụ để lưu tiến độ. Trả về BulkIngestor chứa kết quả đếm (thời gian từng giai đoạn
+    trong ingestor.timer).
+    """
+    ingestor = BulkIngestor(batch_size=batch_size, timer=timer)
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        with transaction.atomic():
+            for record in batch:
+                ingestor.add(record)
+            ingestor.flush()
+            # Dữ liệu đã thay đổi -> vô hiệu hoá cache biểu đồ khi transaction commit
+            bump_generation()
+            if on_batch is not None:
+                on_batch(ingestor)
+    return ingestor
+
+
+def ingest_file(path, file_name=None, workers=0, batch_size=BATCH_SIZE, on_batch=None, timer=None):
+    """
+    Nạp một tệp CSV có kiểm tra sổ cái: tệp có cùng nội dung đã được nạp trọn
+    vẹn trước đó chỉ tốn một lượt băm, không phải chạy lại toàn bộ các dòng.
+    timer (StageTimer, tuỳ chọn) đo thêm thời gian giải mã và parse.
+    """
+    # Kiểm tra trước khi tra sổ cái: sau khi xoá hết dữ liệu, tệp cũ phải được nạp lại
+    discard_stale_ledger()
+    digest = file_digest(path)
+    previous = IngestedFile.objects.filter(content_hash=digest).first()
+    if previous is not None:
+        # Mọi dòng đều đã có trong database (hoặc đã lỗi từ lần trước)
+        ingestor = BulkIngestor(batch_size=batch_size, timer=timer)
+        ingestor.total_rows = ingestor.skipped_rows = previous.total_rows
+        ingestor.error_details.append(
+            f"Tệp trùng nội dung với {previous.file_name} đã nạp lúc "
+            f"{timezone.localtime(previous.created_at):%Y-%m-%d %H:%M:%S}."
+        )
+        return ingestor
+
+    records = iter_file_records(path, workers=workers, timer=timer)
+    ingestor = ingest_records(records, batch_size=batch_size, on_batch=on_batch, timer=timer)
+    IngestedFile.objects.get_or_create(content_hash=digest, defaults={
+        "file_name": file_name or os.path.basename(path),
+        "total_rows": ingestor.total_rows,
+        "skipped_rows": ingestor.skipped_rows,
+    })
+    return ingestor
@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from . import analytics, snapshot, warmup
+from .ingest import ingest_file
+from .metrics import StageTimer
+from .models import IngestJob
+from .processes import current_process_id, process_alive
+from .sqlite_tuning import refresh_statistics
+
+logger = logging.getLogger(__name__)
+
+# Thư mục (trong MEDIA_ROOT) lưu các tệp CSV chờ xử lý
+UPLOAD_DIR = "uploads"
+
+# Số tiến trình parse CSV song song (0 = parse tuần tự trong thread nạp dữ liệu)
+PARSE_WORKERS = getattr(settings, "SALES_INGEST_PARSE_WORKERS", 0)
+
+# Đo thêm thời gian giải mã và parse của từng job (tốn thêm vài phần trăm thời gian nạp);
+# thời gian tra danh mục và ghi chi tiết luôn được đo
+STAGE_TIMING = getattr(settings, "SALES_INGEST_STAGE_TIMING", False)
+
+# Job của tiến trình trên máy khác (không kiểm tra được còn chạy không) và tệp tải lên không còn
+# job nào dùng được coi là bị bỏ rơi sau khoảng thời gian này (giây)
+ORPHAN_AFTER = timedelta(seconds=getattr(settings, "SALES_INGEST_ORPHAN_AFTER", 24 * 60 * 60))
+
+# SQLite chỉ cho phép một tiến trình ghi tại một thời điểm -> mặc định 1 worker,
+# các tệp tải lên sau sẽ được xếp hàng chờ.
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "SALES_INGEST_WORKERS", 1),
+    thread_name_prefix="sales-ingest",
+)
+
+_recovery_lock = threading.Lock()
+_recovered = False
+
+
+def ensure_recovered():
+    """Dọn job bị bỏ rơi một lần trong mỗi tiến trình (lần tải lên / xem tiến độ đầu tiên)."""
+    global _recovered
+    with _recovery_lock:
+        if _recovered:
+            return
+        _recovered = True
+    try:
+        recover_orphaned_jobs()
+    except Exception:
+        logger.exception("Recovering orphaned ingest jobs failed")
+
+
+def recover_orphaned_jobs():
+    """
+    Hàng đợi nằm trong bộ nhớ: job đang chờ hoặc đang chạy của tiến trình đã dừng (máy chủ khởi
+    động lại giữa chừng) không bao giờ được chạy tiếp. Đánh dấu lỗi và xoá tệp của các job đó,
+    xoá cả tệp tải lên cũ không còn job nào dùng. Trả về số job được đánh dấu lỗi.
+    """
+    now = timezone.now()
+    active_files = set()
+    recovered = 0
+    for job in IngestJob.objects.filter(state__in=[IngestJob.STATE_PENDING, IngestJob.STATE_RUNNING]):
+        alive = process_alive(job.worker)
+        if alive or (alive is None and job.created_at > now - ORPHAN_AFTER):
+            active_files.add(job.file_path)
+            continue
+        # Chỉ cập nhật nếu trạng thái chưa đổi (tiến trình khác có thể vừa dọn job này)
+        updated = IngestJob.objects.filter(pk=job.pk, state=job.state).update(
+            state=IngestJob.STATE_FAILED, finished_at=now,
+            message="Lỗi khi tải lên: tiến trình xử lý đã dừng trước khi nạp xong, vui lòng tải lại tệp.",
+        )
+        if updated:
+            recovered += 1
+            logger.warning("Ingest job #%s was orphaned by worker %s", job.pk, job.worker or "?")
+            _delete_upload(job.file_path)
+    _expire_uploads(active_files, now - ORPHAN_AFTER)
+    return recovered
+
+
+def _delete_upload(file_path):
+    try:
+        default_storage.delete(file_path)
+    except OSError:
+        logger.exception("Deleting upload %s failed", file_path)
+
+
+def _expire_uploads(active_files, cutoff):
+    # Tệp chưa kịp gắn với job (vừa lưu) còn mới nên không bị xoá
+    try:
+        _, files = default_storage.listdir(UPLOAD_DIR)
+    except FileNotFoundError:
+        return
+    for name in files:
+        file_path = os.path.join(UPLOAD_DIR, name)
+        if file_path not in active_files and default_storage.get_modified_time(file_path) < cutoff:
+            _delete_upload(file_path)
+
+
+def enqueue_upload(uploaded_file):
+    """Lưu tệp tải lên xuống đĩa, tạo IngestJob và đưa vào hàng đợi xử lý nền."""
+    ensure_recovered()
+    file_path = default_storage.save(os.path.join(UPLOAD_DIR, os.path.basename(uploaded_file.name)), uploaded_file)
+    job = IngestJob.objects.create(file_name=uploaded_file.name, file_path=file_path, worker=current_process_id())
+    transaction.on_commit(lambda: _executor.submit(run_job, job.pk))
+    return job
+
+
+def run_job(job_id):
+    """Chạy trong thread nền: nạp tệp CSV của job và cập nhật tiến độ sau mỗi lô."""
+    close_old_connections()
+    try:
+        job = IngestJob.objects.get(pk=job_id)
+        job.state = IngestJob.STATE_RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=["state", "started_at"])
+
+        try:
+            ingestor = _ingest_file(job)
+        except Exception as e:
+            logger.exception("Ingest job #%s failed", job_id)
+            job.state = IngestJob.STATE_FAILED
+            job.message = f"Lỗi khi tải lên: {e}"
+            job.finished_at = timezone.now()
+            job.save(update_fields=["state", "message", "finished_at"])
+            _delete_upload(job.file_path)
+            return
+
+        # Thông báo kết quả
+        job.state = IngestJob.STATE_DONE
+        job.rows_processed = ingestor.total_rows
+        job.rows_skipped = ingestor.skipped_rows
+        job.message = (f"Đã tải lên {ingestor.success_count} dòng thành công. "
+                       f"Bỏ qua {ingestor.skipped_rows} dòng do lỗi.")
+        job.finished_at = timezone.now()
+        job.save(update_fields=["state", "rows_processed", "rows_skipped", "message", "finished_at"])
+        default_storage.delete(job.file_path)
+
+        stages = ingestor.timer.seconds
+        logger.info("Ingest job #%s: %d rows in %.1fs (%s)", job_id, ingestor.total_rows,
+                    (job.finished_at - job.started_at).total_seconds(),
+                    ", ".join(f"{name} {seconds:.1f}s" for name, seconds in stages.items()))
+
+        # Dữ liệu mới có thể làm thống kê chỉ mục cũ đi (ảnh hưởng kế hoạch truy vấn khi lọc)
+        try:
+            refresh_statistics()
+        except Exception:
+            logger.exception("Refreshing planner statistics after ingest job #%s failed", job_id)
+
+        # Ghi snapshot dạng cột mới để các worker mở bằng mmap
+        if snapshot.SNAPSHOT_DIR:
+            try:
+                analytics.save_snapshot()
+            except Exception:
+                logger.exception("Writing snapshot after ingest job #%s failed", job_id)
+
+        # Tính sẵn các biểu đồ cho dữ liệu mới trước khi người dùng mở dashboard
+        if warmup.WARMUP_AFTER_INGEST:
+            warmup.schedule()
+
+        # Ghi lỗi chi tiết vào log (thread nền không có console riêng)
+        if ingestor.error_details:
+            hidden = f"\n... và {ingestor.hidden_errors} dòng lỗi khác." if ingestor.hidden_errors else ""
+            logger.warning("Ingest job #%s (%s) skipped %d rows:\n%s%s", job_id, job.file_name,
+                           ingestor.skipped_rows, "\n".join(ingestor.error_details), hidden)
+    finally:
+        connection.close()
+
+
+def _ingest_file(job):
+    # Mỗi lô được ghi trong một transaction riêng để tiến độ hiển thị ngay cho
+    # các request khác và khoá ghi của SQLite không bị giữ suốt cả tệp.
+    def save_progress(ingestor):
+        job.rows_processed = ingestor.total_rows
+        job.rows_skipped = ingestor.skipped_rows
+        job.save(update_fields=["rows_processed", "rows_skipped"])
+
+    return ingest_file(default_storage.path(job.file_path), file_name=job.file_name,
+                       workers=PARSE_WORKERS, on_batch=save_progress,
+                       timer=StageTimer() if STAGE_TIMING else None)
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import time
+from urllib.parse import parse_qsl
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from sales import benchmark, charts
+from sales.synthetic import write_sales_csv
+
+
+class Command(BaseCommand):
+    help = ("Đo độ trễ API chart-data (p50/p95), số câu SQL và kích thước dữ liệu của từng biểu đồ "
+            "trên dữ liệu giả lập ở một hoặc nhiều quy mô, ghi kết quả ra JSON để so sánh giữa các commit. "
+            "Mỗi quy mô dùng một database benchmark riêng, database đang dùng không bị thay đổi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, action="append", default=None,
+                            help="Số dòng chi tiết đơn hàng, có thể lặp lại để đo nhiều quy mô (mặc định 10000)")
+        parser.add_argument("--seed", type=int, default=0, help="Hạt giống sinh dữ liệu (mặc định 0)")
+        parser.add_argument("--repeat", type=int, default=20, help="Số lần gọi mỗi biểu đồ (mặc định 20)")
+        parser.add_argument("--questions", default="",
+                            help="Danh sách biểu đồ, ví dụ Q1,Q5,Q12 (mặc định tất cả)")
+        parser.add_argument("--params", default="",
+                            help="Tham số query string gửi kèm, ví dụ 'backend=numpy&format=msgpack'")
+        parser.add_argument("--warm", action="store_true",
+                            help="Đo khi kết quả đã có trong cache (mặc định xoá cache trước mỗi lần gọi)")
+        parser.add_argument("--existing", action="store_true",
+                            help="Đo trên database hiện tại thay vì sinh dữ liệu giả lập")
+        parser.add_argument("--output", help="Tệp JSON ghi kết quả")
+        parser.add_argument("--compare", help="Tệp JSON kết quả cũ để so sánh p50")
+
+    def handle(self, *args, **options):
+        questions = [q.strip() for q in options["questions"].split(",") if q.strip()]
+        unknown = [q for q in questions if charts.get_chart(q) is None]
+        if unknown:
+            raise CommandError(f"Không có biểu đồ: {', '.join(unknown)}")
+        if options["repeat"] <= 0:
+            raise CommandError("--repeat phải lớn hơn 0.")
+        params = dict(parse_qsl(options["params"]))
+        baseline = benchmark.read_results(options["compare"]) if options["compare"] else None
+
+        results = {
+            "benchmark": "charts",
+            "environment": benchmark.environment(),
+            "options": {"seed": options["seed"], "repeat": options["repeat"],
+                        "params": params, "warm": options["warm"]},
+            "runs": [],
+        }
+        # Môi trường test: cho phép host "testserver" của test Client
+        setup_test_environment()
+        try:
+            if options["existing"]:
+                results["runs"].append(self._run(None, questions, params, options))
+            else:
+                for rows in options["rows"] or [10_000]:
+                    results["runs"].append(self._run_synthetic(rows, questions, params, options))
+        finally:
+            teardown_test_environment()
+
+        if options["output"]:
+            benchmark.write_results(options["output"], results)
+            self.stdout.write(self.style.SUCCESS(f"Đã ghi kết quả vào {options['output']}"))
+        if baseline is not None:
+            self._compare(baseline, results)
+
+    def _run_synthetic(self, rows, questions, params, options):
+        with tempfile.TemporaryDirectory(prefix="sales-benchmark-") as directory:
+            path = os.path.join(directory, f"sales_{rows}.csv")
+            started = time.perf_counter()
+            write_sales_csv(path, rows, seed=options["seed"])
+            generated = time.perf_counter() - started
+            with benchmark.benchmark_database(directory):
+                ingestor, load_seconds = benchmark.load_csv(path)
+                self.stdout.write(f"{rows:,} dòng: sinh dữ liệu {generated:.1f}s, nạp {load_seconds:.1f}s "
+                                  f"({ingestor.success_count:,} dòng thành công)")
+                run = self._run(rows, questions, params, options)
+                run["load_seconds"] = round(load_seconds, 3)
+                return run
+
+    def _run(self, rows, questions, params, options):
+        run = {"rows": rows, "dataset": benchmark.dataset_size()}
+        run["charts"] = benchmark.chart_latency(questions, options["repeat"], params, options["warm"])
+        for question, stats in run["charts"].items():
+            latency = stats["latency_ms"]
+            self.stdout.write(f"  {question:>4}: p50 {latency['p50']:8.1f} ms  p95 {latency['p95']:8.1f} ms  "
+                              f"{stats['queries']:3d} SQL  {stats['payload_bytes']:>9,} byte")
+        return run
+
+    def _compare(self, baseline, results):
+        old_runs = {run["rows"]: run for run in baseline.get("runs", [])}
+        for run in results["runs"]:
+            old = old_runs.get(run["rows"])
+            if old is None:
+                continue
+            self.stdout.write(f"So sánh p50 với {baseline['environment'].get('commit')} ({run['rows']} dòng):")
+            rows = benchmark.compare(old["charts"], run["charts"], lambda stats: stats["latency_ms"]["p50"])
+            for question, old_p50, new_p50, ratio, regressed in rows:
+                line = f"  {question:>4}: {old_p50:8.1f} -> {new_p50:8.1f} ms"
+                if ratio is not None:
+                    line += f" ({ratio:.2f}x)"
+                self.stdout.write(self.style.ERROR(line) if regressed else line)
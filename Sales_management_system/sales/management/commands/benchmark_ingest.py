@@ -0,0 +1,120 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from sales import benchmark
+from sales.synthetic import write_sales_csv
+
+# Các đường nạp dữ liệu được đo
+INGEST_PATHS = ("upload", "import")
+
+
+class Command(BaseCommand):
+    help = ("Đo tốc độ nạp dữ liệu (dòng/giây), số câu SQL, bộ nhớ (tracemalloc và RSS) và thời gian "
+            "từng giai đoạn (decode, parse, resolve, insert) trên các tệp CSV giả lập nhiều kích thước, "
+            "qua trang Upload (Django test Client) và qua đường nạp ngoại tuyến (import_sales). "
+            "Mỗi lượt dùng một database benchmark trống riêng; kết quả ghi ra JSON để so sánh giữa các commit.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, action="append", default=None,
+                            help="Số dòng của tệp, có thể lặp lại (mặc định 10000 và 100000)")
+        parser.add_argument("--seed", type=int, default=0, help="Hạt giống sinh dữ liệu (mặc định 0)")
+        parser.add_argument("--duplicate-ratio", type=float, default=0.02,
+                            help="Tỉ lệ dòng trùng trong tệp (mặc định 0.02)")
+        parser.add_argument("--invalid-ratio", type=float, default=0.01,
+                            help="Tỉ lệ dòng lỗi trong tệp (mặc định 0.01)")
+        parser.add_argument("--paths", default=",".join(INGEST_PATHS),
+                            help="Các đường nạp cần đo: upload, import (mặc định cả hai)")
+        parser.add_argument("--workers", type=int, default=0,
+                            help="Số tiến trình parse song song của đường import (mặc định 0 = tuần tự)")
+        parser.add_argument("--no-tracemalloc", action="store_true",
+                            help="Không chạy thêm lượt nạp đo đỉnh bộ nhớ Python bằng tracemalloc (chỉ đo RSS)")
+        parser.add_argument("--output", help="Tệp JSON ghi kết quả")
+        parser.add_argument("--compare", help="Tệp JSON kết quả cũ để so sánh thời gian nạp")
+
+    def handle(self, *args, **options):
+        paths = [path.strip() for path in options["paths"].split(",") if path.strip()]
+        unknown = [path for path in paths if path not in INGEST_PATHS]
+        if unknown or not paths:
+            raise CommandError(f"--paths chỉ nhận {', '.join(INGEST_PATHS)}.")
+        if options["duplicate_ratio"] < 0 or options["invalid_ratio"] < 0 \
+                or options["duplicate_ratio"] + options["invalid_ratio"] > 1:
+            raise CommandError("Tỉ lệ dòng trùng và dòng lỗi phải không âm và tổng không vượt quá 1.")
+        baseline = benchmark.read_results(options["compare"]) if options["compare"] else None
+        trace = not options["no_tracemalloc"]
+
+        results = {
+            "benchmark": "ingest",
+            "environment": benchmark.environment(),
+            "options": {"seed": options["seed"], "duplicate_ratio": options["duplicate_ratio"],
+                        "invalid_ratio": options["invalid_ratio"], "workers": options["workers"],
+                        "tracemalloc": trace},
+            "runs": [],
+        }
+        # Môi trường test: cho phép host "testserver" của test Client
+        setup_test_environment()
+        try:
+            for rows in options["rows"] or [10_000, 100_000]:
+                results["runs"].extend(self._run_size(rows, paths, trace, options))
+        finally:
+            teardown_test_environment()
+
+        if options["output"]:
+            benchmark.write_results(options["output"], results)
+            self.stdout.write(self.style.SUCCESS(f"Đã ghi kết quả vào {options['output']}"))
+        if baseline is not None:
+            self._compare(baseline, results)
+
+    def _run_size(self, rows, paths, trace, options):
+        runs = []
+        with tempfile.TemporaryDirectory(prefix="sales-benchmark-") as directory:
+            csv_path = os.path.join(directory, f"sales_{rows}.csv")
+            started = time.perf_counter()
+            write_sales_csv(csv_path, rows, seed=options["seed"],
+                            duplicate_ratio=options["duplicate_ratio"], invalid_ratio=options["invalid_ratio"])
+            self.stdout.write(f"{rows:,} dòng ({os.path.getsize(csv_path) / 2 ** 20:.1f} MiB): "
+                              f"sinh dữ liệu {time.perf_counter() - started:.1f}s")
+
+            for path in paths:
+                run = self._run_path(path, csv_path, directory, options, trace=False)
+                if trace:
+                    # tracemalloc làm code Python chậm đi nhiều lần nên được đo ở một lượt nạp riêng,
+                    # số đo thời gian lấy từ lượt không bật tracemalloc
+                    traced = self._run_path(path, csv_path, directory, options, trace=True)
+                    run["memory"]["tracemalloc_peak_mb"] = traced["memory"]["tracemalloc_peak_mb"]
+                run = {"path": path, "rows": rows, "file_bytes": os.path.getsize(csv_path), **run}
+                runs.append(run)
+                self._report(run)
+        return runs
+
+    def _run_path(self, path, csv_path, directory, options, trace):
+        with benchmark.benchmark_database(directory):
+            if path == "upload":
+                return benchmark.run_upload(csv_path, os.path.join(directory, "media"), trace)
+            return benchmark.run_import(csv_path, options["workers"], trace)
+
+    def _report(self, run):
+        stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in run["stages"].items())
+        memory = run["memory"]
+        tracemalloc_peak = memory.get("tracemalloc_peak_mb")
+        self.stdout.write(
+            f"  {run['path']:>6}: {run['seconds']:.2f}s, {run['rows_per_second']:,.0f} dòng/giây, "
+            f"{run['sql_statements']:,} SQL, bỏ qua {run['skipped_rows']:,} dòng\n"
+            f"          {stages}\n"
+            f"          RSS đỉnh {memory['rss_peak_mb']:.1f} MiB (bắt đầu {memory['rss_start_mb']:.1f} MiB)"
+            + (f", tracemalloc đỉnh {tracemalloc_peak:.1f} MiB" if tracemalloc_peak is not None else "")
+        )
+
+    def _compare(self, baseline, results):
+        key = lambda run: f"{run['path']}:{run['rows']}"
+        old_runs = {key(run): run for run in baseline.get("runs", [])}
+        new_runs = {key(run): run for run in results["runs"]}
+        self.stdout.write(f"So sánh thời gian nạp với {baseline['environment'].get('commit')}:")
+        for name, old, new, ratio, regressed in benchmark.compare(old_runs, new_runs, lambda run: run["seconds"]):
+            line = f"  {name:>16}: {old:8.2f} -> {new:8.2f} s"
+            if ratio is not None:
+                line += f" ({ratio:.2f}x)"
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.synthetic import write_sales_csv
+
+
+class Command(BaseCommand):
+    help = ("Sinh tệp CSV dữ liệu bán hàng giả lập (cùng định dạng cột với trang Upload), "
+            "tất định theo --seed, dùng để đo hiệu năng ở nhiều quy mô.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Đường dẫn tệp CSV sẽ ghi")
+        parser.add_argument("--rows", type=int, default=10_000,
+                            help="Số dòng chi tiết đơn hàng (mặc định 10000, ví dụ 10000 - 10000000)")
+        parser.add_argument("--seed", type=int, default=0, help="Hạt giống ngẫu nhiên (mặc định 0)")
+        parser.add_argument("--customers", type=int, default=None,
+                            help="Số khách hàng (mặc định khoảng 1 khách / 20 dòng)")
+        parser.add_argument("--products-per-category", type=int, default=None,
+                            help="Số mặt hàng mỗi nhóm hàng (mặc định 10 - 99 theo quy mô)")
+        parser.add_argument("--days", type=int, default=365, help="Số ngày dữ liệu trải ra (mặc định 365)")
+        parser.add_argument("--duplicate-ratio", type=float, default=0.0,
+                            help="Tỉ lệ dòng trùng với một dòng trước đó (0 - 1)")
+        parser.add_argument("--invalid-ratio", type=float, default=0.0,
+                            help="Tỉ lệ dòng lỗi sẽ bị bỏ qua khi nạp (0 - 1)")
+
+    def handle(self, *args, **options):
+        if options["rows"] <= 0:
+            raise CommandError("--rows phải lớn hơn 0.")
+        if options["duplicate_ratio"] < 0 or options["invalid_ratio"] < 0 \
+                or options["duplicate_ratio"] + options["invalid_ratio"] > 1:
+            raise CommandError("Tỉ lệ dòng trùng và dòng lỗi phải không âm và tổng không vượt quá 1.")
+
+        started = time.perf_counter()
+        count = write_sales_csv(
+            options["output"], options["rows"],
+            seed=options["seed"],
+            customers=options["customers"],
+            products_per_category=options["products_per_category"],
+            days=options["days"],
+            duplicate_ratio=options["duplicate_ratio"],
+            invalid_ratio=options["invalid_ratio"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã ghi {count:,} dòng vào {options['output']} ({time.perf_counter() - started:.1f}s)"
+        ))
@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales import analytics, snapshot
+from sales.ingest import BATCH_SIZE, ingest_file
+from sales.metrics import peak_rss_mb
+from sales.sqlite_tuning import bulk_load_mode
+
+
+class Command(BaseCommand):
+    help = "Nạp dữ liệu bán hàng từ các tệp CSV (cùng định dạng cột với trang Upload) mà không qua giao diện web."
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", help="Đường dẫn các tệp CSV")
+        parser.add_argument("--workers", type=int, default=0,
+                            help="Số tiến trình parse song song (mặc định 0 = tuần tự)")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                            help=f"Số dòng mỗi lô ghi (mặc định {BATCH_SIZE})")
+        parser.add_argument("--no-bulk-mode", action="store_true",
+                            help="Không chuyển SQLite sang chế độ nạp hàng loạt")
+
+    def handle(self, *args, **options):
+        total_rows = 0
+        skipped_rows = 0
+        started = time.perf_counter()
+
+        if options["no_bulk_mode"]:
+            results = self._import_files(options)
+        else:
+            with bulk_load_mode():
+                results = self._import_files(options)
+
+        for path, ingestor, elapsed in results:
+            total_rows += ingestor.total_rows
+            skipped_rows += ingestor.skipped_rows
+            rate = ingestor.total_rows / elapsed if elapsed > 0 else 0
+            self.stdout.write(
+                f"{path}: {ingestor.success_count} dòng thành công, bỏ qua {ingestor.skipped_rows} dòng "
+                f"({elapsed:.1f}s, {rate:,.0f} dòng/giây)"
+            )
+            if options["verbosity"] >= 2:
+                for error in ingestor.error_details:
+                    self.stderr.write(f"  {error}")
+                if ingestor.hidden_errors:
+                    self.stderr.write(f"  ... và {ingestor.hidden_errors} dòng lỗi khác.")
+
+        elapsed = time.perf_counter() - started
+        rate = total_rows / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Tổng cộng: {total_rows - skipped_rows} dòng thành công, bỏ qua {skipped_rows} dòng "
+            f"trong {elapsed:.1f}s ({rate:,.0f} dòng/giây)"
+        ))
+        # Ghi snapshot dạng cột cho backend numpy
+        if snapshot.SNAPSHOT_DIR:
+            snapshot_started = time.perf_counter()
+            frame = analytics.save_snapshot()
+            self.stdout.write(f"Đã ghi snapshot thế hệ {frame.generation} "
+                              f"({time.perf_counter() - snapshot_started:.1f}s)")
+
+        rss = peak_rss_mb()
+        if rss is not None:
+            self.stdout.write(f"Peak RSS: {rss[0]:.1f} MiB (tiến trình con: {rss[1]:.1f} MiB)")
+
+    def _import_files(self, options):
+        results = []
+        for path in options["files"]:
+            started = time.perf_counter()
+            try:
+                ingestor = ingest_file(path, workers=options["workers"], batch_size=options["batch_size"])
+            except OSError as e:
+                raise CommandError(f"Không đọc được tệp {path}: {e}")
+            results.append((path, ingestor, time.perf_counter() - started))
+        return results
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from sales import rollups
+from sales.models import SalesRollup
+
+
+class Command(BaseCommand):
+    help = "Tính lại bảng tổng hợp doanh số (SalesRollup) từ toàn bộ chi tiết đơn hàng."
+
+    def handle(self, *args, **options):
+        rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Đã tạo {SalesRollup.objects.count()} bucket tổng hợp."))
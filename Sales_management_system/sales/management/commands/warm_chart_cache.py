@@ -0,0 +1,42 @@
+import time
+from urllib.parse import parse_qsl
+
+from django.core.management.base import BaseCommand
+
+from sales import cache as chart_cache
+from sales import warmup
+
+
+class Command(BaseCommand):
+    help = ("Tính sẵn mọi biểu đồ với các bộ tham số mặc định (SALES_WARMUP_PARAM_SETS) và lưu vào cache. "
+            "Cache trong tiến trình mất khi lệnh kết thúc, nên lệnh này dùng với cache dùng chung "
+            "(SALES_CHART_SHARED_CACHE).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--params", action="append", default=None,
+                            help="Bộ tham số dạng query string, có thể lặp lại (ví dụ --params 'format=msgpack')")
+        parser.add_argument("--workers", type=int, default=None,
+                            help=f"Số thread tính song song (mặc định {warmup.WARMUP_WORKERS})")
+
+    def handle(self, *args, **options):
+        if not chart_cache.SHARED_CACHE_ALIAS:
+            self.stderr.write(self.style.WARNING(
+                "Chưa cấu hình SALES_CHART_SHARED_CACHE: kết quả chỉ nằm trong cache của lệnh này."
+            ))
+
+        param_sets = None
+        if options["params"] is not None:
+            param_sets = [dict(parse_qsl(params)) for params in options["params"]]
+
+        started = time.perf_counter()
+        results = warmup.warm_up(param_sets, options["workers"])
+        for questions, params, seconds in results:
+            label = ",".join(questions)
+            if seconds is None:
+                self.stdout.write(f"{label} {params}: bỏ qua (dữ liệu đã thay đổi)")
+            elif options["verbosity"] >= 2:
+                self.stdout.write(f"{label} {params}: {seconds * 1000:.0f} ms")
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã làm nóng cache cho {sum(len(questions) for questions, _, seconds in results if seconds is not None)} "
+            f"biểu đồ trong {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales import analytics, snapshot
+
+
+class Command(BaseCommand):
+    help = "Ghi snapshot dạng cột (.npy) của bảng sự kiện bán hàng để các worker mở bằng mmap."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=None,
+                            help="Thư mục snapshot (mặc định SALES_SNAPSHOT_DIR)")
+
+    def handle(self, *args, **options):
+        directory = options["dir"] or snapshot.SNAPSHOT_DIR
+        if not directory:
+            raise CommandError("Chưa cấu hình SALES_SNAPSHOT_DIR, hãy truyền --dir.")
+
+        started = time.perf_counter()
+        frame = analytics.save_snapshot(directory)
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã ghi snapshot thế hệ {frame.generation} ({len(frame.detail_total)} dòng chi tiết) "
+            f"vào {directory} trong {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,246 @@
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .cache import encode_json
+
+# Số lần tính gần nhất được giữ lại cho mỗi biểu đồ để tính percentile
+WINDOW_SIZE = getattr(settings, "SALES_CHART_METRICS_WINDOW", 500)
+PERCENTILES = (50, 90, 99)
+
+# Các chỉ số của một lần tính biểu đồ
+FIELDS = ("queries", "sql_ms", "python_ms", "encode_ms", "payload_bytes")
+
+
+class QueryTimer:
+    """
+    Đếm số câu SQL và tổng thời gian chạy: dùng làm execute_wrapper của một kết nối, hoặc
+    qua track_queries() để đếm cả các câu chạy ở thread làm việc. Với SQLite phần lớn
+    thời gian của truy vấn GROUP BY nằm trong execute(); thời gian lấy các dòng
+    còn lại (fetch) được tính vào thời gian Python. An toàn đa luồng.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(time.perf_counter() - started)
+
+
+# Các QueryTimer đang đo trong ngữ cảnh hiện tại. sync_to_async / async_to_sync sao chép
+# ContextVar sang thread chạy code thay cho ngữ cảnh (view async, ChartContext.fetch), nên
+# truy vấn chạy trên kết nối riêng của các thread đó cũng được đếm
+active_query_timers = ContextVar("sales_query_timers", default=())
+
+
+def _track_query(execute, sql, params, many, context):
+    timers = active_query_timers.get()
+    if not timers:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        for timer in timers:
+            timer.record(elapsed)
+
+
+def install_query_tracking(connection):
+    """
+    Gắn execute_wrapper đọc active_query_timers vào kết nối (mỗi kết nối một lần, khi được mở:
+    sales/signals.py). Đứng đầu danh sách vì connection.execute_wrapper() gỡ wrapper ở cuối.
+    """
+    if _track_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _track_query)
+
+
+@contextmanager
+def track_queries(timer):
+    """Đếm vào timer mọi câu SQL chạy trong ngữ cảnh hiện tại, ở thread này hay thread làm việc."""
+    install_query_tracking(connection)  # Kết nối đã mở trước khi signal được đăng ký
+    token = active_query_timers.set(active_query_timers.get() + (timer,))
+    try:
+        yield timer
+    finally:
+        active_query_timers.reset(token)
+
+
+class StageTimer:
+    """
+    Cộng dồn thời gian (giây) theo từng giai đoạn xử lý. Giai đoạn lồng nhau chỉ tính
+    thời gian riêng: thời gian của giai đoạn con được trừ khỏi giai đoạn cha.
+    Chỉ dùng trong một thread.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self._children = []  # Tổng thời gian các giai đoạn con của từng giai đoạn đang chạy
+
+    def _start(self):
+        self._children.append(0.0)
+        return time.perf_counter()
+
+    def _stop(self, name, started):
+        elapsed = time.perf_counter() - started
+        self.add(name, elapsed - self._children.pop())
+        if self._children:
+            self._children[-1] += elapsed
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        started = self._start()
+        try:
+            yield
+        finally:
+            self._stop(name, started)
+
+    def timed(self, iterable, name):
+        """Bọc iterable: thời gian lấy từng phần tử được tính vào giai đoạn name."""
+        iterator = iter(iterable)
+        while True:
+            started = self._start()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._stop(name, started)
+            yield item
+
+
+def current_rss_mb():
+    """Bộ nhớ thường trú (RSS) hiện tại của tiến trình (MiB), None nếu không đọc được (chỉ Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def peak_rss_mb():
+    """RSS lớn nhất của tiến trình hiện tại và các tiến trình con (MiB), None nếu không đo được."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux trả về KiB, macOS trả về byte
+    unit = 1 if sys.platform == "darwin" else 1024
+    return usage * unit / 2 ** 20, children * unit / 2 ** 20
+
+
+class ChartMetrics:
+    """Lưu các lần đo gần nhất của từng biểu đồ (an toàn đa luồng)."""
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        self.window_size = window_size
+        self._samples = {}
+        self._computed = {}
+        self._cache_hits = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, sample):
+        with self._lock:
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=self.window_size)
+            self._samples[key].append(tuple(sample[field] for field in FIELDS))
+            self._computed[key] = self._computed.get(key, 0) + 1
+
+    def record_hit(self, key):
+        with self._lock:
+            self._cache_hits[key] = self._cache_hits.get(key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._computed.clear()
+            self._cache_hits.clear()
+
+    def summary(self):
+        """{backend: {biểu đồ: {computed, cache_hits, <chỉ số>: {p50, p90, p99, max}}}}"""
+        with self._lock:
+            samples = {key: np.array(values, dtype=np.float64) for key, values in self._samples.items()}
+            computed = dict(self._computed)
+            cache_hits = dict(self._cache_hits)
+
+        result = {}
+        for key in sorted(set(computed) | set(cache_hits), key=_sort_key):
+            backend, question = key
+            stats = {'computed': computed.get(key, 0), 'cache_hits': cache_hits.get(key, 0)}
+            values = samples.get(key)
+            if values is not None and len(values):
+                for i, field in enumerate(FIELDS):
+                    column = values[:, i]
+                    stats[field] = {f'p{p}': round(float(v), 3) for p, v in zip(PERCENTILES, np.percentile(column, PERCENTILES))}
+                    stats[field]['max'] = round(float(column.max()), 3)
+            result.setdefault(backend, {})[question] = stats
+        return result
+
+
+def _sort_key(key):
+    # Q2 đứng trước Q10
+    backend, question = key
+    digits = question.lstrip('Q')
+    return backend, int(digits) if digits.isdigit() else float('inf'), question
+
+
+chart_metrics = ChartMetrics()
+
+# StageTimer của request đang được đo (Server-Timing, sales/middleware.py), None nếu không đo:
+# measure() cộng thêm thời gian tính ("compute") và mã hoá ("serialize") vào đây
+request_stages = ContextVar("sales_request_stages", default=None)
+
+
+def measure(key, compute, encode=encode_json):
+    """
+    Chạy compute(), mã hoá kết quả bằng encode (mặc định JSON, bytes) và ghi lại số câu SQL,
+    thời gian SQL, thời gian xử lý Python, thời gian mã hoá và kích thước dữ liệu đã mã hoá.
+    key = (backend, tên biểu đồ).
+    """
+    timer = QueryTimer()
+    started = time.perf_counter()
+    with track_queries(timer):
+        result = compute()
+    computed = time.perf_counter()
+    payload = encode(result)
+    encoded = time.perf_counter()
+
+    python_seconds = max(computed - started - timer.seconds, 0)
+    stages = request_stages.get()
+    if stages is not None:
+        stages.add('compute', python_seconds)
+        stages.add('serialize', encoded - computed)
+
+    chart_metrics.record(key, {
+        'queries': timer.count,
+        'sql_ms': timer.seconds * 1000,
+        'python_ms': python_seconds * 1000,
+        'encode_ms': (encoded - computed) * 1000,
+        'payload_bytes': len(payload),
+    })
+    return payload
@@ -0,0 +1,208 @@
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+from . import metrics
+from .metrics import QueryTimer, StageTimer
+
+# Các đường dẫn (tiền tố) được gắn header Server-Timing
+SERVER_TIMING_PATHS = tuple(getattr(settings, "SALES_SERVER_TIMING_PATHS", ("/api/chart-data/", "/api/async/chart-data/")))
+# Khoảng lấy mẫu call stack khi profile dạng flame graph (giây)
+PROFILE_SAMPLE_INTERVAL = getattr(settings, "SALES_PROFILE_SAMPLE_INTERVAL", 0.002)
+# Số hàm được liệt kê trong bản tóm tắt cProfile
+PROFILE_TOP_FUNCTIONS = 30
+# Giá trị tham số ?profile= -> chế độ profile
+PROFILE_MODES = {"1": "cprofile", "cprofile": "cprofile", "flame": "flame"}
+
+# Mỗi lúc chỉ profile một request: các request khác nhận lỗi 429 thay vì chờ
+_profile_lock = threading.Lock()
+
+
+def server_timing(stages, queries, seconds):
+    """
+    Giá trị header Server-Timing (ms): db (tổng thời gian SQL, kèm số câu), compute (xử lý Python
+    khi tính biểu đồ), serialize (mã hoá dữ liệu) và total (toàn bộ thời gian xử lý request).
+    """
+    def metric(name, value, description=None):
+        text = f"{name};dur={value * 1000:.1f}"
+        return f'{text};desc="{description}"' if description else text
+
+    return ", ".join([
+        metric("db", queries.seconds, f"{queries.count} queries"),
+        metric("compute", stages.seconds.get("compute", 0.0)),
+        metric("serialize", stages.seconds.get("serialize", 0.0)),
+        metric("total", seconds),
+    ])
+
+
+def _short_path(filename):
+    # Đường dẫn tương đối theo thư mục dự án / sys.path cho gọn
+    for base in sorted([str(settings.BASE_DIR)] + [path for path in sys.path if path], key=len, reverse=True):
+        if filename.startswith(base + os.sep):
+            return filename[len(base) + 1:]
+    return filename
+
+
+def cprofile_summary(profiler, limit=PROFILE_TOP_FUNCTIONS):
+    """Tóm tắt kết quả cProfile: limit hàm tốn nhiều thời gian nhất theo thời gian tích luỹ và thời gian riêng (ms)."""
+    stats = pstats.Stats(profiler)
+    rows = [
+        {
+            "function": f"{_short_path(filename)}:{line}({name})",
+            "calls": calls,
+            "primitive_calls": primitive_calls,
+            "own_ms": round(own * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3),
+        }
+        for (filename, line, name), (primitive_calls, calls, own, cumulative, _) in stats.stats.items()
+    ]
+    return {
+        "total_ms": round(stats.total_tt * 1000, 3),
+        "by_cumulative": sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:limit],
+        "by_own": sorted(rows, key=lambda row: row["own_ms"], reverse=True)[:limit],
+    }
+
+
+class CallStackSampler:
+    """
+    Lấy mẫu call stack của một thread định kỳ bằng thread nền (ít ảnh hưởng tới thời gian chạy
+    hơn cProfile). Kết quả dạng folded: mỗi dòng "hàm;hàm;...;hàm số_mẫu", đầu vào của
+    flamegraph.pl hoặc speedscope.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sales-profile-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ServerTimingMiddleware:
+    """
+    Gắn header Server-Timing (db, compute, serialize, total) vào response của API dữ liệu biểu đồ
+    để xem thời gian từng phần trong tab Network của devtools. Nhân viên (is_staff) thêm
+    ?profile=1 để nhận bản tóm tắt cProfile của request thay cho dữ liệu, hoặc ?profile=flame
+    để nhận call stack lấy mẫu dạng folded. Request được profile luôn tính lại dữ liệu.
+    Chạy được cả đồng bộ (WSGI) lẫn bất đồng bộ (ASGI) mà không chuyển chuỗi middleware về
+    đồng bộ. Phải đứng sau AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not request.path.startswith(SERVER_TIMING_PATHS):
+            return self.get_response(request)
+
+        mode = PROFILE_MODES.get(request.GET.get("profile", ""))
+        if mode is not None and request.user.is_staff:
+            return self._profile(request, mode)
+
+        response, header = self._timed(request)
+        response["Server-Timing"] = header
+        return response
+
+    async def __acall__(self, request):
+        if not request.path.startswith(SERVER_TIMING_PATHS):
+            return await self.get_response(request)
+
+        mode = PROFILE_MODES.get(request.GET.get("profile", ""))
+        if mode is not None and (await request.auser()).is_staff:
+            # Profile trong một thread riêng: phần đồng bộ của view (sync_to_async thread_sensitive)
+            # chạy trên chính thread đó nên được cProfile / bộ lấy mẫu ghi nhận
+            return await sync_to_async(self._profile)(request, mode)
+
+        stages, queries = StageTimer(), QueryTimer()
+        token = metrics.request_stages.set(stages)
+        started = time.perf_counter()
+        try:
+            # ContextVar được sao chép sang các thread chạy code đồng bộ của view
+            with metrics.track_queries(queries):
+                response = await self.get_response(request)
+        finally:
+            metrics.request_stages.reset(token)
+        response["Server-Timing"] = server_timing(stages, queries, time.perf_counter() - started)
+        return response
+
+    def _timed(self, request):
+        stages, queries = StageTimer(), QueryTimer()
+        token = metrics.request_stages.set(stages)
+        started = time.perf_counter()
+        try:
+            with metrics.track_queries(queries):
+                if self.async_mode:
+                    response = async_to_sync(self.get_response)(request)
+                else:
+                    response = self.get_response(request)
+        finally:
+            metrics.request_stages.reset(token)
+        return response, server_timing(stages, queries, time.perf_counter() - started)
+
+    def _profile(self, request, mode):
+        if not _profile_lock.acquire(blocking=False):
+            return JsonResponse({'error': 'Đang profile một request khác, vui lòng thử lại sau.'}, status=429)
+        try:
+            # Bỏ header điều kiện để không nhận 304, view bỏ qua cache khi thấy request.sales_profile
+            request.sales_profile = mode
+            request.META.pop("HTTP_IF_NONE_MATCH", None)
+            request.META.pop("HTTP_IF_MODIFIED_SINCE", None)
+
+            profiler = CallStackSampler(threading.get_ident()) if mode == "flame" else cProfile.Profile()
+            profiler.enable()
+            try:
+                response, header = self._timed(request)
+            finally:
+                profiler.disable()
+        finally:
+            _profile_lock.release()
+
+        if mode == "flame":
+            result = HttpResponse(profiler.folded(), content_type="text/plain; charset=utf-8")
+        else:
+            result = JsonResponse({
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'server_timing': header,
+                'profile': cprofile_summary(profiler),
+            })
+        result["Server-Timing"] = header
+        result["Cache-Control"] = "no-store"
+        return result
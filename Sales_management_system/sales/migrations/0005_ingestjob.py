@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_category_segment_remove_customer_segment_code_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_path', models.CharField(max_length=500)),
+                ('state', models.CharField(choices=[('pending', 'Đang chờ'), ('running', 'Đang xử lý'), ('done', 'Hoàn thành'), ('failed', 'Lỗi')], default='pending', max_length=10)),
+                ('rows_processed', models.IntegerField(default=0)),
+                ('rows_skipped', models.IntegerField(default=0)),
+                ('message', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0005_ingestjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('file_name', models.CharField(max_length=255)),
+                ('total_rows', models.IntegerField()),
+                ('skipped_rows', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RowFingerprint',
+            fields=[
+                ('fingerprint', models.BigIntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+    ]
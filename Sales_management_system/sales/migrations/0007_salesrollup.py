@@ -0,0 +1,63 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    # Tính bảng tổng hợp cho dữ liệu đã có trước migration này
+    OrderDetail = apps.get_model('sales', 'OrderDetail')
+    SalesRollup = apps.get_model('sales', 'SalesRollup')
+    buckets = OrderDetail.objects.annotate(
+        date=TruncDate('order__created_at'),
+        hour=ExtractHour('order__created_at'),
+    ).values(
+        'date', 'hour', 'product_id', 'product__category_id', 'order__customer__segment_id'
+    ).annotate(
+        revenue=Sum('total'),
+        quantity=Sum('quantity'),
+        order_count=Count('order', distinct=True),
+    ).order_by()
+    SalesRollup.objects.bulk_create([
+        SalesRollup(
+            date=item['date'],
+            hour=item['hour'],
+            product_id=item['product_id'],
+            category_id=item['product__category_id'],
+            segment_id=item['order__customer__segment_id'],
+            revenue=item['revenue'],
+            quantity=item['quantity'],
+            order_count=item['order_count'],
+        )
+        for item in buckets
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0006_ingest_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('revenue', models.BigIntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('order_count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='sales.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sales.product')),
+                ('segment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='sales.segment')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'hour', 'product', 'category', 'segment'), name='sales_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def create_initial_version(apps, schema_editor):
+    # Dữ liệu đã có trước migration này được coi là thế hệ 1, để Last-Modified luôn có giá trị
+    DatasetVersion = apps.get_model('sales', 'DatasetVersion')
+    DatasetVersion.objects.get_or_create(pk=1, defaults={'generation': 1, 'updated_at': timezone.now()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0008_datasetversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_initial_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0009_initial_dataset_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='local_date',
+            field=models.DateField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='year',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='month',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='day',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='weekday',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='hour',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='SalesCalendar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('day', models.PositiveSmallIntegerField()),
+                ('weekday', models.PositiveSmallIntegerField()),
+                ('order_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'hour'), name='sales_calendar_slot')],
+            },
+        ),
+    ]
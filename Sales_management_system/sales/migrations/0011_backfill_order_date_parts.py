@@ -0,0 +1,55 @@
+from collections import Counter
+
+from django.db import migrations
+from django.utils import timezone
+
+BATCH_SIZE = 2000
+
+
+def backfill_date_parts(apps, schema_editor):
+    # Tính các phần ngày giờ địa phương cho đơn hàng đã có và dựng lịch bán hàng
+    Order = apps.get_model('sales', 'Order')
+    SalesCalendar = apps.get_model('sales', 'SalesCalendar')
+    connection = schema_editor.connection
+    qn = connection.ops.quote_name
+    tz = timezone.get_default_timezone()
+
+    # UPDATE theo id bằng executemany (bulk_update sinh CASE WHEN rất chậm với nhiều dòng)
+    columns = ['local_date', 'year', 'month', 'day', 'weekday', 'hour']
+    sql = (
+        f"UPDATE {qn(Order._meta.db_table)} SET {', '.join(f'{qn(c)} = %s' for c in columns)} "
+        f"WHERE {qn('id')} = %s"
+    )
+
+    slots = Counter()
+    params = []
+    with connection.cursor() as cursor:
+        for pk, created_at in Order.objects.values_list('id', 'created_at').iterator(chunk_size=BATCH_SIZE):
+            if timezone.is_aware(created_at):
+                created_at = timezone.localtime(created_at, tz)
+            date, hour, weekday = created_at.date(), created_at.hour, created_at.isoweekday() % 7 + 1
+            slots[(date, hour, weekday)] += 1
+            params.append((connection.ops.adapt_datefield_value(date), created_at.year, created_at.month,
+                           created_at.day, weekday, hour, pk))
+            if len(params) >= BATCH_SIZE:
+                cursor.executemany(sql, params)
+                params = []
+        if params:
+            cursor.executemany(sql, params)
+
+    SalesCalendar.objects.bulk_create([
+        SalesCalendar(date=date, hour=hour, year=date.year, month=date.month, day=date.day,
+                      weekday=weekday, order_count=count)
+        for (date, hour, weekday), count in slots.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0010_order_date_parts'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_date_parts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0011_backfill_order_date_parts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='local_date',
+            field=models.DateField(db_index=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='year',
+            field=models.PositiveSmallIntegerField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='month',
+            field=models.PositiveSmallIntegerField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='day',
+            field=models.PositiveSmallIntegerField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='weekday',
+            field=models.PositiveSmallIntegerField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='hour',
+            field=models.PositiveSmallIntegerField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['year', 'month'], name='sales_order_year_month'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['hour'], name='sales_order_hour'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+
+def remove_duplicate_details(apps, schema_editor):
+    # Luồng nạp dữ liệu đã chặn cặp (order, product) trùng, nhưng dữ liệu sửa tay
+    # có thể còn sót: giữ dòng đầu tiên để tạo được ràng buộc UNIQUE.
+    OrderDetail = apps.get_model('sales', 'OrderDetail')
+    qn = schema_editor.connection.ops.quote_name
+    table = qn(OrderDetail._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {qn('id')} NOT IN ("
+            f"SELECT MIN({qn('id')}) FROM {table} GROUP BY {qn('order_id')}, {qn('product_id')})"
+        )
+        deleted = cursor.rowcount
+    if deleted > 0:
+        rebuild_rollups(apps)
+
+
+def rebuild_rollups(apps):
+    # Bảng tổng hợp vẫn còn cộng các dòng vừa xoá: tính lại từ dữ liệu còn lại và tăng
+    # thế hệ dữ liệu để cache biểu đồ cũ không còn được dùng (lịch bán hàng đếm đơn hàng, không đổi)
+    OrderDetail = apps.get_model('sales', 'OrderDetail')
+    SalesRollup = apps.get_model('sales', 'SalesRollup')
+    DatasetVersion = apps.get_model('sales', 'DatasetVersion')
+    buckets = OrderDetail.objects.values_list(
+        'order__local_date', 'order__hour', 'product_id', 'product__category_id', 'order__customer__segment_id'
+    ).annotate(
+        revenue=Sum('total'),
+        quantity=Sum('quantity'),
+        order_count=Count('order', distinct=True),
+    ).order_by()
+    SalesRollup.objects.all().delete()
+    SalesRollup.objects.bulk_create((
+        SalesRollup(date=date, hour=hour, product_id=product_id, category_id=category_id, segment_id=segment_id,
+                    revenue=revenue, quantity=quantity, order_count=order_count)
+        for date, hour, product_id, category_id, segment_id, revenue, quantity, order_count in buckets.iterator()
+    ), batch_size=500)
+    DatasetVersion.objects.filter(pk=1).update(generation=F('generation') + 1, updated_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0012_order_date_parts_not_null'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_details, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'created_at'], name='sales_order_customer_created'),
+        ),
+        migrations.AddIndex(
+            model_name='orderdetail',
+            index=models.Index(fields=['product', 'total'], name='sales_detail_product_total'),
+        ),
+        migrations.AddIndex(
+            model_name='orderdetail',
+            index=models.Index(fields=['order', 'total'], name='sales_detail_order_total'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderdetail',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='sales_orderdetail_order_product'),
+        ),
+        # Chỉ mục riêng của các khoá ngoại trở nên thừa sau khi có các chỉ mục ghép ở trên
+        migrations.AlterField(
+            model_name='order',
+            name='customer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='sales.customer'),
+        ),
+        migrations.AlterField(
+            model_name='orderdetail',
+            name='order',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='sales.order'),
+        ),
+        migrations.AlterField(
+            model_name='orderdetail',
+            name='product',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='sales.product'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+def analyze(apps, schema_editor):
+    # Thu thập thống kê cho các chỉ mục ghép mới để SQLite chọn đúng chỉ mục khi lọc theo ngày
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0013_orderdetail_unique_covering_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(analyze, migrations.RunPython.noop),
+    ]
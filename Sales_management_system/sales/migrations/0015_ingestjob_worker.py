@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0014_refresh_planner_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='worker',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0015_ingestjob_worker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DroppedIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('sql', models.TextField()),
+                ('worker', models.CharField(max_length=100)),
+                ('dropped_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
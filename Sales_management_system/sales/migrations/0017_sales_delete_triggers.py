@@ -0,0 +1,72 @@
+from django.db import migrations
+
+# Trigger SQLite giữ bảng tổng hợp, lịch bán hàng, sổ cái tệp và thế hệ dữ liệu khớp với dữ liệu
+# khi chi tiết / đơn hàng bị xoá (qua ORM, xoá dây chuyền hay SQL trực tiếp). Không dùng signal
+# post_delete: signal buộc Django nạp và xoá từng bản ghi thay vì một câu DELETE.
+# Mỗi dòng bị xoá được trừ khỏi đúng bucket của nó; bucket / khung giờ về 0 thì bị xoá.
+# SQLite dựng lại bảng khi đổi cấu trúc: migration sau này sửa các bảng được tham chiếu ở đây phải
+# bỏ trigger trước và tạo lại sau (xem 0018).
+
+BUMP_GENERATION = """
+    INSERT OR IGNORE INTO sales_datasetversion (id, generation, updated_at) VALUES (1, 0, NULL);
+    UPDATE sales_datasetversion
+       SET generation = generation + 1, updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+     WHERE id = 1;
+"""
+
+# Bucket của chi tiết vừa xoá: (ngày, giờ) của đơn hàng, nhóm hàng của mặt hàng, phân khúc của khách hàng
+DETAIL_BUCKET = """
+        (date, hour) = (SELECT local_date, hour FROM sales_order WHERE id = OLD.order_id)
+    AND product_id = OLD.product_id
+    AND category_id IS (SELECT category_id FROM sales_product WHERE id = OLD.product_id)
+    AND segment_id IS (SELECT c.segment_id FROM sales_order o JOIN sales_customer c ON c.id = o.customer_id
+                        WHERE o.id = OLD.order_id)
+"""
+
+TRIGGERS = {
+    "sales_orderdetail_after_delete": f"""
+        CREATE TRIGGER sales_orderdetail_after_delete AFTER DELETE ON sales_orderdetail BEGIN
+            UPDATE sales_salesrollup
+               SET revenue = revenue - OLD.total, quantity = quantity - OLD.quantity, order_count = order_count - 1
+             WHERE {DETAIL_BUCKET};
+            DELETE FROM sales_salesrollup WHERE order_count <= 0 AND {DETAIL_BUCKET};
+            -- Tệp đã nạp không còn đủ dữ liệu trong database: cho phép nạp lại
+            DELETE FROM sales_ingestedfile;
+            {BUMP_GENERATION}
+        END
+    """,
+    "sales_order_after_delete": f"""
+        CREATE TRIGGER sales_order_after_delete AFTER DELETE ON sales_order BEGIN
+            UPDATE sales_salescalendar SET order_count = order_count - 1
+             WHERE date = OLD.local_date AND hour = OLD.hour;
+            DELETE FROM sales_salescalendar
+             WHERE date = OLD.local_date AND hour = OLD.hour AND order_count <= 0;
+            {BUMP_GENERATION}
+        END
+    """,
+}
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in TRIGGERS.values():
+        schema_editor.execute(sql)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0016_droppedindex'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,139 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:00
+
+from importlib import import_module
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+# SQLite không dựng lại được bảng sales_salesrollup khi trigger xoá dữ liệu của 0017 còn tham chiếu tới
+# nó: bỏ các trigger đó trước khi đổi ràng buộc và tạo lại sau
+delete_triggers = import_module('sales.migrations.0017_sales_delete_triggers')
+
+BUCKET_FIELDS = ['date', 'hour', 'product_id', 'category_id', 'segment_id']
+
+
+def merge_null_buckets(apps, schema_editor):
+    # Ràng buộc cũ coi NULL là khác nhau nên bucket không có nhóm hàng / phân khúc có thể bị tách
+    # thành nhiều dòng: gộp chúng vào dòng đầu tiên (GROUP BY coi các NULL là bằng nhau).
+    SalesRollup = apps.get_model('sales', 'SalesRollup')
+    duplicates = SalesRollup.objects.values(*BUCKET_FIELDS).annotate(
+        rows=Count('id'), total_revenue=Sum('revenue'), total_quantity=Sum('quantity'),
+        total_order_count=Sum('order_count'),
+    ).filter(rows__gt=1).order_by()
+    for bucket in duplicates:
+        ids = list(SalesRollup.objects.filter(**{field: bucket[field] for field in BUCKET_FIELDS})
+                   .order_by('id').values_list('id', flat=True))
+        SalesRollup.objects.filter(id=ids[0]).update(
+            revenue=bucket['total_revenue'], quantity=bucket['total_quantity'],
+            order_count=bucket['total_order_count'],
+        )
+        SalesRollup.objects.filter(id__in=ids[1:]).delete()
+
+
+# Khoá bucket dùng trong ON CONFLICT, phải trùng với biểu thức của index sales_rollup_bucket
+BUCKET_KEY = 'date, hour, product_id, COALESCE(category_id, 0), COALESCE(segment_id, 0)'
+ROLLUP_COLUMNS = 'date, hour, product_id, category_id, segment_id, revenue, quantity, order_count'
+MERGE_MEASURES = f"""
+    ON CONFLICT ({BUCKET_KEY}) DO UPDATE SET
+        revenue = revenue + excluded.revenue,
+        quantity = quantity + excluded.quantity,
+        order_count = order_count + excluded.order_count
+"""
+
+BUMP_GENERATION = """
+    INSERT OR IGNORE INTO sales_datasetversion (id, generation, updated_at) VALUES (1, 0, NULL);
+    UPDATE sales_datasetversion
+       SET generation = generation + 1, updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+     WHERE id = 1;
+"""
+
+
+def customer_buckets(sign, segment):
+    # Các bucket của mọi chi tiết thuộc khách hàng, đặt dưới phân khúc segment, nhân với sign.
+    # Cặp (đơn hàng, mặt hàng) là duy nhất nên số chi tiết trong bucket bằng số đơn hàng.
+    return f"""
+        INSERT INTO sales_salesrollup ({ROLLUP_COLUMNS})
+        SELECT o.local_date, o.hour, d.product_id, p.category_id, {segment},
+               {sign} * SUM(d.total), {sign} * SUM(d.quantity), {sign} * COUNT(*)
+          FROM sales_orderdetail d
+          JOIN sales_order o ON o.id = d.order_id
+          JOIN sales_product p ON p.id = d.product_id
+         WHERE o.customer_id = NEW.id
+         GROUP BY o.local_date, o.hour, d.product_id, p.category_id
+        {MERGE_MEASURES};
+    """
+
+
+# Đổi nhóm hàng của mặt hàng / phân khúc của khách hàng (kể cả khi Django đặt NULL lúc xoá nhóm hàng,
+# phân khúc): chuyển các bucket tương ứng sang khoá mới, gộp với bucket đã có
+TRIGGERS = {
+    "sales_product_after_update_category": f"""
+        CREATE TRIGGER sales_product_after_update_category AFTER UPDATE OF category_id ON sales_product
+        WHEN OLD.category_id IS NOT NEW.category_id BEGIN
+            INSERT INTO sales_salesrollup ({ROLLUP_COLUMNS})
+            SELECT date, hour, product_id, NEW.category_id, segment_id, revenue, quantity, order_count
+              FROM sales_salesrollup
+             WHERE product_id = NEW.id AND category_id IS OLD.category_id
+            {MERGE_MEASURES};
+            DELETE FROM sales_salesrollup WHERE product_id = NEW.id AND category_id IS OLD.category_id;
+            {BUMP_GENERATION}
+        END
+    """,
+    "sales_customer_after_update_segment": f"""
+        CREATE TRIGGER sales_customer_after_update_segment AFTER UPDATE OF segment_id ON sales_customer
+        WHEN OLD.segment_id IS NOT NEW.segment_id BEGIN
+            {customer_buckets(-1, 'OLD.segment_id')}
+            {customer_buckets(1, 'NEW.segment_id')}
+            DELETE FROM sales_salesrollup WHERE segment_id IS OLD.segment_id AND order_count <= 0;
+            {BUMP_GENERATION}
+        END
+    """,
+}
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in TRIGGERS.values():
+        schema_editor.execute(sql)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0017_sales_delete_triggers'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_null_buckets, migrations.RunPython.noop),
+        migrations.RunPython(delete_triggers.drop_triggers, delete_triggers.create_triggers),
+        migrations.RemoveConstraint(
+            model_name='salesrollup',
+            name='sales_rollup_bucket',
+        ),
+        migrations.AlterField(
+            model_name='salesrollup',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='sales.category'),
+        ),
+        migrations.AlterField(
+            model_name='salesrollup',
+            name='segment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='sales.segment'),
+        ),
+        migrations.AddConstraint(
+            model_name='salesrollup',
+            constraint=models.UniqueConstraint(models.F('date'), models.F('hour'), models.F('product'), django.db.models.functions.comparison.Coalesce('category', models.Value(0)), django.db.models.functions.comparison.Coalesce('segment', models.Value(0)), name='sales_rollup_bucket'),
+        ),
+        migrations.RunPython(delete_triggers.create_triggers, delete_triggers.drop_triggers),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 # 1. Bảng Phân khúc khách hàng (Segment)
 class Segment(models.Model):
@@ -39,20 +42,64 @@ class Product(models.Model):
 # 5. Bảng Đơn hàng (Order)
 class Order(models.Model):
     order_code = models.CharField(max_length=20, unique=True)  # Mã đơn hàng
-    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)  # Khách hàng
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, db_index=False)  # Khách hàng (chỉ mục ở Meta)
     created_at = models.DateTimeField()  # Thời gian tạo đơn
+    # Các phần ngày giờ theo giờ địa phương (TIME_ZONE), tính sẵn từ created_at khi lưu
+    # để các biểu đồ group by trên cột thay vì trích xuất từng dòng
+    local_date = models.DateField(editable=False, db_index=True)  # Ngày
+    year = models.PositiveSmallIntegerField(editable=False)  # Năm
+    month = models.PositiveSmallIntegerField(editable=False)  # Tháng
+    day = models.PositiveSmallIntegerField(editable=False)  # Ngày trong tháng
+    weekday = models.PositiveSmallIntegerField(editable=False)  # Thứ: 1 = Chủ Nhật ... 7 = Thứ Bảy (như ExtractWeekDay)
+    hour = models.PositiveSmallIntegerField(editable=False)  # Giờ
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['year', 'month'], name='sales_order_year_month'),
+            models.Index(fields=['hour'], name='sales_order_hour'),
+            # Đơn hàng của một khách hàng theo thời gian (thay cho chỉ mục riêng của customer_id)
+            models.Index(fields=['customer', 'created_at'], name='sales_order_customer_created'),
+        ]
+
+    # (local_date, year, month, day, weekday, hour) theo giờ địa phương của created_at
+    @staticmethod
+    def date_parts(created_at):
+        if timezone.is_aware(created_at):
+            created_at = timezone.localtime(created_at, timezone.get_default_timezone())
+        return (created_at.date(), created_at.year, created_at.month, created_at.day,
+                created_at.isoweekday() % 7 + 1, created_at.hour)
+
+    # Tự động tính các phần ngày giờ khi lưu (bulk_create cần gọi fill_date_parts trước)
+    def fill_date_parts(self):
+        self.local_date, self.year, self.month, self.day, self.weekday, self.hour = self.date_parts(self.created_at)
+
+    def save(self, *args, **kwargs):
+        self.fill_date_parts()
+        super(Order, self).save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.order_code} - {self.customer.name}"
 
 # 6. Bảng Chi tiết đơn hàng (OrderDetail)
 class OrderDetail(models.Model):
-    order = models.ForeignKey(Order, on_delete=models.CASCADE)  # Mã đơn hàng
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)  # Mã mặt hàng
+    # Các khoá ngoại không cần chỉ mục riêng: chúng là cột đầu của các chỉ mục ở Meta
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, db_index=False)  # Mã đơn hàng
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=False)  # Mã mặt hàng
     quantity = models.IntegerField()  # Số lượng
     price = models.IntegerField()  # Đơn giá
     total = models.IntegerField()  # Thành tiền
 
+    class Meta:
+        constraints = [
+            # Mỗi mặt hàng chỉ xuất hiện một lần trong một đơn hàng
+            models.UniqueConstraint(fields=['order', 'product'], name='sales_orderdetail_order_product'),
+        ]
+        indexes = [
+            # Chỉ mục bao phủ: cộng total theo mặt hàng / theo đơn hàng không cần đọc bảng
+            models.Index(fields=['product', 'total'], name='sales_detail_product_total'),
+            models.Index(fields=['order', 'total'], name='sales_detail_order_total'),
+        ]
+
     # Tự động tính total khi lưu
     def save(self, *args, **kwargs):
         self.total = self.quantity * self.price
@@ -60,3 +107,124 @@ class OrderDetail(models.Model):
 
     def __str__(self):
         return f"{self.order.order_code} - {self.product.product_name} x {self.quantity}"
+
+# 7. Bảng Tiến trình nạp dữ liệu (IngestJob)
+class IngestJob(models.Model):
+    STATE_PENDING = "pending"
+    STATE_RUNNING = "running"
+    STATE_DONE = "done"
+    STATE_FAILED = "failed"
+    STATE_CHOICES = [
+        (STATE_PENDING, "Đang chờ"),
+        (STATE_RUNNING, "Đang xử lý"),
+        (STATE_DONE, "Hoàn thành"),
+        (STATE_FAILED, "Lỗi"),
+    ]
+
+    file_name = models.CharField(max_length=255)  # Tên tệp gốc
+    file_path = models.CharField(max_length=500)  # Đường dẫn tệp đã lưu trong MEDIA_ROOT
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=STATE_PENDING)  # Trạng thái
+    rows_processed = models.IntegerField(default=0)  # Số dòng đã xử lý
+    rows_skipped = models.IntegerField(default=0)  # Số dòng bị bỏ qua
+    message = models.TextField(blank=True, default="")  # Thông báo kết quả / lỗi
+    created_at = models.DateTimeField(auto_now_add=True)  # Thời gian tải lên
+    started_at = models.DateTimeField(null=True, blank=True)  # Thời gian bắt đầu xử lý
+    finished_at = models.DateTimeField(null=True, blank=True)  # Thời gian kết thúc
+    worker = models.CharField(max_length=100, blank=True, default="")  # Tiến trình xếp hàng và xử lý job
+
+    def __str__(self):
+        return f"#{self.pk} {self.file_name} ({self.state})"
+
+    def to_dict(self):
+        return {
+            'id': self.pk,
+            'file_name': self.file_name,
+            'state': self.state,
+            'rows_processed': self.rows_processed,
+            'rows_skipped': self.rows_skipped,
+            'message': self.message,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+# 8. Sổ cái các tệp đã nạp (IngestedFile)
+class IngestedFile(models.Model):
+    content_hash = models.CharField(max_length=64, unique=True)  # SHA-256 nội dung tệp
+    file_name = models.CharField(max_length=255)  # Tên tệp lần nạp đầu tiên
+    total_rows = models.IntegerField()  # Tổng số dòng
+    skipped_rows = models.IntegerField()  # Số dòng bị bỏ qua
+    created_at = models.DateTimeField(auto_now_add=True)  # Thời gian nạp
+
+    def __str__(self):
+        return f"{self.file_name} ({self.content_hash[:12]})"
+
+# 9. Dấu vân tay các dòng đã nạp thành công (RowFingerprint)
+class RowFingerprint(models.Model):
+    # Hash 64 bit của (mã đơn hàng, mã mặt hàng, số lượng, đơn giá)
+    fingerprint = models.BigIntegerField(primary_key=True)
+
+# 10. Bảng tổng hợp doanh số theo giờ (SalesRollup), được cập nhật dần khi nạp dữ liệu
+class SalesRollup(models.Model):
+    date = models.DateField()  # Ngày tạo đơn (giờ địa phương)
+    hour = models.PositiveSmallIntegerField()  # Giờ tạo đơn (giờ địa phương)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)  # Mặt hàng
+    # Xoá nhóm hàng / phân khúc: Django đặt NULL ở mặt hàng / khách hàng, trigger SQLite (migration 0018)
+    # chuyển các bucket tương ứng sang nhóm hàng / phân khúc NULL
+    category = models.ForeignKey(Category, on_delete=models.DO_NOTHING, null=True, blank=True)  # Nhóm hàng
+    segment = models.ForeignKey(Segment, on_delete=models.DO_NOTHING, null=True, blank=True)  # Phân khúc
+    revenue = models.BigIntegerField(default=0)  # Tổng thành tiền
+    quantity = models.BigIntegerField(default=0)  # Tổng số lượng
+    order_count = models.IntegerField(default=0)  # Số đơn hàng khác nhau chứa mặt hàng
+
+    class Meta:
+        constraints = [
+            # NULL được coi là khác nhau trong index UNIQUE: so khoá với NULL thay bằng 0 để các bucket
+            # không có nhóm hàng / phân khúc vẫn được gộp khi cộng dồn
+            models.UniqueConstraint(
+                F('date'), F('hour'), F('product'), Coalesce('category', Value(0)), Coalesce('segment', Value(0)),
+                name='sales_rollup_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.hour}h - {self.product_id}: {self.revenue}"
+
+# 11. Phiên bản dữ liệu (DatasetVersion): tăng mỗi khi dữ liệu bán hàng thay đổi
+class DatasetVersion(models.Model):
+    generation = models.BigIntegerField(default=0)  # Số thế hệ dữ liệu
+    updated_at = models.DateTimeField(null=True, blank=True)  # Lần thay đổi gần nhất
+
+    def __str__(self):
+        return f"Generation {self.generation} ({self.updated_at})"
+
+# 12. Lịch bán hàng (SalesCalendar): mỗi (ngày, giờ) địa phương có đơn hàng là một dòng,
+# dùng làm mẫu số "số ngày / số tháng có giao dịch" cho các biểu đồ theo thời gian
+class SalesCalendar(models.Model):
+    date = models.DateField()  # Ngày (giờ địa phương)
+    hour = models.PositiveSmallIntegerField()  # Giờ
+    year = models.PositiveSmallIntegerField()  # Năm
+    month = models.PositiveSmallIntegerField()  # Tháng
+    day = models.PositiveSmallIntegerField()  # Ngày trong tháng
+    weekday = models.PositiveSmallIntegerField()  # Thứ: 1 = Chủ Nhật ... 7 = Thứ Bảy
+    order_count = models.IntegerField(default=0)  # Số đơn hàng trong khung giờ
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'hour'], name='sales_calendar_slot'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.hour}h: {self.order_count}"
+
+
+# 13. Index phụ đang được xoá tạm trong lúc nạp hàng loạt (DroppedIndex): tiến trình nạp bị dừng
+# giữa chừng thì các index này được tạo lại ở lần khởi động sau
+class DroppedIndex(models.Model):
+    name = models.CharField(max_length=200, unique=True)  # Tên index
+    sql = models.TextField()  # Câu lệnh CREATE INDEX
+    worker = models.CharField(max_length=100)  # Tiến trình đã xoá index
+    dropped_at = models.DateTimeField(auto_now_add=True)  # Thời gian xoá
+
+    def __str__(self):
+        return f"{self.name} ({self.worker})"
@@ -0,0 +1,74 @@
+import csv
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .ingest import parse_row, stream_encoding
+
+# Kích thước mỗi khoảng byte giao cho một tiến trình con
+PARSE_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def _init_worker():
+    # Tiến trình con tạo bằng "spawn" (macOS/Windows) chưa nạp Django
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def read_header(path, encoding="utf-8"):
+    """Trả về (danh sách tên cột, vị trí byte bắt đầu dữ liệu)."""
+    with open(path, "rb") as f:
+        line = f.readline()
+        offset = f.tell()
+    fieldnames = next(csv.reader([line.decode(stream_encoding(encoding))]), [])
+    return fieldnames, offset
+
+
+def split_byte_ranges(path, start, chunk_bytes=PARSE_CHUNK_BYTES):
+    """
+    Chia tệp thành các khoảng [begin, end) khoảng chunk_bytes, mỗi khoảng kết thúc
+    đúng sau một ký tự xuống dòng. Giả định tệp xuất không có trường chứa xuống
+    dòng bên trong dấu nháy (đúng với định dạng CSV bán hàng hiện tại).
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        begin = start
+        while begin < size:
+            f.seek(min(begin + chunk_bytes, size))
+            f.readline()  # Đi tới hết dòng hiện tại
+            end = min(f.tell(), size)
+            yield begin, end
+            begin = end
+
+
+def parse_range(path, fieldnames, begin, end, encoding="utf-8"):
+    """Chạy trong tiến trình con: parse và kiểm tra một khoảng byte, trả về list ParsedRow / chuỗi lỗi."""
+    with open(path, "rb") as f:
+        f.seek(begin)
+        data = f.read(end - begin)
+    reader = csv.DictReader(data.decode(encoding).splitlines(keepends=True), fieldnames=fieldnames)
+    return [parse_row(row) for row in reader]
+
+
+def iter_parsed_records(path, workers, chunk_bytes=PARSE_CHUNK_BYTES, encoding="utf-8"):
+    """
+    Parse tệp CSV song song bằng ProcessPoolExecutor và trả về các bản ghi theo
+    đúng thứ tự trong tệp, để một luồng ghi duy nhất đưa vào database.
+    Số khoảng đang xử lý được giới hạn để bộ nhớ không tăng theo kích thước tệp.
+    """
+    fieldnames, start = read_header(path, encoding)
+    if not fieldnames:
+        return
+
+    ranges = split_byte_ranges(path, start, chunk_bytes)
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        for begin, end in ranges:
+            in_flight.append(executor.submit(parse_range, path, fieldnames, begin, end, encoding))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
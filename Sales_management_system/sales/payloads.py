@@ -0,0 +1,79 @@
+from django.conf import settings
+
+from . import analytics, charts, formats, metrics
+from . import cache as chart_cache
+from .chart_context import ChartContext
+from .filters import ChartFilter
+
+# Backend mặc định; có thể chọn theo từng request bằng ?backend=orm|numpy
+CHART_BACKEND = getattr(settings, "SALES_CHART_BACKEND", "orm")
+
+# Tham số query string áp dụng cho mọi biểu đồ (định dạng trả về được thêm riêng
+# vì có thể chọn bằng header Accept)
+GLOBAL_CHART_PARAMS = ("backend",)
+
+
+def chart_backend(params):
+    return "numpy" if params.get("backend", CHART_BACKEND) == "numpy" else "orm"
+
+
+def with_format(params, fmt):
+    # JSON mặc định giữ nguyên khoá cache cũ; định dạng khác có khoá riêng
+    if fmt != "json":
+        params["format"] = fmt
+    return params
+
+
+def chart_params(spec, params, fmt="json"):
+    # Chỉ các tham số biểu đồ khai báo mới tham gia khoá cache
+    allowed = spec.params + GLOBAL_CHART_PARAMS if spec else GLOBAL_CHART_PARAMS
+    return with_format({name: value for name, value in params.items() if name in allowed}, fmt)
+
+
+def chart_key(question, params, generation, fmt="json"):
+    """Khoá cache của một biểu đồ với các tham số query string params."""
+    return chart_cache.cache_key(question, chart_params(charts.get_chart(question), params, fmt), generation)
+
+
+def chart_payloads(questions, params, version, fmt="json", filters=None, concurrent=False, use_cache=True):
+    """
+    Trả về {câu hỏi: dữ liệu đã mã hoá theo định dạng fmt (bytes)}. Lấy từ cache
+    nếu có; các câu hỏi còn lại được tính bằng backend được chọn với bộ lọc của params,
+    dùng chung dữ liệu trung gian, và được đo thời gian.
+    version = (generation, updated_at) của dữ liệu mà kết quả được tính cho;
+    concurrent: các truy vấn độc lập của backend ORM chạy song song (ChartContext.fetch);
+    use_cache=False: luôn tính lại (kết quả mới vẫn được lưu vào cache), dùng khi profile request.
+    """
+    backend = chart_backend(params)
+    if filters is None:
+        filters = ChartFilter.from_params(params)
+    generation = version[0]
+    payloads, keys, missing = {}, {}, []
+    for question in questions:
+        spec = charts.get_chart(question)
+        if spec is None:
+            payloads[question] = formats.encode([], fmt)  # Câu hỏi không tồn tại
+            continue
+        keys[question] = chart_key(question, params, generation, fmt)
+        payload = chart_cache.lookup(keys[question]) if spec.cacheable and use_cache else None
+        if payload is None:
+            missing.append(question)
+        else:
+            payloads[question] = payload
+            metrics.chart_metrics.record_hit((backend, question))
+
+    if not missing:
+        return payloads
+    if backend == "numpy":
+        frame = analytics.get_frame(version).filtered(filters)
+        compute = lambda question: analytics.compute_chart(question, frame, params)
+    else:
+        ctx = ChartContext(missing, filters, params, concurrent)
+        compute = lambda question: charts.compute_chart(question, ctx)
+
+    for question in missing:
+        payloads[question] = metrics.measure((backend, question), lambda: compute(question),
+                                             lambda result: formats.encode(result, fmt))
+        if charts.get_chart(question).cacheable:
+            chart_cache.store(keys[question], payloads[question])
+    return payloads
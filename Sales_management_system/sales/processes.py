@@ -0,0 +1,44 @@
+import os
+import socket
+import uuid
+
+# (pid, định danh) của tiến trình hiện tại, tính lại sau fork (gunicorn preload)
+_current = None
+
+
+def current_process_id():
+    """
+    Định danh tiến trình hiện tại dạng "máy:pid:mã ngẫu nhiên". Mã ngẫu nhiên phân biệt tiến trình
+    mới với tiến trình cũ cùng pid (pid được dùng lại sau khi khởi động lại, nhất là trong container).
+    """
+    global _current
+    pid = os.getpid()
+    if _current is None or _current[0] != pid:
+        _current = (pid, f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:12]}")
+    return _current[1]
+
+
+def process_alive(process_id):
+    """
+    Tiến trình có định danh process_id còn chạy không: True / False, None nếu không kiểm tra được
+    (tiến trình trên máy khác). Định danh rỗng (bản ghi tạo trước khi có định danh) coi như đã dừng.
+    """
+    if not process_id:
+        return False
+    if process_id == current_process_id():
+        return True
+    host, pid, _ = process_id.rsplit(":", 2)
+    if host != socket.gethostname():
+        return None
+    pid = int(pid)
+    if pid == os.getpid():
+        # Cùng pid nhưng khác mã: tiến trình cũ đã dừng
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Tiến trình của người dùng khác vẫn đang chạy
+        return True
+    return True
@@ -0,0 +1,92 @@
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Sum, Count, F
+
+from .cache import bump_generation
+from .models import Order, OrderDetail, SalesRollup, SalesCalendar
+
+# Các cột khoá của bucket và các cột cộng dồn
+BUCKET_COLUMNS = ["date", "hour", "product_id", "category_id", "segment_id"]
+MEASURE_COLUMNS = ["revenue", "quantity", "order_count"]
+
+# Lịch bán hàng: khoá (ngày, giờ), các cột mô tả và cột cộng dồn
+CALENDAR_KEY_COLUMNS = ["date", "hour"]
+CALENDAR_COLUMNS = ["date", "hour", "year", "month", "day", "weekday", "order_count"]
+
+
+def aggregate_details(details):
+    """Gom các dòng OrderDetail thành các bucket (ngày, giờ, mặt hàng, nhóm hàng, phân khúc) theo giờ địa phương."""
+    return details.values_list(
+        'order__local_date', 'order__hour', 'product_id', 'product__category_id', 'order__customer__segment_id'
+    ).annotate(
+        revenue=Sum('total'),
+        quantity=Sum('quantity'),
+        order_count=Count('order', distinct=True),
+    ).order_by()
+
+
+def _upsert(model, columns, key_columns, measure_columns, rows):
+    # INSERT ... ON CONFLICT DO UPDATE để cộng dồn vào bucket đã có (SQLite >= 3.24, PostgreSQL).
+    # Cột đầu tiên của mỗi dòng là ngày.
+    if not rows:
+        return
+
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    # Cột khoá cho phép NULL nằm trong index unique dưới dạng COALESCE(cột, 0) (NULL coi như nhau)
+    conflict_target = ", ".join(
+        f"COALESCE({qn(c)}, 0)" if model._meta.get_field(c).null else qn(c) for c in key_columns
+    )
+    sql = (
+        f"INSERT INTO {table} ({', '.join(qn(c) for c in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({conflict_target}) DO UPDATE SET "
+        + ", ".join(f"{qn(c)} = {table}.{qn(c)} + EXCLUDED.{qn(c)}" for c in measure_columns)
+    )
+    # Nhiều dòng chung một ngày: mỗi ngày chỉ chuyển đổi một lần
+    dates = {}
+    adapt_date = connection.ops.adapt_datefield_value
+    params = []
+    for row in rows:
+        date = dates.get(row[0])
+        if date is None:
+            date = dates[row[0]] = adapt_date(row[0])
+        params.append((date,) + tuple(row[1:]))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def add_buckets(buckets):
+    """
+    Cộng các bucket đã gom sẵn trong bộ nhớ vào bảng tổng hợp: {(ngày, giờ, mặt hàng, nhóm hàng,
+    phân khúc): (doanh số, số lượng, số đơn hàng)}. Gọi trong cùng transaction với lúc tạo chi tiết.
+    """
+    rows = [key + tuple(measures) for key, measures in buckets.items()]
+    _upsert(SalesRollup, BUCKET_COLUMNS + MEASURE_COLUMNS, BUCKET_COLUMNS, MEASURE_COLUMNS, rows)
+
+
+def add_orders(slots):
+    """Cộng các đơn hàng vừa được tạo, mỗi đơn một bộ (ngày, giờ, thứ) địa phương, vào lịch bán hàng."""
+    rows = [(date, hour, date.year, date.month, date.day, weekday, count)
+            for (date, hour, weekday), count in Counter(slots).items()]
+    _upsert(SalesCalendar, CALENDAR_COLUMNS, CALENDAR_KEY_COLUMNS, ["order_count"], rows)
+
+
+def rebuild():
+    """Tính lại toàn bộ bảng tổng hợp và lịch bán hàng (dùng khi dữ liệu bị sửa/xoá ngoài luồng nạp)."""
+    with transaction.atomic():
+        SalesRollup.objects.all().delete()
+        SalesRollup.objects.bulk_create(
+            (SalesRollup(**dict(zip(BUCKET_COLUMNS + MEASURE_COLUMNS, row)))
+             for row in aggregate_details(OrderDetail.objects.all()).iterator()),
+            batch_size=500,
+        )
+        SalesCalendar.objects.all().delete()
+        SalesCalendar.objects.bulk_create(
+            (SalesCalendar(**item) for item in Order.objects.values(
+                'hour', 'year', 'month', 'day', 'weekday', date=F('local_date')
+            ).annotate(order_count=Count('id')).order_by().iterator()),
+            batch_size=500,
+        )
+        bump_generation()
@@ -0,0 +1,37 @@
+import logging
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .metrics import install_query_tracking
+from .sqlite_tuning import restore_dropped_indexes
+
+logger = logging.getLogger(__name__)
+
+# Chỉ kiểm tra index bị bỏ lại ở kết nối đầu tiên của tiến trình
+_indexes_checked = False
+
+
+# Mọi kết nối (kể cả của các thread chạy truy vấn song song) đếm câu SQL cho QueryTimer
+# của ngữ cảnh đang chạy (metrics.track_queries)
+@receiver(connection_created)
+def track_connection_queries(sender, connection, **kwargs):
+    install_query_tracking(connection)
+
+
+# Kết nối đầu tiên của tiến trình (ứng dụng hoặc lệnh import_sales khởi động): tạo lại index phụ
+# mà lần nạp hàng loạt trước bị dừng giữa chừng chưa kịp tạo lại
+@receiver(connection_created)
+def restore_indexes_on_start(sender, connection, **kwargs):
+    global _indexes_checked
+    if _indexes_checked or connection.alias != DEFAULT_DB_ALIAS:
+        return
+    _indexes_checked = True
+    try:
+        restored = restore_dropped_indexes(connection)
+    except DatabaseError:
+        # Bảng DroppedIndex chưa có (database chưa migrate)
+        return
+    if restored:
+        logger.warning("Recreated indexes left dropped by an interrupted bulk load: %s", ", ".join(restored))
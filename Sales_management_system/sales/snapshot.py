@@ -0,0 +1,111 @@
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+# Thư mục chứa snapshot dạng cột (None = không dùng snapshot)
+SNAPSHOT_DIR = getattr(settings, "SALES_SNAPSHOT_DIR", None)
+
+# Tệp trỏ tới thư mục snapshot mới nhất
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+
+
+def _root(directory):
+    directory = directory or SNAPSHOT_DIR
+    return os.fspath(directory) if directory else None
+
+
+def _version_fields(version):
+    generation, updated_at = version
+    return generation, updated_at.isoformat() if updated_at else None
+
+
+def write(version, labels, columns, directory=None):
+    """
+    Ghi snapshot: mỗi cột một tệp .npy cùng manifest.json chứa nhãn đã mã hoá.
+    Thư mục được ghi dưới tên tạm rồi đổi tên, sau đó mới cập nhật tệp CURRENT,
+    nên tiến trình đọc không bao giờ thấy snapshot ghi dở. Trả về đường dẫn thư mục.
+
+    version là (generation, updated_at) của DatasetVersion; updated_at giúp phân biệt
+    các database khác nhau (ví dụ tạo lại) có cùng số thế hệ.
+    """
+    root = _root(directory)
+    os.makedirs(root, exist_ok=True)
+    generation, updated_at = _version_fields(version)
+    stamp = int(version[1].timestamp() * 1_000_000) if version[1] else 0
+    name = f"gen-{generation}-{stamp}"
+    target = os.path.join(root, name)
+
+    if not os.path.isdir(target):
+        tmp = os.path.join(root, f".{name}-{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        try:
+            for column, values in columns.items():
+                np.save(os.path.join(tmp, f"{column}.npy"), np.ascontiguousarray(values))
+            manifest = {
+                "format": FORMAT_VERSION,
+                "generation": generation,
+                "updated_at": updated_at,
+                "created_at": timezone.now().isoformat(),
+                "columns": sorted(columns),
+                "labels": labels,
+            }
+            with open(os.path.join(tmp, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(tmp, target)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            # Tiến trình khác đã ghi xong cùng thế hệ trước
+            if not os.path.isdir(target):
+                raise
+
+    pointer = os.path.join(root, f".{CURRENT_FILE}-{uuid.uuid4().hex}")
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(root, CURRENT_FILE))
+
+    _remove_old(root, keep=name)
+    return target
+
+
+def _remove_old(root, keep):
+    # Tiến trình đang mmap snapshot cũ vẫn đọc được tệp đã bị xoá (POSIX)
+    for entry in os.listdir(root):
+        if entry.startswith("gen-") and entry != keep:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+def read(version=None, directory=None):
+    """
+    Mở snapshot mới nhất với mmap_mode='r' (các tiến trình dùng chung page cache).
+    Trả về (version, labels, columns), hoặc None nếu chưa có snapshot hay
+    snapshot không đúng phiên bản dữ liệu yêu cầu.
+    """
+    root = _root(directory)
+    if not root:
+        return None
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            path = os.path.join(root, f.read().strip())
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != FORMAT_VERSION:
+            return None
+        if version is not None and [manifest["generation"], manifest["updated_at"]] != list(_version_fields(version)):
+            return None
+        columns = {
+            column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r")
+            for column in manifest["columns"]
+        }
+    except (OSError, ValueError, KeyError):
+        return None
+    updated_at = manifest["updated_at"]
+    version = (manifest["generation"], datetime.fromisoformat(updated_at) if updated_at else None)
+    return version, manifest["labels"], columns
@@ -0,0 +1,115 @@
+from contextlib import contextmanager
+
+from django.db import connection as default_connection, transaction
+
+from .models import Customer, Product, Order, OrderDetail, SalesRollup, DroppedIndex
+from .processes import current_process_id, process_alive
+
+# Các bảng lớn có index phụ được tạm xoá trong lúc nạp hàng loạt
+BULK_LOAD_MODELS = [Customer, Product, Order, OrderDetail, SalesRollup]
+
+# Cấu hình SQLite khi nạp dữ liệu ngoại tuyến
+BULK_LOAD_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "OFF",  # Không fsync sau mỗi commit, chấp nhận được khi nạp lại được từ tệp gốc
+    "cache_size": -256 * 1024,  # Đơn vị KiB khi là số âm -> 256 MiB
+    "temp_store": "MEMORY",
+}
+
+
+def _pragma(cursor, name):
+    cursor.execute(f"PRAGMA {name}")
+    return cursor.fetchone()[0]
+
+
+def _create_indexes(cursor, indexes):
+    # Index đã được tạo lại (restore_dropped_indexes của tiến trình khác) thì bỏ qua
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    existing = {name for name, in cursor.fetchall()}
+    for name, sql in indexes:
+        if name not in existing:
+            cursor.execute(sql)
+
+
+@contextmanager
+def bulk_load_mode(connection=None, models=None):
+    """
+    Chuyển kết nối SQLite sang chế độ nạp hàng loạt: WAL, synchronous=OFF,
+    cache lớn, và xoá tạm các index phụ (không unique) để tạo lại một lần sau
+    khi nạp xong. Khôi phục cấu hình cũ khi thoát. Không làm gì với database khác.
+    Không được gọi bên trong transaction. Câu lệnh tạo các index bị xoá được lưu vào
+    DroppedIndex để tạo lại được nếu tiến trình bị dừng trước khi thoát; các PRAGMA chỉ
+    có hiệu lực trên kết nối nên không cần khôi phục.
+    """
+    connection = connection or default_connection
+    if connection.vendor != "sqlite":
+        yield
+        return
+
+    tables = [model._meta.db_table for model in (models or BULK_LOAD_MODELS)]
+    with connection.cursor() as cursor:
+        saved = {name: _pragma(cursor, name) for name in BULK_LOAD_PRAGMAS}
+        for name, value in BULK_LOAD_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        # Index unique giữ nguyên vì cần cho kiểm tra trùng khoá
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master "
+            "WHERE type = 'index' AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%%' "
+            f"AND tbl_name IN ({', '.join(['%s'] * len(tables))})",
+            tables,
+        )
+        dropped = cursor.fetchall()
+        # Ghi lại trong cùng transaction với lệnh xoá
+        DroppedIndex.objects.using(connection.alias).bulk_create(
+            DroppedIndex(name=name, sql=sql, worker=current_process_id()) for name, sql in dropped
+        )
+        for name, _ in dropped:
+            cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+
+    try:
+        yield
+    finally:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            _create_indexes(cursor, dropped)
+            DroppedIndex.objects.using(connection.alias).filter(name__in=[name for name, _ in dropped]).delete()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            for name, value in saved.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def restore_dropped_indexes(connection=None):
+    """
+    Tạo lại các index phụ mà lần nạp hàng loạt trước chưa kịp tạo lại (tiến trình bị dừng giữa
+    chừng), bỏ qua index của tiến trình nạp còn đang chạy. Tiến trình trên máy khác không kiểm
+    tra được nên index của nó cũng được tạo lại: lần nạp đó chỉ chậm hơn. Trả về tên các index.
+    """
+    connection = connection or default_connection
+    if connection.vendor != "sqlite":
+        return []
+
+    pending = [index for index in DroppedIndex.objects.using(connection.alias)
+               if not process_alive(index.worker)]
+    if not pending:
+        return []
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        _create_indexes(cursor, [(index.name, index.sql) for index in pending])
+        DroppedIndex.objects.using(connection.alias).filter(pk__in=[index.pk for index in pending]).delete()
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    return [index.name for index in pending]
+
+
+def refresh_statistics(connection=None):
+    """
+    Cập nhật thống kê cho bộ lập kế hoạch truy vấn của SQLite (PRAGMA optimize chỉ
+    ANALYZE các bảng đã thay đổi nhiều). Thiếu thống kê, SQLite có thể bỏ qua chỉ mục
+    local_date khi biểu đồ lọc theo khoảng ngày. Không làm gì với database khác.
+    """
+    connection = connection or default_connection
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA optimize")
@@ -1,6 +1,8 @@
 export function render(data) {
-    // Chuyển đổi dữ liệu sang mảng số
-    const spendingValues = data.map(d => d.total_spent);
+    // Server đã chia bin: mỗi phần tử là {x0, x1, count}
+    const bins = data || [];
+    // Bin chia theo thang log khi trang được mở với ?log=1 (tham số được chuyển tiếp cho API)
+    const logScale = ["1", "true", "yes", "on"].includes(new URLSearchParams(window.location.search).get("log"));
 
     // Kích thước biểu đồ
     const width = 900;
@@ -16,21 +18,19 @@ export function render(data) {
         .style("font-family", "Arial, sans-serif")
         .attr("transform", `translate(${margin.left},${margin.top})`);
 
-    // Thiết lập bins (khoảng chi tiêu)
-    const maxSpending = d3.max(spendingValues);
-    const binWidth = 50000; // Mỗi bin là 50,000
-    const bins = d3.bin()
-        .domain([0, maxSpending])
-        .thresholds(d3.range(0, maxSpending, binWidth))(spendingValues);
+    if (bins.length === 0) {
+        return;
+    }
 
-    // Thang đo trục x
-    const xScale = d3.scaleLinear()
-        .domain([0, maxSpending])
+    // Thang đo trục x (từ cạnh trái bin đầu tới cạnh phải bin cuối)
+    const xDomain = [bins[0].x0, bins[bins.length - 1].x1];
+    const xScale = (logScale && xDomain[0] > 0 ? d3.scaleLog() : d3.scaleLinear())
+        .domain(xDomain)
         .range([0, width]);
 
     // Thang đo trục y (số khách hàng)
     const yScale = d3.scaleLinear()
-        .domain([0, d3.max(bins, d => d.length)])
+        .domain([0, d3.max(bins, d => d.count)])
         .nice()
         .range([height, 0]);
 
@@ -60,14 +60,14 @@ export function render(data) {
         .data(bins)
         .join("rect")
         .attr("x", d => xScale(d.x0) + 1)
-        .attr("y", d => yScale(d.length))
+        .attr("y", d => yScale(d.count))
         .attr("width", d => Math.max(0, xScale(d.x1) - xScale(d.x0) - 2))
-        .attr("height", d => height - yScale(d.length))
+        .attr("height", d => height - yScale(d.count))
         .attr("fill", "#4e79a7")
         .attr("opacity", 0.7)
         .on("mouseover", function(event, d) {
             tooltip.style("visibility", "visible")
-                .html(`<strong>Chi tiêu từ ${d3.format(",")(d.x0)} đến ${d3.format(",")(d.x1)}</strong><br>Số lượng KH: ${d3.format(",")(d.length)}`);
+                .html(`<strong>Chi tiêu từ ${d3.format(",.0f")(d.x0)} đến ${d3.format(",.0f")(d.x1)}</strong><br>Số lượng KH: ${d3.format(",")(d.count)}`);
         })
         .on("mousemove", function(event) {
             tooltip.style("top", (event.pageY - 10) + "px")
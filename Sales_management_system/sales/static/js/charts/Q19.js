@@ -39,10 +39,9 @@ export function render(data) {
     // Lấy tất cả các phân khúc
     const segments = data.map(d => d.segment_code);
     
-    // Tìm giá trị min và max cho trục Y
-    const allValues = data.flatMap(d => d.raw_data);
+    // Tìm giá trị max cho trục Y (server trả sẵn min/max của từng phân khúc)
     const yMin = 0; // Bắt đầu từ 0
-    const yMax = d3.max(allValues) * 1.1; // Thêm khoảng trống 10% phía trên
+    const yMax = d3.max(data, d => d.max) * 1.1; // Thêm khoảng trống 10% phía trên
     
     // Tạo thang đo X (phân khúc khách hàng)
     const x = d3.scaleBand()
@@ -152,7 +151,9 @@ export function render(data) {
                                Q1: ${formatCurrency(d.q1)} VNĐ<br>
                                Median: ${formatCurrency(d.median)} VNĐ<br>
                                Q3: ${formatCurrency(d.q3)} VNĐ<br>
-                               Max: ${formatCurrency(d.max)} VNĐ`)
+                               Max: ${formatCurrency(d.max)} VNĐ<br>
+                               Số khách hàng: ${formatCurrency(d.count)}<br>
+                               Số outlier: ${formatCurrency(d.outlier_count)}`)
                     .style("left", (event.pageX + 10) + "px")
                     .style("top", (event.pageY - 28) + "px");
             })
@@ -195,8 +196,12 @@ export function render(data) {
             .attr("stroke", "#000")
             .attr("stroke-width", 1);
         
+        // Server chỉ trả một mẫu điểm có giới hạn (max_points); điểm nằm ngoài râu là outlier
+        const outliers = d.points.filter(v => v < d.whisker_bottom || v > d.whisker_top);
+        const insidePoints = d.points.filter(v => v >= d.whisker_bottom && v <= d.whisker_top);
+
         // Vẽ outliers
-        d.outliers.forEach(outlier => {
+        outliers.forEach(outlier => {
             // Chỉ vẽ outlier nằm trong phạm vi hiển thị
             if (outlier <= yMax) {
                 svg.append("circle")
@@ -236,9 +241,9 @@ export function render(data) {
             }
         });
         
-        // Vẽ điểm dữ liệu (tùy chọn cho dữ liệu nhỏ)
-        if (d.raw_data.length < 100) { // Chỉ vẽ khi số lượng điểm hợp lý
-            d.raw_data.forEach(value => {
+        // Vẽ điểm dữ liệu mẫu
+        if (insidePoints.length > 0) {
+            insidePoints.forEach(value => {
                 svg.append("circle")
                     .attr("cx", boxX + boxWidth / 2 + (Math.random() - 0.5) * boxWidth * 0.8) // Thêm jitter
                     .attr("cy", y(value))
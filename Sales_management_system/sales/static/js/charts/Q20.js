@@ -0,0 +1,111 @@
+export function render(data) {
+    console.log("Dữ liệu Q20:", data);
+
+    if (!data || !data.pairs || data.pairs.length === 0) {
+        d3.select("#chart-container").append("div")
+            .attr("class", "alert alert-info")
+            .style("margin-top", "50px")
+            .style("text-align", "center")
+            .text("Không có cặp mặt hàng nào được mua cùng nhau.");
+        return;
+    }
+
+    // Độ đo của thanh theo tham số sort của trang (mặc định support, như server)
+    const sortKey = new URLSearchParams(window.location.search).get("sort");
+    const metric = ["support", "confidence", "lift"].includes(sortKey) ? sortKey : "support";
+    const value = d => metric === "confidence" ? Math.max(d.confidence_ab, d.confidence_ba) : d[metric];
+    const formatValue = metric === "lift" ? d3.format(".2f") : d3.format(".1%");
+    const pairLabel = d => `${d.code_a} + ${d.code_b}`;
+    const pairs = data.pairs;
+
+    // Cấu hình kích thước biểu đồ
+    const width = 700, margin = { top: 50, right: 80, bottom: 50, left: 200 };
+    const height = Math.max(200, pairs.length * 25);
+
+    // Tạo vùng vẽ SVG
+    const svg = d3.select("#chart-container")
+        .append("svg")
+        .attr("width", width + margin.left + margin.right)
+        .attr("height", height + margin.top + margin.bottom)
+        .append("g")
+        .attr("transform", `translate(${margin.left}, ${margin.top})`);
+
+    // Thang đo
+    const yScale = d3.scaleBand()
+        .domain(pairs.map(pairLabel))
+        .range([0, height])
+        .padding(0.2);
+
+    const xScale = d3.scaleLinear()
+        .domain([0, d3.max(pairs, value)])
+        .nice()
+        .range([0, width]);
+
+    const tooltip = d3.select("body").append("div")
+        .style("position", "absolute")
+        .style("background", "#f9f9f9")
+        .style("border", "1px solid #ccc")
+        .style("padding", "5px")
+        .style("font-family", "Arial, sans-serif")
+        .style("visibility", "hidden");
+
+    // Vẽ các thanh
+    svg.selectAll(".bar")
+        .data(pairs)
+        .enter()
+        .append("rect")
+        .attr("y", d => yScale(pairLabel(d)))
+        .attr("x", 0)
+        .attr("width", d => xScale(value(d)))
+        .attr("height", yScale.bandwidth())
+        .attr("fill", "#4e79a7")
+        .on("mouseover", (event, d) => {
+            tooltip.style("visibility", "visible").html(`
+                <strong>[${d.code_a}] ${d.name_a}</strong> + <strong>[${d.code_b}] ${d.name_b}</strong><br>
+                <strong>Số đơn cùng mua:</strong> ${d3.format(",")(d.order_count)} / ${d3.format(",")(data.total_orders)}<br>
+                <strong>Support:</strong> ${d3.format(".2%")(d.support)}<br>
+                <strong>Confidence ${d.code_a} → ${d.code_b}:</strong> ${d3.format(".1%")(d.confidence_ab)}<br>
+                <strong>Confidence ${d.code_b} → ${d.code_a}:</strong> ${d3.format(".1%")(d.confidence_ba)}<br>
+                <strong>Lift:</strong> ${d3.format(".2f")(d.lift)}
+            `);
+        })
+        .on("mousemove", (event) => {
+            tooltip
+                .style("top", `${event.pageY - 40}px`)
+                .style("left", `${event.pageX + 10}px`);
+        })
+        .on("mouseout", () => {
+            tooltip.style("visibility", "hidden");
+        });
+
+    // Vẽ trục Y
+    svg.append("g")
+        .call(d3.axisLeft(yScale));
+
+    // Vẽ trục X
+    svg.append("g")
+        .attr("transform", `translate(0, ${height})`)
+        .call(d3.axisBottom(xScale).tickFormat(metric === "lift" ? d3.format(".1f") : d3.format(".0%")));
+
+    // Thêm tiêu đề
+    svg.append("text")
+        .attr("x", width / 2)
+        .attr("y", -margin.top / 2)
+        .attr("text-anchor", "middle")
+        .style("font-size", "22px")
+        .style("font-weight", "bold")
+        .text(data.level === "category" ? "Các cặp nhóm hàng thường được mua cùng nhau"
+                                        : "Các cặp mặt hàng thường được mua cùng nhau");
+
+    // Thêm nhãn giá trị
+    svg.selectAll(".label")
+        .data(pairs)
+        .enter()
+        .append("text")
+        .attr("x", d => xScale(value(d)) + 5)
+        .attr("y", d => yScale(pairLabel(d)) + yScale.bandwidth() / 2)
+        .attr("dy", "0.35em")
+        .style("font-size", "12px")
+        .style("fill", "black")
+        .text(d => formatValue(value(d)));
+}
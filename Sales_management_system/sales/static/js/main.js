@@ -6,8 +6,8 @@ window.loadChart = async function loadChart(chartName) {
     d3.select("#chart-container").html("");
 
     try {
-        // Gọi API Django
-        const response = await fetch(`/api/chart-data/${chartName}/`);
+        // Gọi API Django, chuyển tiếp bộ lọc của trang (?from=&to=&segment=&category=&product=)
+        const response = await fetch(`/api/chart-data/${chartName}/${window.location.search}`);
         const data = await response.json();
         console.log(`Data ${chartName}:`, data);
 
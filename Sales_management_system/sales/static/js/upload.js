@@ -0,0 +1,34 @@
+// Theo dõi tiến độ các tiến trình nạp dữ liệu chưa hoàn thành
+const STATE_LABELS = {
+    pending: "Đang chờ",
+    running: "Đang xử lý",
+    done: "Hoàn thành",
+    failed: "Lỗi"
+};
+const POLL_INTERVAL = 2000; // ms
+
+async function pollJob(row) {
+    try {
+        const response = await fetch(row.dataset.jobUrl);
+        const job = await response.json();
+
+        row.dataset.state = job.state;
+        row.querySelector(".job-state").textContent = STATE_LABELS[job.state] || job.state;
+        row.querySelector(".job-processed").textContent = job.rows_processed;
+        row.querySelector(".job-skipped").textContent = job.rows_skipped;
+        row.querySelector(".job-message").textContent = job.message;
+    } catch (error) {
+        console.error("Error when polling ingest job:", error);
+    }
+
+    // Tiếp tục hỏi cho đến khi job kết thúc
+    if (row.dataset.state === "pending" || row.dataset.state === "running") {
+        setTimeout(() => pollJob(row), POLL_INTERVAL);
+    }
+}
+
+document.querySelectorAll("tr[data-job-url]").forEach(row => {
+    if (row.dataset.state === "pending" || row.dataset.state === "running") {
+        pollJob(row);
+    }
+});
@@ -0,0 +1,177 @@
+import numpy as np
+
+# Số điểm mặc định / tối đa trả về cho mỗi nhóm để vẽ lớp điểm (jitter)
+DEFAULT_MAX_POINTS = 200
+MAX_POINTS_LIMIT = 5000
+
+# Cách chọn điểm: "stratified" lấy các hạng cách đều nhau (giữ hình dạng phân phối,
+# luôn có min và max), "random" lấy ngẫu nhiên các hạng với seed cố định
+SAMPLE_MODES = ("stratified", "random")
+RANDOM_SEED = 0
+
+
+def parse_max_points(value):
+    """Đọc tham số max_points (0 = không trả điểm); giá trị không hợp lệ dùng mặc định."""
+    try:
+        return min(max(int(value), 0), MAX_POINTS_LIMIT)
+    except (ValueError, TypeError):
+        return DEFAULT_MAX_POINTS
+
+
+def parse_sample_mode(value):
+    return value if value in SAMPLE_MODES else SAMPLE_MODES[0]
+
+
+def sample_ranks(n, k, mode="stratified"):
+    """Tối đa k hạng (chỉ số sau khi sắp xếp tăng dần) trong n giá trị, tăng dần."""
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if n <= k:
+        return np.arange(n)
+    if mode == "random":
+        rng = np.random.default_rng(RANDOM_SEED)
+        return np.sort(rng.choice(n, size=k, replace=False))
+    return np.unique(np.linspace(0, n - 1, k).round().astype(np.int64))
+
+
+def _quartile_values(values, ranks):
+    # Giá trị ở các hạng Q1 <= median <= Q3: partition tại median rồi tại Q1 / Q3 trong từng nửa.
+    # numpy chọn một vị trí bằng SIMD, nhanh hơn nhiều so với partition nhiều vị trí một lượt
+    # (và cả so với np.sort)
+    r1, r2, r3 = ranks
+    halves = np.partition(values, r2)
+    median = halves[r2]
+    q1 = np.partition(halves[:r2], r1)[r1] if r1 < r2 else median
+    q3 = np.partition(halves[r2 + 1:], r3 - r2 - 1)[r3 - r2 - 1] if r3 > r2 else median
+    return int(q1), int(median), int(q3)
+
+
+def box_plot(values, max_points=DEFAULT_MAX_POINTS, sample="stratified"):
+    """
+    Thống kê box plot chính xác của một mảng số nguyên (không cần sắp xếp trước):
+    tứ phân vị theo hạng int(n * p) như trước đây, râu là giá trị nhỏ/lớn nhất nằm trong
+    [Q1 - 1.5 IQR, Q3 + 1.5 IQR], số outlier và tối đa max_points điểm mẫu (chọn theo hạng,
+    nên kết quả không phụ thuộc thứ tự đầu vào). Tứ phân vị chỉ cần partition tại ba hạng;
+    chỉ các phần chứa điểm mẫu mới được sắp xếp: outlier hai phía (thường ít) riêng, các giá
+    trị trong râu riêng.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    n = len(values)
+    if n == 0:
+        return None
+
+    min_val, max_val = int(values.min()), int(values.max())
+    q1, median, q3 = _quartile_values(values, (int(n * 0.25), int(n * 0.5), int(n * 0.75)))
+    if n <= 3:
+        q1 = q3 = min_val
+    if n == 1:
+        median = min_val
+
+    iqr = q3 - q1
+    lower_bound = q1 - 1.5 * iqr
+    upper_bound = q3 + 1.5 * iqr
+    below = values < lower_bound
+    above = values > upper_bound
+    inliers = values[~(below | above)]
+    low_count, high_count = int(np.count_nonzero(below)), int(np.count_nonzero(above))
+
+    # Hạng [0, low_count) là outlier dưới, [n - high_count, n) là outlier trên, còn lại trong râu.
+    # Các mảng lọc theo mask là bản sao nên được sắp xếp tại chỗ (np.sort sao chép thêm lần nữa)
+    ranks = sample_ranks(n, max_points, sample)
+    points = np.empty(len(ranks), dtype=np.int64)
+    low = ranks < low_count
+    high = ranks >= n - high_count
+    inner = ~(low | high)
+    if low.any():
+        outliers = values[below]
+        outliers.sort()
+        points[low] = outliers[ranks[low]]
+    if high.any():
+        outliers = values[above]
+        outliers.sort()
+        points[high] = outliers[ranks[high] - (n - high_count)]
+    if inner.any():
+        inliers.sort()
+        points[inner] = inliers[ranks[inner] - low_count]
+
+    return {
+        'count': n,
+        'min': min_val,
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'max': max_val,
+        'whisker_bottom': int(inliers.min()) if len(inliers) else min_val,
+        'whisker_top': int(inliers.max()) if len(inliers) else max_val,
+        'outlier_count': low_count + high_count,
+        'points': points.tolist(),
+    }
+
+
+# Histogram: độ rộng bin mặc định (như Q12.js trước đây), số bin mặc định khi dùng
+# thang log và số bin tối đa trả về
+DEFAULT_BIN_WIDTH = 50000
+DEFAULT_LOG_BINS = 20
+MAX_BINS = 1000
+
+
+def parse_positive_int(value, default=None):
+    """Số nguyên dương từ query string; giá trị thiếu hoặc không hợp lệ trả về default."""
+    try:
+        value = int(value)
+    except (ValueError, TypeError):
+        return default
+    return value if value > 0 else default
+
+
+def parse_flag(value):
+    return value in ("1", "true", "yes", "on")
+
+
+def histogram_options(params):
+    """Tham số histogram từ query string: ?bin_width=100000, ?bins=30, ?log=1"""
+    return {
+        'bin_width': parse_positive_int(params.get('bin_width'), DEFAULT_BIN_WIDTH),
+        'bins': parse_positive_int(params.get('bins')),
+        'log': parse_flag(params.get('log')),
+    }
+
+
+def histogram(values, bin_width=None, bins=None, log=False):
+    """
+    Đếm số giá trị trong từng bin, trả về [{x0, x1, count}] (tối đa MAX_BINS bin).
+
+    - Mặc định: bin rộng bin_width bắt đầu từ 0 như d3.bin().domain([0, max]);
+      bin cuối kết thúc ở max và chứa cả max. Giá trị âm bị bỏ qua.
+    - bins: chia [0, max] thành bins khoảng bằng nhau (ưu tiên hơn bin_width).
+    - log: bins khoảng cách đều trên thang log từ giá trị dương nhỏ nhất tới max;
+      giá trị nhỏ hơn được tính vào bin đầu tiên.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    values = values[values >= 0]
+    if len(values) == 0:
+        return []
+    max_val = int(values.max())
+
+    if log:
+        positive = values[values > 0]
+        low = int(positive.min()) if len(positive) else 1
+        count = min(bins or DEFAULT_LOG_BINS, MAX_BINS)
+        # Một giá trị dương duy nhất (hoặc toàn số 0): một bin [min, max]
+        edges = np.geomspace(low, max_val, count + 1) if max_val > low else np.array([min(low, max_val), max_val])
+    elif bins:
+        count = min(bins, MAX_BINS)
+        edges = np.linspace(0, max_val, count + 1) if max_val > 0 else np.array([0, 0])
+    else:
+        width = max(bin_width or DEFAULT_BIN_WIDTH, -(-max_val // MAX_BINS))
+        edges = np.append(np.arange(0, max_val, width), max_val) if max_val > 0 else np.array([0, 0])
+
+    # Bin của mỗi giá trị: cạnh trái <= giá trị < cạnh phải (bin cuối chứa cả max)
+    n_bins = len(edges) - 1
+    index = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, n_bins - 1)
+    counts = np.bincount(index, minlength=n_bins)
+    edges = edges.tolist()
+    return [
+        {'x0': edges[i], 'x1': edges[i + 1], 'count': int(counts[i])}
+        for i in range(n_bins)
+    ]
@@ -0,0 +1,154 @@
+import csv
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from .ingest import DATE_FORMAT
+
+# Thứ tự cột của tệp CSV mà trang Upload và lệnh import_sales nhận
+CSV_COLUMNS = [
+    "Mã đơn hàng", "Thời gian tạo đơn",
+    "Mã khách hàng", "Tên khách hàng",
+    "Mã PKKH", "Mô tả Phân Khúc Khách hàng",
+    "Mã nhóm hàng", "Tên nhóm hàng",
+    "Mã mặt hàng", "Tên mặt hàng",
+    "SL", "Đơn giá", "Thành tiền",
+]
+
+SEGMENTS = [
+    ("C11", "Khách hàng lẻ"),
+    ("C12", "Khách hàng thân thiết"),
+    ("C13", "Khách hàng doanh nghiệp"),
+    ("C14", "Đại lý"),
+]
+# Tỉ trọng khách hàng của từng phân khúc
+SEGMENT_WEIGHTS = [50, 30, 15, 5]
+
+CATEGORIES = [
+    ("BOT", "Bột"),
+    ("SET", "Set trà"),
+    ("THO", "Trà hoa"),
+    ("TMX", "Trà mix"),
+    ("TTC", "Trà củ, quả sấy"),
+]
+
+# Tỉ trọng đơn hàng theo giờ trong ngày (0h - 23h): thưa về đêm, cao điểm trưa và tối
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 6, 8, 9, 10, 12, 12, 10, 9, 9, 10, 11, 13, 14, 12, 8, 4, 2]
+
+# Số lượng mua của một dòng và tỉ trọng tương ứng
+QUANTITIES = (1, 2, 3, 4, 5, 10)
+QUANTITY_WEIGHTS = (50, 25, 10, 6, 5, 4)
+
+# Số mặt hàng tối đa trong một đơn
+MAX_ORDER_ITEMS = 5
+# Mã mặt hàng có 2 chữ số (Product.product_code tối đa 10 ký tự)
+MAX_PRODUCTS_PER_CATEGORY = 99
+
+# Các kiểu dòng lỗi được sinh khi invalid_ratio > 0 (đều bị bộ nạp bỏ qua)
+INVALID_KINDS = ("date", "quantity", "product", "customer")
+
+
+def default_customers(line_items):
+    """Số khách hàng mặc định: trung bình mỗi khách khoảng 20 dòng chi tiết."""
+    return max(50, line_items // 20)
+
+
+def default_products_per_category(line_items):
+    """Số mặt hàng mặc định mỗi nhóm: 10 ở quy mô 10k dòng, tăng dần tới 99."""
+    return max(10, min(MAX_PRODUCTS_PER_CATEGORY, line_items // 1000))
+
+
+def _catalog(rng, products_per_category):
+    products = []
+    for category_code, category_name in CATEGORIES:
+        for i in range(1, products_per_category + 1):
+            price = rng.choice(range(20_000, 500_001, 5_000))
+            products.append((category_code, category_name, f"{category_code}{i:02d}",
+                             f"{category_name} {i:02d}", price))
+    return products
+
+
+def iter_sales_rows(line_items, seed=0, customers=None, products_per_category=None,
+                    start=datetime(2024, 1, 1), days=365, duplicate_ratio=0.0, invalid_ratio=0.0):
+    """
+    Sinh line_items dòng CSV (danh sách giá trị theo CSV_COLUMNS), tất định theo seed.
+    Đơn hàng có 1 - MAX_ORDER_ITEMS mặt hàng khác nhau; khách hàng, mặt hàng và giờ mua
+    phân bố lệch như dữ liệu thật. duplicate_ratio: tỉ lệ dòng lặp lại nguyên văn một dòng
+    trước đó; invalid_ratio: tỉ lệ dòng lỗi (ngày sai, số lượng sai, thiếu mã) - cả hai đều
+    nằm trong tổng line_items.
+    """
+    rng = random.Random(seed)
+    customers = customers or default_customers(line_items)
+    products = _catalog(rng, min(products_per_category or default_products_per_category(line_items),
+                                 MAX_PRODUCTS_PER_CATEGORY))
+    # Mặt hàng và khách hàng phổ biến được mua nhiều hơn (phân bố gần Zipf);
+    # trọng số cộng dồn tính sẵn một lần để mỗi lần chọn chỉ tốn O(log n)
+    product_weights = [1 / (rank + 1) ** 0.8 for rank in range(len(products))]
+    rng.shuffle(product_weights)
+    product_cum = list(accumulate(product_weights))
+    customer_cum = list(accumulate(1 / (rank + 1) ** 0.5 for rank in range(customers)))
+    customer_segments = rng.choices(range(len(SEGMENTS)), SEGMENT_WEIGHTS, k=customers)
+    hour_cum = list(accumulate(HOUR_WEIGHTS))
+    quantity_cum = list(accumulate(QUANTITY_WEIGHTS))
+    hours = range(24)
+
+    emitted = 0
+    order_no = 0
+    recent = []  # Các dòng hợp lệ gần đây, nguồn cho dòng trùng
+    while emitted < line_items:
+        order_no += 1
+        customer = rng.choices(range(customers), cum_weights=customer_cum)[0]
+        segment_code, segment_description = SEGMENTS[customer_segments[customer]]
+        created_at = (start + timedelta(days=rng.randrange(days), hours=rng.choices(hours, cum_weights=hour_cum)[0],
+                                        seconds=rng.randrange(3600)))
+        order = [f"DH{order_no:07d}", created_at.strftime(DATE_FORMAT),
+                 f"KH{customer + 1:06d}", f"Khách hàng {customer + 1}",
+                 segment_code, segment_description]
+
+        items = min(rng.randint(1, MAX_ORDER_ITEMS), line_items - emitted)
+        chosen = set()
+        while len(chosen) < items:
+            chosen.update(rng.choices(range(len(products)), cum_weights=product_cum, k=items - len(chosen)))
+        for product in sorted(chosen):
+            category_code, category_name, product_code, product_name, price = products[product]
+            quantity = rng.choices(QUANTITIES, cum_weights=quantity_cum)[0]
+            row = order + [category_code, category_name, product_code, product_name,
+                           quantity, price, quantity * price]
+
+            draw = rng.random()
+            if draw < duplicate_ratio and recent:
+                row = rng.choice(recent)
+            elif draw < duplicate_ratio + invalid_ratio:
+                row = _invalid_row(rng, row)
+            else:
+                recent.append(row)
+                if len(recent) > 1000:
+                    recent = recent[-100:]
+            yield row
+            emitted += 1
+
+
+def _invalid_row(rng, row):
+    row = list(row)
+    kind = rng.choice(INVALID_KINDS)
+    if kind == "date":
+        row[1] = row[1].replace("-", "/")
+    elif kind == "quantity":
+        row[10] = "x"
+    elif kind == "product":
+        row[8] = ""
+    else:
+        row[2] = ""
+    return row
+
+
+def write_sales_csv(path, line_items, **options):
+    """Ghi tệp CSV dữ liệu bán hàng giả lập (UTF-8, có dòng tiêu đề), xem iter_sales_rows. Trả về số dòng đã ghi."""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for row in iter_sales_rows(line_items, **options):
+            writer.writerow(row)
+            count += 1
+    return count
@@ -1,3 +1,1196 @@
-from django.test import TestCase
+import codecs
+import csv
+import json
+import os
+import re
+import shutil
+import socket
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from functools import partial
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+import numpy as np
+from asgiref.sync import iscoroutinefunction
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.db.models import Count, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import analytics, basket, benchmark, charts, formats, jobs, metrics, payloads, rollups, snapshot, \
+    statistics, warmup
+from .cache import bump_generation, current_version, local_cache
+from .chart_context import ChartContext
+from .filters import ChartFilter
+from .ingest import DATE_FORMAT, ingest_file, iter_file_records, iter_lines, safe_int
+from .middleware import ServerTimingMiddleware
+from .parallel import iter_parsed_records, parse_range, read_header, split_byte_ranges
+from .processes import current_process_id
+from .sqlite_tuning import bulk_load_mode, restore_dropped_indexes
+from .models import Customer, Product, Order, OrderDetail, Segment, Category, IngestedFile, IngestJob, \
+    RowFingerprint, SalesRollup, SalesCalendar, DatasetVersion, DroppedIndex
+from .synthetic import CSV_COLUMNS, iter_sales_rows, write_sales_csv
+
+
+class SalesCsvMixin:
+    """Tệp CSV giả lập trong thư mục tạm, xoá sau mỗi lớp test."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp(prefix="sales-test-")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def write_csv(self, name, line_items, **options):
+        path = os.path.join(self.directory, name)
+        write_sales_csv(path, line_items, **options)
+        return path
+
+
+class IngestLedgerTests(SalesCsvMixin, TestCase):
+
+    def test_same_file_is_skipped(self):
+        path = self.write_csv("sales.csv", 300)
+        first = ingest_file(path)
+        second = ingest_file(path)
+        self.assertEqual(first.success_count, 300)
+        self.assertEqual(second.success_count, 0)
+        self.assertEqual(OrderDetail.objects.count(), 300)
+
+    def test_reupload_after_orm_wipe(self):
+        path = self.write_csv("sales.csv", 300)
+        ingest_file(path)
+        Order.objects.all().delete()
+        self.assertFalse(IngestedFile.objects.exists())
+
+        self.assertEqual(ingest_file(path).success_count, 300)
+        self.assertEqual(OrderDetail.objects.count(), 300)
+
+    def test_reupload_after_raw_wipe(self):
+        # Xoá bằng SQL trực tiếp cũng đi qua trigger xoá sổ cái tệp
+        path = self.write_csv("sales.csv", 300)
+        ingest_file(path)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {OrderDetail._meta.db_table}")
+
+        self.assertEqual(ingest_file(path).success_count, 300)
+
+    def test_partial_delete_reimports_deleted_rows(self):
+        path = self.write_csv("sales.csv", 300)
+        ingest_file(path)
+        deleted = list(OrderDetail.objects.order_by("id").values_list("id", flat=True)[:40])
+        OrderDetail.objects.filter(id__in=deleted).delete()
+
+        ingestor = ingest_file(path)
+        self.assertEqual(ingestor.success_count, 40)
+        self.assertEqual(OrderDetail.objects.count(), 300)
+
+    def test_partial_raw_delete_reimports_deleted_rows(self):
+        # Dấu vân tay còn lại của dòng đã bị xoá không làm dòng đó bị bỏ qua
+        path = self.write_csv("sales.csv", 300)
+        ingest_file(path)
+        deleted = list(OrderDetail.objects.order_by("id").values_list("id", flat=True)[:25])
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {OrderDetail._meta.db_table} WHERE id IN ({', '.join(map(str, deleted))})")
+
+        self.assertEqual(ingest_file(path).success_count, 25)
+
+
+class IterLinesTests(SalesCsvMixin, TestCase):
+    """Giải mã theo chunk phải cho đúng các dòng dù chunk cắt ngang ký tự nhiều byte, "\r\n" hay BOM."""
+
+    TEXT = "Mã đơn hàng,Tên nhóm hàng\r\nDH0000001,\"Trà củ, quả sấy\"\r\nDH0000002,Bột\r\n"
+
+    def chunked(self, data, size):
+        return [data[i:i + size] for i in range(0, len(data), size)]
+
+    def test_small_chunks(self):
+        data = self.TEXT.encode("utf-8")
+        for size in range(1, 8):
+            with self.subTest(size=size):
+                self.assertEqual(list(iter_lines(self.chunked(data, size))), self.TEXT.splitlines(keepends=True))
+
+    def test_split_multibyte_character(self):
+        data = "Trà hoa\n".encode("utf-8")
+        cut = data.index("à".encode("utf-8")) + 1
+        self.assertEqual(list(iter_lines([data[:cut], data[cut:]])), ["Trà hoa\n"])
+
+    def test_split_crlf(self):
+        self.assertEqual(list(iter_lines([b"a,b\r", b"\nc,d\r", b"\n"])), ["a,b\r\n", "c,d\r\n"])
+        self.assertEqual(list(iter_lines([b"a,b\r", b"\nc,d"])), ["a,b\r\n", "c,d"])
+
+    def test_bom(self):
+        data = codecs.BOM_UTF8 + self.TEXT.encode("utf-8")
+        for size in (1, 2, 4, 64):
+            with self.subTest(size=size):
+                self.assertEqual(list(iter_lines(self.chunked(data, size))), self.TEXT.splitlines(keepends=True))
+
+        # Tệp CSV xuất từ Excel có BOM: tên cột đầu tiên vẫn khớp, cả khi parse song song
+        path = self.write_csv("sales.csv", 100)
+        with open(path, "rb") as f:
+            content = f.read()
+        with open(path, "wb") as f:
+            f.write(codecs.BOM_UTF8 + content)
+        self.assertEqual(read_header(path)[0], CSV_COLUMNS)
+        self.assertEqual(ingest_file(path).success_count, 100)
+
+
+class ParallelParseTests(SalesCsvMixin, TestCase):
+    """Parse song song theo khoảng byte phải cho đúng các bản ghi (và số dòng lỗi) như đọc tuần tự."""
+
+    def setUp(self):
+        self.path = self.write_csv("sales.csv", 400, seed=2, duplicate_ratio=0.05, invalid_ratio=0.05)
+
+    def test_ranges_end_at_line_boundaries(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        fieldnames, start = read_header(self.path)
+        for chunk_bytes in (1, 37, 1000, len(data)):
+            with self.subTest(chunk_bytes=chunk_bytes):
+                ranges = list(split_byte_ranges(self.path, start, chunk_bytes))
+                self.assertEqual(ranges[0][0], start)
+                self.assertEqual(ranges[-1][1], len(data))
+                for (_, end), (begin, _) in zip(ranges, ranges[1:]):
+                    self.assertEqual(end, begin)
+                    self.assertEqual(data[end - 1:end], b"\n")
+
+    def test_straddling_lines_are_parsed_once(self):
+        # Khoảng nhỏ hơn một dòng: mọi ranh giới đều rơi giữa dòng
+        serial = list(iter_file_records(self.path))
+        fieldnames, start = read_header(self.path)
+        for chunk_bytes in (1, 37, 1000):
+            with self.subTest(chunk_bytes=chunk_bytes):
+                records = [record for begin, end in split_byte_ranges(self.path, start, chunk_bytes)
+                           for record in parse_range(self.path, fieldnames, begin, end)]
+                self.assertEqual(records, serial)
+
+    def test_parallel_matches_serial(self):
+        serial = list(iter_file_records(self.path))
+        self.assertEqual(list(iter_parsed_records(self.path, workers=2, chunk_bytes=4096)), serial)
+
+        with transaction.atomic():
+            expected = ingest_file(self.path).error_details
+            transaction.set_rollback(True)
+        with mock.patch("sales.parallel.iter_parsed_records", partial(iter_parsed_records, chunk_bytes=4096)):
+            self.assertEqual(ingest_file(self.path, workers=2).error_details, expected)
+        self.assertTrue(any(error.startswith("Dòng ") for error in expected))
+
+
+class DuplicateDetailTests(SalesCsvMixin, TestCase):
+    """Cặp (đơn hàng, mặt hàng) trùng bị ràng buộc UNIQUE chặn và dòng CSV tương ứng bị bỏ qua."""
+
+    def setUp(self):
+        self.path = self.write_csv("sales.csv", 20)
+        with open(self.path, encoding="utf-8", newline="") as f:
+            self.first = next(csv.DictReader(f))
+
+    def test_unique_constraint(self):
+        ingest_file(self.path)
+        detail = OrderDetail.objects.order_by("id").first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OrderDetail.objects.create(order=detail.order, product=detail.product, quantity=1, price=1, total=1)
+
+    def test_existing_detail_is_skipped(self):
+        # Chi tiết tạo ngoài luồng nạp (không có dấu vân tay): chỉ ràng buộc UNIQUE phát hiện được
+        ingest_file(self.path)
+        OrderDetail.objects.all().delete()
+        RowFingerprint.objects.all().delete()
+        order = Order.objects.get(order_code=self.first["Mã đơn hàng"])
+        product = Product.objects.get(product_code=self.first["Mã mặt hàng"])
+        OrderDetail.objects.create(order=order, product=product, quantity=9, price=1000, total=9000)
+
+        ingestor = ingest_file(self.path, batch_size=1)
+        self.assertEqual((ingestor.skipped_rows, ingestor.success_count), (1, 19))
+        self.assertEqual(ingestor.error_details, [
+            f"Dòng 1: Chi tiết đơn hàng bị trùng (Order: {order.order_code}, Product: {product.product_code})."
+        ])
+        self.assertEqual(OrderDetail.objects.get(order=order, product=product).quantity, 9)
+        self.assertEqual(OrderDetail.objects.count(), 20)
+
+
+class OrderDatePartsTests(TestCase):
+    """Ngày giờ địa phương (Asia/Bangkok, UTC+7) của đơn hàng khi đơn được tạo gần nửa đêm UTC."""
+
+    # created_at (UTC) -> (ngày, giờ, thứ) địa phương; 1 = Chủ Nhật ... 7 = Thứ Bảy
+    CASES = [
+        (datetime(2024, 3, 31, 16, 59, 59, tzinfo=dt_timezone.utc), (date(2024, 3, 31), 23, 1)),
+        (datetime(2024, 3, 31, 17, 30, tzinfo=dt_timezone.utc), (date(2024, 4, 1), 0, 2)),
+        (datetime(2024, 12, 31, 17, 0, tzinfo=dt_timezone.utc), (date(2025, 1, 1), 0, 4)),
+    ]
+
+    def create_orders(self):
+        customer = Customer.objects.create(customer_code="KH000001", name="Khách hàng 1")
+        return [Order.objects.create(order_code=f"DH{i:07d}", customer=customer, created_at=created_at)
+                for i, (created_at, _) in enumerate(self.CASES, 1)]
+
+    def assertDateParts(self, orders):
+        for order, (_, expected) in zip(orders, self.CASES):
+            order.refresh_from_db()
+            local_date = expected[0]
+            self.assertEqual((order.local_date, order.hour, order.weekday), expected)
+            self.assertEqual((order.year, order.month, order.day), (local_date.year, local_date.month, local_date.day))
+
+    def test_save(self):
+        self.assertDateParts(self.create_orders())
+
+    def test_backfill(self):
+        orders = self.create_orders()
+        Order.objects.update(local_date=date(2000, 1, 1), year=2000, month=1, day=1, weekday=1, hour=0)
+        backfill = import_module("sales.migrations.0011_backfill_order_date_parts").backfill_date_parts
+        backfill(django_apps, mock.Mock(connection=connection))
+
+        self.assertDateParts(orders)
+        self.assertEqual(sorted(SalesCalendar.objects.values_list("date", "hour", "weekday", "order_count")),
+                         sorted(expected + (1,) for _, expected in self.CASES))
+
+
+class SnapshotTests(TestCase):
+    """Snapshot dạng cột: ghi / đọc lại, từ chối phiên bản khác, hai tiến trình cùng ghi một thế hệ."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="sales-snapshot-")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.version = (7, timezone.now())
+        self.labels = {"product_codes": ["BOT01", "SET01"], "segment_codes": [None, "C11"]}
+        self.columns = {"detail_total": np.arange(5, dtype=np.int64) * 1000,
+                        "order_customer": np.array([1, 0, 1], dtype=np.int64)}
+
+    def assertSnapshot(self, loaded):
+        version, labels, columns = loaded
+        self.assertEqual(version, self.version)
+        self.assertEqual(labels, self.labels)
+        self.assertEqual(set(columns), set(self.columns))
+        for name, values in self.columns.items():
+            self.assertIsInstance(columns[name], np.memmap)
+            np.testing.assert_array_equal(columns[name], values)
+
+    def entries(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_round_trip(self):
+        snapshot.write(self.version, self.labels, self.columns, directory=self.directory)
+        self.assertSnapshot(snapshot.read(self.version, directory=self.directory))
+        self.assertSnapshot(snapshot.read(directory=self.directory))
+
+    def test_version_mismatch(self):
+        path = snapshot.write(self.version, self.labels, self.columns, directory=self.directory)
+        generation, updated_at = self.version
+        self.assertIsNone(snapshot.read((generation + 1, updated_at), directory=self.directory))
+        # Cùng số thế hệ của một database khác (tạo lại)
+        self.assertIsNone(snapshot.read((generation, updated_at + timedelta(seconds=1)), directory=self.directory))
+
+        manifest_path = os.path.join(path, snapshot.MANIFEST_FILE)
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        manifest["format"] = snapshot.FORMAT_VERSION + 1
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        self.assertIsNone(snapshot.read(directory=self.directory))
+
+    def test_racing_writers(self):
+        # Tiến trình khác ghi xong cùng thế hệ ngay trước khi thư mục tạm được đổi tên
+        replace = os.replace
+        other_writes = []
+
+        def replace_after_other_writer(source, target):
+            if os.path.basename(source).startswith(".gen-") and not os.path.exists(target):
+                with mock.patch("os.replace", replace):
+                    other_writes.append(snapshot.write(self.version, self.labels, self.columns,
+                                                       directory=self.directory))
+            replace(source, target)
+
+        with mock.patch("os.replace", replace_after_other_writer):
+            path = snapshot.write(self.version, self.labels, self.columns, directory=self.directory)
+        self.assertEqual(other_writes, [path])
+        self.assertEqual(self.entries(), [snapshot.CURRENT_FILE, os.path.basename(path)])
+        self.assertSnapshot(snapshot.read(self.version, directory=self.directory))
+
+
+class RollupTests(SalesCsvMixin, TestCase):
+    """Bảng tổng hợp và lịch bán hàng phải khớp với dữ liệu tính trực tiếp bằng ORM."""
+
+    def assertRollupsMatch(self):
+        expected = sorted(rollups.aggregate_details(OrderDetail.objects.all()))
+        stored = sorted(SalesRollup.objects.values_list(*rollups.BUCKET_COLUMNS, *rollups.MEASURE_COLUMNS))
+        self.assertEqual(stored, expected)
+
+        expected_calendar = sorted(Order.objects.values_list('local_date', 'hour').annotate(count=Count('id')))
+        stored_calendar = sorted(SalesCalendar.objects.filter(order_count__gt=0)
+                                 .values_list('date', 'hour', 'order_count'))
+        self.assertEqual(stored_calendar, expected_calendar)
+
+    def test_ingest_in_several_batches(self):
+        path = self.write_csv("sales.csv", 1200, duplicate_ratio=0.05, invalid_ratio=0.05)
+        ingest_file(path, batch_size=250)
+        self.assertRollupsMatch()
+
+    def test_delete_details(self):
+        ingest_file(self.write_csv("sales.csv", 600))
+        generation = current_version()[0]
+        OrderDetail.objects.filter(id__in=OrderDetail.objects.order_by("id").values("id")[:100]).delete()
+        self.assertRollupsMatch()
+        self.assertGreater(current_version()[0], generation)
+        self.assertFalse(IngestedFile.objects.exists())
+
+    def test_delete_single_detail(self):
+        ingest_file(self.write_csv("sales.csv", 300))
+        detail = OrderDetail.objects.order_by("id").first()
+        generation = current_version()[0]
+        # Không có signal post_delete: Django xoá bằng một câu DELETE (fast delete)
+        with self.assertNumQueries(1):
+            OrderDetail.objects.filter(pk=detail.pk).delete()
+        self.assertRollupsMatch()
+        self.assertEqual(current_version()[0], generation + 1)
+
+    def test_raw_sql_delete(self):
+        ingest_file(self.write_csv("sales.csv", 300))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {OrderDetail._meta.db_table} WHERE id % 7 = 0")
+        self.assertRollupsMatch()
+
+    def test_cascade_delete_customers(self):
+        ingest_file(self.write_csv("sales.csv", 600))
+        Customer.objects.filter(id__in=Customer.objects.order_by("id").values("id")[:5]).delete()
+        self.assertRollupsMatch()
+
+    def test_wipe(self):
+        ingest_file(self.write_csv("sales.csv", 300))
+        Order.objects.all().delete()
+        self.assertFalse(SalesRollup.objects.exists())
+        self.assertFalse(SalesCalendar.objects.exists())
+
+    def test_null_buckets_are_merged(self):
+        # NULL trong khoá bucket không được coi là khác nhau: cộng hai lần vẫn là một dòng
+        product = Product.objects.create(product_code="ZZZ01", product_name="Test", unit_price=1000)
+        key = (date(2024, 1, 1), 9, product.id, None, None)
+        rollups.add_buckets({key: (1000, 2, 1)})
+        rollups.add_buckets({key: (500, 1, 1)})
+        self.assertEqual(list(SalesRollup.objects.filter(product=product)
+                              .values_list(*rollups.MEASURE_COLUMNS)), [(1500, 3, 2)])
+
+    def test_delete_category(self):
+        ingest_file(self.write_csv("sales.csv", 600))
+        generation = current_version()[0]
+        Category.objects.order_by("id").first().delete()
+        self.assertTrue(SalesRollup.objects.filter(category=None).exists())
+        self.assertRollupsMatch()
+        self.assertGreater(current_version()[0], generation)
+
+    def test_delete_segments(self):
+        # Hai phân khúc cùng thành NULL: bucket của chúng phải được gộp
+        ingest_file(self.write_csv("sales.csv", 600))
+        generation = current_version()[0]
+        Segment.objects.filter(id__in=Segment.objects.order_by("id").values("id")[:2]).delete()
+        self.assertTrue(SalesRollup.objects.filter(segment=None).exists())
+        self.assertRollupsMatch()
+        self.assertGreater(current_version()[0], generation)
+
+    def test_move_product_category(self):
+        ingest_file(self.write_csv("sales.csv", 600))
+        categories = list(Category.objects.order_by("id"))
+        Product.objects.filter(category=categories[0]).update(category=categories[1])
+        self.assertRollupsMatch()
+
+    def test_rolled_back_delete_keeps_rollups(self):
+        ingest_file(self.write_csv("sales.csv", 300))
+        generation = current_version()[0]
+        try:
+            with transaction.atomic():
+                OrderDetail.objects.all().delete()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertRollupsMatch()
+        self.assertEqual(current_version()[0], generation)
+
+
+class QueryCountTests(SalesCsvMixin, TransactionTestCase):
+    """
+    Câu SQL chạy trên kết nối riêng của các thread làm việc (ChartContext.fetch song song)
+    phải được đếm. TransactionTestCase: dữ liệu phải được commit để các kết nối đó đọc được.
+    """
+
+    def setUp(self):
+        ingest_file(self.write_csv("sales.csv", 300))
+        local_cache.clear()
+        metrics.chart_metrics.reset()
+
+    def test_concurrent_fetch_counts_worker_queries(self):
+        timer = metrics.QueryTimer()
+        with metrics.track_queries(timer):
+            orders, details, customers = ChartContext(concurrent=True).fetch(
+                Order.objects.all(), OrderDetail.objects.values("id"), Customer.objects.count
+            )
+        self.assertEqual((len(orders), len(details)), (Order.objects.count(), 300))
+        self.assertEqual(customers, Customer.objects.count())
+        self.assertEqual(timer.count, 3)
+        self.assertGreater(timer.seconds, 0)
+
+    def test_concurrent_fetch_closes_worker_connections(self):
+        # Kể cả kết nối được phép giữ lâu (CONN_MAX_AGE = None -> close_at = None). SQLite trong bộ nhớ
+        # (database test) bỏ qua close() nên chỉ kiểm tra close() được gọi cho kết nối của worker
+        def worker_connection():
+            worker = connections[DEFAULT_DB_ALIAS]
+            Order.objects.count()
+            worker.close_at = None
+            return worker
+
+        with mock.patch.object(type(connections[DEFAULT_DB_ALIAS]), "close", autospec=True) as close:
+            workers = ChartContext(concurrent=True).fetch(worker_connection, worker_connection)
+        closed = [call.args[0] for call in close.call_args_list]
+        for worker in workers:
+            self.assertIsNot(worker, connections[DEFAULT_DB_ALIAS])
+            self.assertIn(worker, closed)
+
+    async def test_async_endpoint_records_queries(self):
+        response = await self.async_client.get("/api/async/chart-data/Q5/")
+        self.assertEqual(response.status_code, 200)
+        stats = metrics.chart_metrics.summary()["orm"]["Q5"]
+        # Q5 chạy hai truy vấn song song
+        self.assertEqual(stats["queries"]["max"], 2)
+
+
+class WarmupTests(SalesCsvMixin, TransactionTestCase):
+    """Làm nóng cache chạy trong các thread có kết nối riêng: dữ liệu phải được commit."""
+
+    def setUp(self):
+        ingest_file(self.write_csv("sales.csv", 300))
+        local_cache.clear()
+        self.addCleanup(local_cache.clear)
+
+    def test_warmed_charts_are_served_from_cache(self):
+        results = warmup.warm_up(param_sets=[{}], workers=2)
+        questions = [name for name, spec in charts.CHARTS.items() if spec.cacheable]
+        self.assertEqual(sorted(question for group, _, _ in results for question in group), sorted(questions))
+        self.assertTrue(all(seconds is not None for _, _, seconds in results))
+
+        for question in questions:
+            with self.subTest(question=question), CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.client.get(f"/api/chart-data/{question}/").status_code, 200)
+                # Chỉ còn câu đọc thế hệ dữ liệu để chọn khoá cache
+                self.assertEqual([query["sql"] for query in captured
+                                  if DatasetVersion._meta.db_table not in query["sql"]], [])
+
+    def test_generation_bump_skips_remaining_groups(self):
+        chart_payloads = payloads.chart_payloads
+
+        def compute_then_ingest(*args, **kwargs):
+            result = chart_payloads(*args, **kwargs)
+            bump_generation()
+            return result
+
+        with mock.patch.object(payloads, "chart_payloads", side_effect=compute_then_ingest):
+            results = warmup.warm_up(param_sets=[{}], workers=1)
+        seconds = [seconds for _, _, seconds in results]
+        self.assertGreater(len(seconds), 1)
+        self.assertIsNotNone(seconds[0])
+        self.assertEqual(seconds[1:], [None] * (len(seconds) - 1))
+
+
+class ServerTimingTests(SalesCsvMixin, TransactionTestCase):
+
+    def setUp(self):
+        ingest_file(self.write_csv("sales.csv", 300))
+        local_cache.clear()
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+
+    def query_count(self, response):
+        match = re.search(r'db;dur=[0-9.]+;desc="(\d+) queries"', response["Server-Timing"])
+        self.assertIsNotNone(match, response["Server-Timing"])
+        return int(match.group(1))
+
+    def test_async_chain_stays_async(self):
+        async def view(request):
+            return None
+
+        self.assertTrue(iscoroutinefunction(ServerTimingMiddleware(view)))
+        self.assertFalse(iscoroutinefunction(ServerTimingMiddleware(lambda request: None)))
+
+    def test_sync_endpoint(self):
+        response = self.client.get("/api/chart-data/Q5/")
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(self.query_count(response), 0)
+
+    async def test_async_endpoint(self):
+        response = await self.async_client.get("/api/async/chart-data/Q5/")
+        self.assertEqual(response.status_code, 200)
+        # Phiên bản dữ liệu và hai truy vấn song song của Q5 trên các thread làm việc
+        self.assertGreaterEqual(self.query_count(response), 3)
+
+    async def test_async_profile_for_staff(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get("/api/async/chart-data/Q5/?profile=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("profile", response.json())
+        self.assertGreater(self.query_count(response), 0)
+
+    async def test_async_profile_ignored_for_anonymous(self):
+        response = await self.async_client.get("/api/async/chart-data/Q5/?profile=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("profile", response.json())
+
+
+class IngestJobRecoveryTests(SalesCsvMixin, TestCase):
+    """Job và tệp tải lên bị bỏ lại khi tiến trình xử lý dừng giữa chừng."""
+
+    def setUp(self):
+        media = override_settings(MEDIA_ROOT=self.directory)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def create_job(self, worker, state=IngestJob.STATE_RUNNING, age=None):
+        file_path = default_storage.save(os.path.join(jobs.UPLOAD_DIR, "sales.csv"), ContentFile(b"x"))
+        job = IngestJob.objects.create(file_name="sales.csv", file_path=file_path, state=state, worker=worker)
+        if age is not None:
+            IngestJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - age)
+        return job
+
+    def assertFailed(self, job, failed=True):
+        job.refresh_from_db()
+        self.assertEqual(job.state == IngestJob.STATE_FAILED, failed)
+        self.assertEqual(default_storage.exists(job.file_path), not failed)
+
+    def test_jobs_of_stopped_process_fail(self):
+        # Cùng máy, cùng pid nhưng khác mã: tiến trình trước khi khởi động lại
+        restarted = self.create_job(f"{socket.gethostname()}:{os.getpid()}:old")
+        pending = self.create_job("", state=IngestJob.STATE_PENDING)
+        own = self.create_job(current_process_id(), state=IngestJob.STATE_PENDING)
+
+        with self.assertLogs("sales.jobs", "WARNING"):
+            self.assertEqual(jobs.recover_orphaned_jobs(), 2)
+        self.assertFailed(restarted)
+        self.assertFailed(pending)
+        self.assertFailed(own, failed=False)
+
+    def test_jobs_of_other_hosts_expire(self):
+        recent = self.create_job("other-host:1:abc")
+        stale = self.create_job("other-host:1:abc", age=jobs.ORPHAN_AFTER + timedelta(minutes=1))
+
+        with self.assertLogs("sales.jobs", "WARNING"):
+            jobs.recover_orphaned_jobs()
+        self.assertFailed(recent, failed=False)
+        self.assertFailed(stale)
+
+    def test_stale_uploads_are_removed(self):
+        old = default_storage.save(os.path.join(jobs.UPLOAD_DIR, "old.csv"), ContentFile(b"x"))
+        new = default_storage.save(os.path.join(jobs.UPLOAD_DIR, "new.csv"), ContentFile(b"x"))
+        expired = (timezone.now() - jobs.ORPHAN_AFTER - timedelta(minutes=1)).timestamp()
+        os.utime(default_storage.path(old), (expired, expired))
+
+        jobs.recover_orphaned_jobs()
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(new))
+
+    def test_failed_job_removes_upload(self):
+        job = self.create_job(current_process_id(), state=IngestJob.STATE_PENDING)
+        # Job chạy trong thread nền tự đóng kết nối, không được đóng kết nối của transaction test
+        with mock.patch.object(jobs, "_ingest_file", side_effect=ValueError("hỏng")), \
+                mock.patch.object(jobs, "close_old_connections"), mock.patch.object(jobs, "connection"), \
+                self.assertLogs("sales.jobs", "ERROR"):
+            jobs.run_job(job.pk)
+        self.assertFailed(job)
+        self.assertIn("hỏng", job.message)
+
+
+    def test_row_errors_are_logged(self):
+        path = self.write_csv("sales.csv", 200, seed=4, invalid_ratio=0.1)
+        with open(path, "rb") as f:
+            file_path = default_storage.save(os.path.join(jobs.UPLOAD_DIR, "sales.csv"), f)
+        job = IngestJob.objects.create(file_name="sales.csv", file_path=file_path, worker=current_process_id())
+        with mock.patch.object(jobs, "close_old_connections"), mock.patch.object(jobs, "connection"), \
+                mock.patch.object(jobs.warmup, "schedule"), mock.patch("sys.stdout") as stdout, \
+                self.assertLogs("sales.jobs", "WARNING") as logs:
+            jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.state, IngestJob.STATE_DONE)
+        self.assertGreater(job.rows_skipped, 0)
+        self.assertFalse(stdout.write.called)
+        [record] = logs.records
+        self.assertEqual(record.getMessage().count("\nDòng "), job.rows_skipped)
+
+class BulkLoadIndexTests(TransactionTestCase):
+    """Index phụ bị xoá tạm khi nạp hàng loạt phải được tạo lại kể cả khi tiến trình nạp bị dừng."""
+
+    def indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s",
+                           [Order._meta.db_table])
+            return {name for name, in cursor.fetchall()}
+
+    def test_dropped_indexes_are_recorded(self):
+        before = self.indexes()
+        with bulk_load_mode(models=[Order]):
+            recorded = set(DroppedIndex.objects.values_list("name", flat=True))
+            self.assertTrue(recorded)
+            self.assertEqual(self.indexes(), before - recorded)
+        self.assertEqual(self.indexes(), before)
+        self.assertFalse(DroppedIndex.objects.exists())
+
+    def test_interrupted_load_is_restored(self):
+        before = self.indexes()
+        load = bulk_load_mode(models=[Order])
+        load.__enter__()
+        try:
+            # Tiến trình đang nạp còn chạy: không đụng tới index của nó
+            self.assertEqual(restore_dropped_indexes(), [])
+            # Giả lập tiến trình nạp đã bị dừng (khởi động lại với pid cũ)
+            DroppedIndex.objects.update(worker=f"{socket.gethostname()}:{os.getpid()}:old")
+            self.assertTrue(restore_dropped_indexes())
+            self.assertEqual(self.indexes(), before)
+            self.assertFalse(DroppedIndex.objects.exists())
+        finally:
+            load.__exit__(None, None, None)
+        self.assertEqual(self.indexes(), before)
+
+
+class BoxPlotTests(TestCase):
+    """box_plot không sắp xếp toàn bộ nhưng phải cho kết quả như tính trên mảng đã sắp xếp."""
+
+    def expected(self, values, max_points, sample):
+        ordered = np.sort(values)
+        n = len(ordered)
+        q1, median, q3 = (int(ordered[int(n * p)]) for p in (0.25, 0.5, 0.75))
+        iqr = q3 - q1
+        inside = ordered[(ordered >= q1 - 1.5 * iqr) & (ordered <= q3 + 1.5 * iqr)]
+        return {
+            'count': n, 'min': int(ordered[0]), 'q1': q1, 'median': median, 'q3': q3, 'max': int(ordered[-1]),
+            'whisker_bottom': int(inside[0]), 'whisker_top': int(inside[-1]),
+            'outlier_count': n - len(inside),
+            'points': ordered[statistics.sample_ranks(n, max_points, sample)].tolist(),
+        }
+
+    def test_matches_sorted_reference(self):
+        rng = np.random.default_rng(0)
+        for n in (4, 37, 1000):
+            # Phân phối lệch kèm outlier hai phía và nhiều giá trị trùng
+            values = np.concatenate([rng.integers(1000, 2000, n), rng.integers(0, 10, n // 10 + 1),
+                                     rng.integers(10 ** 6, 10 ** 7, n // 10 + 1), np.full(n // 4, 1500)])
+            rng.shuffle(values)
+            for max_points in (0, 3, 200, len(values)):
+                for sample in statistics.SAMPLE_MODES:
+                    with self.subTest(n=n, max_points=max_points, sample=sample):
+                        self.assertEqual(statistics.box_plot(values, max_points, sample),
+                                         self.expected(values, max_points, sample))
+
+    def test_small_groups(self):
+        self.assertIsNone(statistics.box_plot([]))
+        self.assertEqual(statistics.box_plot([7])["median"], 7)
+        self.assertEqual(statistics.box_plot([5, 1, 3])["q3"], 1)
+
+
+class SyntheticCsvTests(SalesCsvMixin, TestCase):
+    """Bộ sinh CSV giả lập: tất định theo seed, đúng bố cục cột, tỉ lệ dòng trùng / lỗi được bộ nạp bỏ qua."""
+
+    def test_deterministic(self):
+        rows = list(iter_sales_rows(500, seed=5))
+        self.assertEqual(list(iter_sales_rows(500, seed=5)), rows)
+        self.assertNotEqual(list(iter_sales_rows(500, seed=6)), rows)
+        self.assertTrue(all(len(row) == len(CSV_COLUMNS) for row in rows))
+
+    def test_skipped_rows_match_generated_ratios(self):
+        options = {"seed": 9, "duplicate_ratio": 0.05, "invalid_ratio": 0.05}
+        invalid = duplicates = 0
+        seen = set()
+        for row in iter_sales_rows(2000, **options):
+            if not row[2] or not row[8] or row[10] == "x" or "/" in row[1]:
+                invalid += 1
+            elif (row[0], row[8]) in seen:
+                duplicates += 1
+            else:
+                seen.add((row[0], row[8]))
+        self.assertGreater(invalid, 0)
+        self.assertGreater(duplicates, 0)
+
+        ingestor = ingest_file(self.write_csv("sales.csv", 2000, **options))
+        self.assertEqual((ingestor.total_rows, ingestor.skipped_rows), (2000, invalid + duplicates))
+        self.assertEqual(OrderDetail.objects.count(), len(seen))
+
+
+class BenchmarkTests(SalesCsvMixin, TestCase):
+
+    def test_chart_latency(self):
+        ingest_file(self.write_csv("sales.csv", 300))
+        results = benchmark.chart_latency(["Q1", "Q2"], repeat=3)
+        self.assertEqual(list(results), ["Q1", "Q2"])
+        for entry in results.values():
+            self.assertEqual(set(entry["latency_ms"]), {"p50", "p95", "mean", "min", "max"})
+            self.assertGreater(entry["queries"], 0)
+            self.assertGreater(entry["payload_bytes"], 0)
+
+    def test_compare_flags_regressions(self):
+        baseline = {"Q1": 10.0, "Q2": 10.0, "Q3": 5.0}
+        current = {"Q1": 10.5, "Q2": 12.0, "Q4": 1.0}
+        self.assertEqual(benchmark.compare(baseline, current, float), [
+            ("Q1", 10.0, 10.5, 1.05, False),
+            ("Q2", 10.0, 12.0, 1.2, True),
+        ])
+
+
+class HistogramTests(TestCase):
+
+    def counts(self, bins):
+        return [(item["x0"], item["x1"], item["count"]) for item in bins]
+
+    def test_empty(self):
+        for options in ({}, {"bins": 10}, {"log": True}):
+            with self.subTest(**options):
+                self.assertEqual(statistics.histogram([], **options), [])
+                self.assertEqual(statistics.histogram([-5, -1], **options), [])
+
+    def test_bin_width(self):
+        # Bin cuối kết thúc ở max và chứa cả max; giá trị âm bị bỏ qua
+        values = [-1, 0, 10, 49999, 50000, 120000]
+        self.assertEqual(self.counts(statistics.histogram(values, bin_width=50000)),
+                         [(0, 50000, 3), (50000, 100000, 1), (100000, 120000, 1)])
+        self.assertEqual(self.counts(statistics.histogram([0, 0])), [(0, 0, 2)])
+
+    def test_bins_override_bin_width(self):
+        self.assertEqual(self.counts(statistics.histogram([0, 24, 25, 99, 100], bin_width=10, bins=4)),
+                         [(0.0, 25.0, 2), (25.0, 50.0, 1), (50.0, 75.0, 0), (75.0, 100.0, 2)])
+
+    def test_log(self):
+        # Giá trị nhỏ hơn giá trị dương nhỏ nhất (0) được tính vào bin đầu
+        self.assertEqual(self.counts(statistics.histogram([0, 1, 10, 100, 1000], bins=3, log=True)),
+                         [(1.0, 10.0, 2), (10.0, 100.0, 1), (100.0, 1000.0, 2)])
+        self.assertEqual(len(statistics.histogram([5, 50000], log=True)), statistics.DEFAULT_LOG_BINS)
+        self.assertEqual(self.counts(statistics.histogram([0, 0], log=True)), [(0, 0, 2)])
+        self.assertEqual(self.counts(statistics.histogram([7, 7], log=True)), [(7, 7, 2)])
+
+    def test_max_bins(self):
+        values = np.arange(0, 10_000_001, 997)
+        for options in ({"bin_width": 1}, {"bins": 50_000}, {"bins": 50_000, "log": True}):
+            with self.subTest(**options):
+                bins = statistics.histogram(values, **options)
+                self.assertEqual(len(bins), statistics.MAX_BINS)
+                self.assertEqual(sum(item["count"] for item in bins), len(values))
+                self.assertEqual(bins[-1]["x1"], values.max())
+
+    def test_options(self):
+        self.assertEqual(statistics.histogram_options({}),
+                         {"bin_width": statistics.DEFAULT_BIN_WIDTH, "bins": None, "log": False})
+        self.assertEqual(statistics.histogram_options({"bin_width": "-3", "bins": "x", "log": "1"}),
+                         {"bin_width": statistics.DEFAULT_BIN_WIDTH, "bins": None, "log": True})
+        self.assertEqual(statistics.histogram_options({"bin_width": "1000", "bins": "30"}),
+                         {"bin_width": 1000, "bins": 30, "log": False})
+
+
+class BasketTests(TestCase):
+    """Support / confidence / lift của một giỏ hàng nhỏ tính tay, ở mức mặt hàng và nhóm hàng."""
+
+    # Đơn 0: A, B (dòng B lặp lại) | đơn 1: A, B, C | đơn 2: A, C | đơn 3: B | đơn 4: D
+    ORDERS = [0, 0, 0, 1, 1, 1, 2, 2, 3, 4]
+    PRODUCTS = [0, 1, 1, 0, 1, 2, 0, 2, 1, 3]
+    # A, B thuộc nhóm X; C thuộc Y; D thuộc Z
+    PRODUCT_CATEGORY = np.array([0, 0, 1, 2])
+
+    def chart(self, level="product", product_mask=None, **params):
+        if level == "product":
+            codes, names = ["A", "B", "C", "D"], ["Mặt hàng A", "Mặt hàng B", "Mặt hàng C", "Mặt hàng D"]
+        else:
+            codes, names = ["X", "Y", "Z"], ["Nhóm X", "Nhóm Y", "Nhóm Z"]
+        options = basket.parse_options({"level": level, **params})
+        return basket.basket_chart(np.array(self.ORDERS), np.array(self.PRODUCTS), self.PRODUCT_CATEGORY,
+                                   codes, names, product_mask, options)
+
+    def pairs(self, data):
+        return [(pair["code_a"], pair["code_b"], pair["order_count"], round(pair["support"], 6),
+                 round(pair["confidence_ab"], 6), round(pair["confidence_ba"], 6), round(pair["lift"], 6))
+                for pair in data["pairs"]]
+
+    def test_products(self):
+        # N = 5 đơn; A, B có trong 3 đơn, C trong 2 đơn
+        data = self.chart()
+        self.assertEqual((data["level"], data["total_orders"]), ("product", 5))
+        self.assertEqual(self.pairs(data), [
+            ("A", "B", 2, 0.4, round(2 / 3, 6), round(2 / 3, 6), round(10 / 9, 6)),
+            ("A", "C", 2, 0.4, round(2 / 3, 6), 1.0, round(5 / 3, 6)),
+            ("B", "C", 1, 0.2, round(1 / 3, 6), 0.5, round(5 / 6, 6)),
+        ])
+
+    def test_sort_and_min_count(self):
+        self.assertEqual([pair[:2] for pair in self.pairs(self.chart(sort="lift"))],
+                         [("A", "C"), ("A", "B"), ("B", "C")])
+        self.assertEqual([pair[:2] for pair in self.pairs(self.chart(sort="confidence"))],
+                         [("A", "C"), ("A", "B"), ("B", "C")])
+        self.assertEqual([pair[:2] for pair in self.pairs(self.chart(min_count="2", top="1"))], [("A", "B")])
+
+    def test_product_mask(self):
+        # Chỉ giữ các cặp có ít nhất một phía là C
+        data = self.chart(product_mask=np.array([False, False, True, False]))
+        self.assertEqual([pair[:2] for pair in self.pairs(data)], [("A", "C"), ("B", "C")])
+
+    def test_categories(self):
+        # Theo nhóm: X có trong 4 đơn, Y trong 2 đơn, cả hai trong 2 đơn
+        data = self.chart(level="category")
+        self.assertEqual((data["level"], data["total_orders"]), ("category", 5))
+        self.assertEqual(self.pairs(data), [("X", "Y", 2, 0.4, 0.5, 1.0, 1.25)])
+
+
+def ingest_per_row(path):
+    """
+    Cách nạp từng dòng bằng get_or_create của trang Upload ban đầu, làm chuẩn so sánh cho
+    BulkIngestor. Trả về (tổng số dòng, số dòng bỏ qua, thông báo lỗi).
+    """
+    total_rows = 0
+    skipped_rows = 0
+    error_details = []
+    with open(path, encoding="utf-8", newline="") as f, transaction.atomic():
+        for row in csv.DictReader(f):
+            total_rows += 1
+            try:
+                date_str = row.get("Thời gian tạo đơn", "").strip()
+                try:
+                    # Bản gốc lưu datetime naive, Django hiểu theo TIME_ZONE (kèm cảnh báo)
+                    created_at = timezone.make_aware(datetime.strptime(date_str, DATE_FORMAT))
+                except ValueError:
+                    error_details.append(f"Dòng {total_rows}: Lỗi định dạng ngày ({date_str}).")
+                    skipped_rows += 1
+                    continue
+
+                segment, _ = Segment.objects.get_or_create(
+                    segment_code=row.get("Mã PKKH", "").strip(),
+                    defaults={"description": row.get("Mô tả Phân Khúc Khách hàng", "").strip()}
+                )
+                customer_code = row.get("Mã khách hàng", "").strip()
+                if not customer_code:
+                    error_details.append(f"Dòng {total_rows}: Thiếu mã khách hàng.")
+                    skipped_rows += 1
+                    continue
+                customer, _ = Customer.objects.get_or_create(
+                    customer_code=customer_code,
+                    defaults={"name": row.get("Tên khách hàng", "").strip(), "segment": segment}
+                )
+                category, _ = Category.objects.get_or_create(
+                    category_code=row.get("Mã nhóm hàng", "").strip(),
+                    defaults={"category_name": row.get("Tên nhóm hàng", "").strip()}
+                )
+                product_code = row.get("Mã mặt hàng", "").strip()
+                if not product_code:
+                    error_details.append(f"Dòng {total_rows}: Thiếu mã sản phẩm.")
+                    skipped_rows += 1
+                    continue
+                product, _ = Product.objects.get_or_create(
+                    product_code=product_code,
+                    defaults={"product_name": row.get("Tên mặt hàng", "").strip(), "category": category,
+                              "unit_price": safe_int(row.get("Đơn giá"))}
+                )
+                order_code = row.get("Mã đơn hàng", "").strip()
+                order, _ = Order.objects.get_or_create(order_code=order_code, customer=customer,
+                                                       defaults={"created_at": created_at})
+
+                quantity = safe_int(row.get("SL"))
+                price = safe_int(row.get("Đơn giá"))
+                if quantity is None or price is None:
+                    error_details.append(f"Dòng {total_rows}: Số lượng hoặc đơn giá không hợp lệ.")
+                    skipped_rows += 1
+                    continue
+
+                if not OrderDetail.objects.filter(order=order, product=product).exists():
+                    OrderDetail.objects.create(order=order, product=product, quantity=quantity, price=price,
+                                               total=quantity * price)
+                else:
+                    error_details.append(f"Dòng {total_rows}: Chi tiết đơn hàng bị trùng "
+                                         f"(Order: {order_code}, Product: {product_code}).")
+                    skipped_rows += 1
+            except Exception as e:
+                error_details.append(f"Dòng {total_rows}: Lỗi không xác định - {e}")
+                skipped_rows += 1
+    return total_rows, skipped_rows, error_details
+
+
+class IngestParityTests(SalesCsvMixin, TestCase):
+    """BulkIngestor phải cho cùng dữ liệu, số đếm và thông báo lỗi như cách nạp từng dòng."""
+
+    # Các dòng viết tay cho những trường hợp bộ sinh dữ liệu không tạo ra
+    EXTRA_ROWS = [
+        # Mã đơn đã thuộc về khách hàng khác
+        ["DH0000001", "2024-02-01 10:00:00", "KH999999", "Khách mới", "C11", "Khách hàng lẻ",
+         "BOT", "Bột", "BOT01", "Bột 01", "1", "20000", "20000"],
+        # Mặt hàng mới không có đơn giá
+        ["DH9000001", "2024-02-02 11:00:00", "KH000001", "Khách hàng 1", "C11", "Khách hàng lẻ",
+         "NEW", "Nhóm mới", "NEW01", "Mặt hàng mới", "2", "", ""],
+        # Trùng (đơn, mặt hàng) với khác số lượng
+        ["DH9000002", "2024-02-03 12:00:00", "KH000002", "Khách hàng 2", "C12", "Khách hàng thân thiết",
+         "SET", "Set trà", "SET01", "Set trà 01", "1", "30000", "30000"],
+        ["DH9000002", "2024-02-03 12:00:00", "KH000002", "Khách hàng 2", "C12", "Khách hàng thân thiết",
+         "SET", "Set trà", "SET01", "Set trà 01", "3", "30000", "90000"],
+        # Ngày sai và khoảng trắng thừa
+        ["DH9000003", "2024-13-01 00:00:00", "KH000003", "Khách hàng 3", "C11", "Khách hàng lẻ",
+         "BOT", "Bột", "BOT02", "Bột 02", "1", "20000", "20000"],
+        [" DH9000004 ", " 2024-03-01 08:30:00 ", " KH000004 ", "Khách hàng 4", "C13", "Khách hàng doanh nghiệp",
+         "BOT", "Bột", " BOT02 ", "Bột 02", " 2 ", "20000", "40000"],
+    ]
+
+    def write_rows(self, name, rows):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS)
+            writer.writerows(rows)
+        return path
+
+    def read_rows(self, path):
+        with open(path, encoding="utf-8", newline="") as f:
+            return list(csv.reader(f))[1:]
+
+    def tables(self):
+        return {
+            "segments": sorted(Segment.objects.values_list("segment_code", "description")),
+            "customers": sorted(Customer.objects.values_list("customer_code", "name", "segment__segment_code")),
+            "categories": sorted(Category.objects.values_list("category_code", "category_name")),
+            "products": sorted(Product.objects.values_list("product_code", "product_name",
+                                                           "category__category_code", "unit_price")),
+            "orders": sorted(Order.objects.values_list("order_code", "customer__customer_code", "created_at",
+                                                       "local_date", "year", "month", "day", "weekday", "hour")),
+            "details": sorted(OrderDetail.objects.values_list("order__order_code", "product__product_code",
+                                                              "quantity", "price", "total")),
+        }
+
+    def by_row(self, errors):
+        # Dòng trùng chỉ được phát hiện khi ghi lô nên báo sau các lỗi khác của cùng lô
+        return sorted(errors, key=lambda error: int(error.split(":", 1)[0].split()[1]))
+
+    def assertMatchesPerRow(self, paths, batch_size):
+        with transaction.atomic():
+            expected = [(total, skipped, self.by_row(errors)) for total, skipped, errors in map(ingest_per_row, paths)]
+            expected_tables = self.tables()
+            transaction.set_rollback(True)
+
+        ingestors = [ingest_file(path, batch_size=batch_size) for path in paths]
+        self.assertEqual([(ingestor.total_rows, ingestor.skipped_rows, self.by_row(ingestor.error_details))
+                          for ingestor in ingestors], expected)
+        self.assertEqual(self.tables(), expected_tables)
+
+    def test_single_file(self):
+        path = self.write_csv("sales.csv", 1500, duplicate_ratio=0.05, invalid_ratio=0.05)
+        self.write_rows("sales.csv", self.read_rows(path) + self.EXTRA_ROWS)
+        self.assertMatchesPerRow([path], batch_size=128)
+
+    def test_overlapping_files(self):
+        # Tệp thứ hai lặp lại một phần tệp đầu (trùng với dữ liệu đã nạp) và thêm đơn của tệp khác
+        first = self.write_csv("first.csv", 800, duplicate_ratio=0.02, invalid_ratio=0.02)
+        other = self.write_csv("other.csv", 400, seed=7, invalid_ratio=0.05)
+        second = self.write_rows("second.csv", self.read_rows(first)[300:600] + self.read_rows(other))
+        self.assertMatchesPerRow([first, second], batch_size=250)
+
+    def test_counts_duplicates_and_invalid_rows(self):
+        path = self.write_rows("sales.csv", self.EXTRA_ROWS)
+        ingestor = ingest_file(path)
+        self.assertEqual((ingestor.total_rows, ingestor.skipped_rows, ingestor.success_count), (6, 3, 3))
+        self.assertEqual(self.by_row(ingestor.error_details), [
+            "Dòng 2: Lỗi không xác định - NOT NULL constraint failed: sales_product.unit_price",
+            "Dòng 4: Chi tiết đơn hàng bị trùng (Order: DH9000002, Product: SET01).",
+            "Dòng 5: Lỗi định dạng ngày (2024-13-01 00:00:00).",
+        ])
+        self.assertEqual(OrderDetail.objects.get(order__order_code="DH9000004").total, 40000)
+
+
+def from_columnar(value):
+    """Giải mã bố cục dạng cột (formats.to_columnar) về dữ liệu như định dạng JSON."""
+    if isinstance(value, dict) and set(value) == {"length", "columns", "dictionaries"}:
+        columns = {}
+        for field, cells in value["columns"].items():
+            dictionary = value["dictionaries"].get(field)
+            columns[field] = ([None if cell is None else dictionary[cell] for cell in cells] if dictionary is not None
+                              else [from_columnar(cell) for cell in cells])
+        return [{field: columns[field][i] for field in columns} for i in range(value["length"])]
+    if isinstance(value, dict):
+        return {key: from_columnar(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [from_columnar(item) for item in value]
+    return value
+
+
+def rounded(value, digits=6):
+    """Làm tròn số thực lồng trong dữ liệu biểu đồ (hai backend cộng số thực theo thứ tự khác nhau)."""
+    if isinstance(value, dict):
+        return {key: rounded(item, digits) for key, item in value.items()}
+    if isinstance(value, list):
+        return [rounded(item, digits) for item in value]
+    if isinstance(value, float):
+        return round(value, digits)
+    return value
+
+
+class ChartFilterTests(TestCase):
+
+    def test_from_params(self):
+        filters = ChartFilter.from_params({"from": "2024-01-01", "to": "2024-03-31",
+                                           "segment": "C11, C12,,C11", "category": ""})
+        self.assertEqual(filters, ChartFilter(date(2024, 1, 1), date(2024, 3, 31), ("C11", "C12"), None, None))
+        self.assertTrue(filters)
+        self.assertTrue(filters.restricts_activity)
+        self.assertFalse(ChartFilter.from_params({}))
+        self.assertFalse(ChartFilter.from_params({"segment": "C11"}).restricts_activity)
+
+    def test_invalid_params(self):
+        for params in ({"from": "2024-13-01"}, {"to": "01/02/2024"}, {"from": "2024-02-01", "to": "2024-01-31"}):
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                ChartFilter.from_params(params)
+
+    def test_without(self):
+        filters = ChartFilter(date(2024, 1, 1), date(2024, 1, 31), ("C11",), ("BOT",), ("BOT01",))
+        self.assertEqual(filters.without("date", "product"), ChartFilter(None, None, ("C11",), ("BOT",), None))
+
+    def test_q_uses_paths_of_source(self):
+        filters = ChartFilter(date(2024, 1, 1), None, ("C11",), ("BOT",), None)
+        self.assertEqual(dict(filters.q("detail").children), {
+            "order__local_date__gte": date(2024, 1, 1),
+            "order__customer__segment__segment_code__in": ("C11",),
+            "product__category__category_code__in": ("BOT",),
+        })
+        # Lịch bán hàng chỉ lọc theo ngày, danh mục mặt hàng không có ngày
+        self.assertEqual(dict(filters.q("calendar").children), {"date__gte": date(2024, 1, 1)})
+        self.assertEqual(dict(filters.q("product").children), {"category__category_code__in": ("BOT",)})
+
+
+class ChartDataMixin:
+    """Dữ liệu giả lập dùng chung cho các test API biểu đồ, cache được xoá trước mỗi test."""
+
+    @classmethod
+    def setUpTestData(cls):
+        with tempfile.TemporaryDirectory(prefix="sales-test-") as directory:
+            path = os.path.join(directory, "sales.csv")
+            write_sales_csv(path, 1500, seed=3, duplicate_ratio=0.02, invalid_ratio=0.02)
+            ingest_file(path)
+
+    def setUp(self):
+        local_cache.clear()
+
+    def get_json(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200, response.content[:200])
+        return json.loads(response.content)
+
+
+class ChartBackendTests(ChartDataMixin, TestCase):
+    """Backend numpy (SalesFrame) phải cho cùng kết quả với backend ORM, có và không có bộ lọc."""
+
+    FILTERS = [
+        "",
+        "from=2024-03-01&to=2024-05-31",
+        "segment=C12,C13",
+        "category=BOT,THO&product=SET01",
+        "from=2024-06-15&segment=C11&category=TTC",
+        "from=2030-01-01",
+    ]
+
+    def test_numpy_matches_orm(self):
+        for params in self.FILTERS:
+            for question in charts.CHARTS:
+                with self.subTest(params=params, question=question):
+                    url = f"/api/chart-data/{question}/?{params}"
+                    self.assertEqual(rounded(self.get_json(f"{url}&backend=numpy")),
+                                     rounded(self.get_json(f"{url}&backend=orm")))
+
+    def test_frame_uses_default_timezone(self):
+        # Frame nạp trong request đang kích hoạt múi giờ khác vẫn theo ngày giờ địa phương của Order
+        with timezone.override("America/New_York"):
+            frame = analytics.SalesFrame.from_database()
+        days, hours = zip(*(((local_date - analytics.EPOCH).days, hour) for local_date, hour
+                            in Order.objects.order_by("id").values_list("local_date", "hour")))
+        self.assertEqual(frame.order_day.tolist(), list(days))
+        self.assertEqual(frame.order_hour.tolist(), list(hours))
+
+    def test_filtered_averages_use_matching_days(self):
+        # Q5 / Q6: mẫu số chỉ đếm các ngày có chi tiết khớp bộ lọc, không phải mọi ngày có đơn hàng
+        details = OrderDetail.objects.filter(order__customer__segment__segment_code="C14",
+                                             product__category__category_code="TTC")
+        for question, field in (("Q5", "day"), ("Q6", "hour")):
+            expected = [
+                {field: key, "avgRevenue": round(total / days, 0)}
+                for key, total, days in details.values_list(f"order__{field}").annotate(
+                    total=Sum("total"), days=Count("order__local_date", distinct=True)
+                ).order_by(f"order__{field}")
+            ]
+            for backend in ("orm", "numpy"):
+                with self.subTest(question=question, backend=backend):
+                    self.assertEqual(self.get_json(f"/api/chart-data/{question}/?segment=C14&category=TTC"
+                                                   f"&backend={backend}"), expected)
+
+    def test_filtered_revenue_matches_details(self):
+        # Q1 đọc bảng tổng hợp: lọc phải khớp với tổng tính thẳng trên chi tiết đơn hàng
+        details = OrderDetail.objects.filter(order__local_date__gte=date(2024, 4, 1),
+                                             order__local_date__lte=date(2024, 9, 30),
+                                             order__customer__segment__segment_code__in=["C11", "C14"])
+        expected = dict(details.values_list("product__product_code").annotate(total=Sum("total")))
+        for backend in ("orm", "numpy"):
+            with self.subTest(backend=backend):
+                data = self.get_json(f"/api/chart-data/Q1/?from=2024-04-01&to=2024-09-30&segment=C11,C14"
+                                     f"&backend={backend}")
+                self.assertEqual({row["code"]: row["total"] for row in data}, expected)
+
+
+class ChartApiTests(ChartDataMixin, TestCase):
+    """ETag / 304, các định dạng trả về và API batch."""
+
+    QUESTIONS = ["Q1", "Q9", "Q12", "Q18", "Q19", "Q20"]
+
+    def test_not_modified(self):
+        response = self.client.get("/api/chart-data/Q1/")
+        self.assertIn("Accept", response["Vary"])
+        etag = response["ETag"]
+        self.assertEqual(self.client.get("/api/chart-data/Q1/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        batch = self.client.get("/api/chart-data/?q=Q1,Q2")
+        not_modified = self.client.get("/api/chart-data/?q=Q1,Q2", HTTP_IF_NONE_MATCH=batch["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_etag_changes(self):
+        etag = self.client.get("/api/chart-data/Q1/")["ETag"]
+        self.assertNotEqual(self.client.get("/api/chart-data/Q1/?segment=C11")["ETag"], etag)
+        self.assertNotEqual(self.client.get("/api/chart-data/Q2/")["ETag"], etag)
+        msgpack_etag = self.client.get("/api/chart-data/Q1/?format=msgpack")["ETag"]
+        self.assertNotEqual(msgpack_etag, etag)
+        self.assertEqual(self.client.get("/api/chart-data/Q1/", HTTP_ACCEPT="application/msgpack")["ETag"],
+                         msgpack_etag)
+
+        # Dữ liệu mới: ETag cũ không còn khớp
+        with tempfile.TemporaryDirectory(prefix="sales-test-") as directory:
+            path = os.path.join(directory, "more.csv")
+            write_sales_csv(path, 50, seed=11)
+            ingest_file(path)
+        response = self.client.get("/api/chart-data/Q1/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_formats_decode_to_json(self):
+        for question in self.QUESTIONS:
+            with self.subTest(question=question):
+                expected = self.get_json(f"/api/chart-data/{question}/")
+                columnar = self.client.get(f"/api/chart-data/{question}/?format=columnar")
+                self.assertEqual(columnar["Content-Type"], formats.CONTENT_TYPES["columnar"])
+                self.assertEqual(from_columnar(json.loads(columnar.content)), expected)
+
+                packed = self.client.get(f"/api/chart-data/{question}/", HTTP_ACCEPT="application/msgpack")
+                self.assertEqual(packed["Content-Type"], formats.CONTENT_TYPES["msgpack"])
+                self.assertEqual(from_columnar(msgpack.unpackb(packed.content)), expected)
+
+    def test_batch_matches_single_charts(self):
+        data = self.get_json("/api/chart-data/?q=Q1,Q9,Q1,Q99,Q19&segment=C12")
+        self.assertEqual(list(data), ["Q1", "Q9", "Q99", "Q19"])
+        self.assertEqual(data["Q99"], [])
+        for question in ("Q1", "Q9", "Q19"):
+            self.assertEqual(data[question], self.get_json(f"/api/chart-data/{question}/?segment=C12"))
+        self.assertEqual(self.client.get("/api/chart-data/").status_code, 400)
+
+        packed = self.client.get("/api/chart-data/?q=Q1,Q9,Q19&segment=C12&format=msgpack")
+        self.assertEqual(from_columnar(msgpack.unpackb(packed.content)),
+                         {question: data[question] for question in ("Q1", "Q9", "Q19")})
+
+    def test_bad_filters(self):
+        self.assertEqual(self.client.get("/api/chart-data/?q=Q1&from=2024-02-30").status_code, 400)
+        response = self.client.get("/api/chart-data/Q1/?from=2024-05-01&to=2024-01-01")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
@@ -6,7 +6,11 @@ from django.conf.urls.static import static
 urlpatterns = [
     path('', views.visualization, name='d3_visualization'),  # Trang upload
     path('upload/', views.upload_csv, name='upload_csv'),  # Add this URL pattern
+    path('upload/status/<int:job_id>/', views.upload_status, name='upload_status'),  # API tiến độ nạp dữ liệu
+    path('api/chart-data/', views.chart_data_batch, name='chart_data_batch'),  # API cho nhiều chart (?q=Q3,Q15,Q17)
     path('api/chart-data/<str:question>/', views.chart_data, name='chart_data'),  # API cho từng chart
+    path('api/async/chart-data/<str:question>/', views.chart_data_async, name='chart_data_async'),  # API async cho từng chart (ASGI)
+    path('api/chart-metrics/', views.chart_metrics, name='chart_metrics'),  # Thống kê thời gian tính các chart (staff)
     # path('schema-viewer/', include('schema_viewer.urls')),
 
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -0,0 +1,91 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from . import charts, formats, payloads
+from .cache import current_version
+from .chart_context import ChartContext
+
+logger = logging.getLogger(__name__)
+
+# Số thread tính biểu đồ song song khi làm nóng cache. Dùng thread (không dùng tiến trình)
+# vì cache kết quả nằm trong tiến trình web; SQLite và numpy nhả GIL khi tính toán.
+WARMUP_WORKERS = getattr(settings, "SALES_WARMUP_WORKERS", 2)
+
+# Các bộ tham số query string được tính sẵn cho mọi biểu đồ ({} = trang dashboard mặc định),
+# ví dụ [{}, {"format": "msgpack"}, {"backend": "numpy"}]
+WARMUP_PARAM_SETS = getattr(settings, "SALES_WARMUP_PARAM_SETS", [{}])
+
+# Tự làm nóng cache sau mỗi job nạp dữ liệu thành công
+WARMUP_AFTER_INGEST = getattr(settings, "SALES_WARMUP_AFTER_INGEST", True)
+
+# Một thread điều phối: lượt làm nóng sau chờ lượt trước xong, không chặn hàng đợi nạp dữ liệu
+_scheduler = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sales-warmup")
+
+
+def chart_groups(questions):
+    """
+    Chia các câu hỏi thành từng nhóm tính chung một lượt: các biểu đồ dùng chung một kết quả
+    trung gian (ChartContext.CONSUMERS) nằm cùng nhóm để kết quả đó chỉ được truy vấn một lần.
+    """
+    remaining = list(questions)
+    groups = []
+    for consumers in ChartContext.CONSUMERS.values():
+        group = [question for question in remaining if question in consumers]
+        if group:
+            groups.append(group)
+            remaining = [question for question in remaining if question not in consumers]
+    return groups + [[question] for question in remaining]
+
+
+def _warm_group(questions, params, version):
+    """Tính và lưu cache cho một nhóm câu hỏi; bỏ qua nếu dữ liệu đã sang thế hệ mới."""
+    close_old_connections()
+    try:
+        if current_version()[0] != version[0]:
+            return questions, None
+        started = time.perf_counter()
+        payloads.chart_payloads(questions, params, version, formats.negotiate(params))
+        return questions, time.perf_counter() - started
+    finally:
+        connection.close()
+
+
+def warm_up(param_sets=None, workers=None):
+    """
+    Tính sẵn mọi biểu đồ đã đăng ký (có cache) với từng bộ tham số và lưu vào cache kết quả.
+    Trả về danh sách (câu hỏi, tham số, số giây) của các nhóm đã tính; nhóm bị bỏ qua vì
+    dữ liệu thay đổi giữa chừng có số giây None.
+    """
+    version = current_version()
+    questions = [name for name, spec in charts.CHARTS.items() if spec.cacheable]
+    param_sets = WARMUP_PARAM_SETS if param_sets is None else param_sets
+
+    results = []
+    with ThreadPoolExecutor(max_workers=workers or WARMUP_WORKERS, thread_name_prefix="sales-warmup-chart") as pool:
+        futures = [
+            (params, pool.submit(_warm_group, group, params, version))
+            for params in param_sets
+            for group in chart_groups(questions)
+        ]
+        for params, future in futures:
+            group, seconds = future.result()
+            results.append((group, params, seconds))
+    return results
+
+
+def _run_scheduled():
+    try:
+        started = time.perf_counter()
+        results = warm_up()
+        logger.info("Chart cache warm-up: %d groups in %.1fs", len(results), time.perf_counter() - started)
+    except Exception:
+        logger.exception("Chart cache warm-up failed")
+
+
+def schedule():
+    """Đưa một lượt làm nóng cache vào thread nền (gọi sau khi dữ liệu mới đã được ghi)."""
+    return _scheduler.submit(_run_scheduled)